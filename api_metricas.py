@@ -0,0 +1,263 @@
+"""
+API HTTP/JSON local de métricas (asyncio da biblioteca padrão, sem Streamlit).
+
+Mantém os dados enriquecidos em memória (recarregados só quando o `cgd.MonitorFontes`
+aceita uma nova versão dos CSVs) e um `utils_filtro.IndiceFiltros`; as respostas ficam num `utils_filtro.CacheLRU`
+pela mesma chave de filtros do dashboard, e consultas iguais simultâneas esperam um
+único cálculo. O laço assíncrono só lê/escreve sockets: as contas rodam em
+`config.API_WORKERS` threads.
+
+Rotas (GET):
+    /saude             versão dos dados e estatísticas do cache
+    /metricas          KPIs de calcular_metricas_gerais
+    /pl_mensal         P&L mensal (calcular_faturamento_por_mes)
+    /metricas_veiculo  RPK, CPK, EBITDA... por placa (metricas_por_dimensao)
+    /anomalias         avisos de qualidade dos dados do recorte
+    /comissoes         comissão de todas as viagens (?viagem=<id ou identificador> para uma)
+
+Filtros (os de `filtrar_dados_completos`): veiculo=... e motorista=... (repetíveis ou
+separados por vírgula), inicio=AAAA-MM-DD, fim=AAAA-MM-DD ou mes=AAAA-MM, incluir_futuras=1.
+
+Uso:
+    python api_metricas.py [--host 127.0.0.1] [--porta 8510]
+    curl "http://127.0.0.1:8510/metricas?veiculo=RRE%201J19&mes=2025-05"
+"""
+import argparse
+import asyncio
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from urllib.parse import parse_qsl, urlsplit
+
+import numpy as np
+import pandas as pd
+
+import config
+import captacao_e_geracao_dados as cgd
+import calculos_e_formulas as calculos
+import utils_filtro as uf
+from relatorio import historico_comissoes, normalizar_cenario, tabela_comissoes
+from utils_validacao import checar_anomalias, EstadoAnomalias
+
+# ============================
+# 1. Serialização
+# ============================
+
+def _registros(df: pd.DataFrame) -> list:
+    """DataFrame → lista de objetos JSON (datas ISO, NaN → null)."""
+    return json.loads(df.to_json(orient="records", date_format="iso", force_ascii=False))
+
+def _json_padrao(obj):
+    if isinstance(obj, pd.DataFrame):
+        return _registros(obj)
+    if isinstance(obj, np.integer):
+        return int(obj)
+    if isinstance(obj, np.floating):
+        return None if np.isnan(obj) else float(obj)
+    if isinstance(obj, (pd.Timestamp, np.datetime64)):
+        return pd.Timestamp(obj).isoformat()
+    return str(obj)
+
+def _corpo(obj) -> bytes:
+    return json.dumps(obj, ensure_ascii=False, default=_json_padrao).encode("utf-8")
+
+class ErroConsulta(ValueError):
+    """Parâmetro inválido na consulta (vira HTTP 400)."""
+
+# ============================
+# 2. Serviço (dados residentes + cache)
+# ============================
+
+def _lista(valores: list) -> list:
+    """Junta parâmetros repetidos e separados por vírgula."""
+    return [v.strip() for valor in valores for v in valor.split(",") if v.strip()]
+
+def filtros_da_consulta(consulta: list) -> tuple:
+    """Pares (nome, valor) da query string → (argumentos de `IndiceFiltros.filtrar`, extras)."""
+    params = {}
+    for nome, valor in consulta:
+        params.setdefault(nome, []).append(valor)
+    cenario = {
+        "veiculos": _lista(params.get("veiculo", []) + params.get("veiculos", [])),
+        "motoristas": _lista(params.get("motorista", []) + params.get("motoristas", [])),
+        "mes": (params.get("mes") or [None])[-1],
+        "inicio": (params.get("inicio") or [None])[-1],
+        "fim": (params.get("fim") or [None])[-1],
+        "incluir_futuras": (params.get("incluir_futuras") or ["0"])[-1].lower() in ("1", "true", "sim"),
+    }
+    try:
+        filtros = normalizar_cenario(cenario)
+    except ValueError as e:
+        raise ErroConsulta(f"período inválido: {e}") from None
+    return filtros, {"viagem": (params.get("viagem") or [None])[-1]}
+
+class ServicoMetricas:
+    """
+    Dados enriquecidos, índice de filtros e cache de respostas compartilhados pelas
+    threads de cálculo. Respostas (bytes JSON) e recortes são somente leitura.
+    """
+
+    def __init__(self, max_entradas: int = None):
+        self.cache = uf.CacheLRU(max_entradas or config.API_CACHE_MAX_ENTRADAS)
+        self._trava = threading.Lock()
+        self.monitor = cgd.MonitorFontes()
+        self._versao = None
+        self.dados = None
+        self.indice = None
+        self.anomalias = None
+
+    def atualizar(self) -> tuple:
+        """Recarrega dados/índice (e esvazia o cache) só quando os CSVs mudaram."""
+        versao = self.monitor.verificar()
+        with self._trava:
+            if versao != self._versao:
+                self.dados = cgd.carregar_dados_enriquecidos()
+                self.indice = uf.IndiceFiltros(self.dados)
+                self.anomalias = None
+                if config.USAR_VALIDACAO_INCREMENTAL:
+                    self.anomalias = EstadoAnomalias().atualizar(self.dados, cgd.linhagem_dados())
+                self.cache.limpar()
+                self._versao = versao
+            return self._versao, self.dados, self.indice, self.anomalias
+
+    def responder(self, rota: str, consulta: list) -> bytes:
+        """Corpo JSON da `rota` para a consulta, calculado uma vez por chave de filtros."""
+        versao, dados, indice, anomalias = self.atualizar()
+        if rota == "/saude":
+            return _corpo({
+                "status": "ok",
+                "versao_fontes": versao,
+                "linhas": {nome: len(df) for nome, df in dados.items()},
+                "cache": self.cache.estatisticas(),
+            })
+
+        filtros, extras = filtros_da_consulta(consulta)
+        agora = pd.Timestamp.now()
+        chave = (versao, indice.assinatura(**filtros, agora=agora))
+        filtrados = self.cache.obter(chave, "dados", lambda: indice.filtrar(dados, agora=agora, **filtros))
+        extras["historico"] = lambda: historico_comissoes(indice, dados, filtros, agora)
+        nome = f"resposta:{rota}:{extras['viagem']}"
+        return self.cache.obter(chave, nome, lambda: _corpo(_ROTAS[rota](filtrados, extras, anomalias)))
+
+def _metricas(filtrados, extras, anomalias):
+    return calculos.MetricasEngine(
+        filtrados["viagens"], filtrados["despesas_viagem"], filtrados["despesas_fixas"]
+    ).calcular()
+
+def _pl_mensal(filtrados, extras, anomalias):
+    return calculos.calcular_faturamento_por_mes(
+        filtrados["viagens"], filtrados["despesas_viagem"], filtrados["despesas_fixas"])
+
+def _metricas_veiculo(filtrados, extras, anomalias):
+    return calculos.metricas_por_dimensao(filtrados, "veiculo")
+
+def _anomalias(filtrados, extras, anomalias):
+    # mesmo caminho do dashboard: validação incremental da base completa cruzada com o recorte
+    return anomalias.relatorio(filtrados) if anomalias is not None else checar_anomalias(filtrados)
+
+def _comissoes(filtrados, extras, anomalias):
+    # referências pelo histórico da placa sem o corte de período (ver relatorio.historico_comissoes)
+    viagens = filtrados["viagens"]
+    comissoes = tabela_comissoes(viagens, extras["historico"]())
+    if extras["viagem"] is None:
+        return comissoes
+    alvo = (viagens["id"].astype(str) == extras["viagem"]) | (viagens["identificador"] == extras["viagem"])
+    return comissoes[alvo.to_numpy()]
+
+_ROTAS = {
+    "/saude": None,
+    "/metricas": _metricas,
+    "/pl_mensal": _pl_mensal,
+    "/metricas_veiculo": _metricas_veiculo,
+    "/anomalias": _anomalias,
+    "/comissoes": _comissoes,
+}
+
+# ============================
+# 3. Servidor HTTP assíncrono
+# ============================
+
+class ServidorMetricas:
+    """HTTP/1.1 mínimo sobre asyncio: GET, uma resposta por conexão."""
+
+    def __init__(self, servico: ServicoMetricas = None, workers: int = None):
+        self.servico = servico or ServicoMetricas()
+        self._executor = ThreadPoolExecutor(max_workers=workers or config.API_WORKERS)
+        self._em_andamento = {}
+
+    async def _resposta(self, rota: str, consulta: list) -> bytes:
+        """Consultas idênticas simultâneas aguardam o mesmo cálculo."""
+        chave = (rota, tuple(sorted(consulta)))
+        tarefa = self._em_andamento.get(chave)
+        if tarefa is None:
+            loop = asyncio.get_running_loop()
+            tarefa = loop.run_in_executor(self._executor, self.servico.responder, rota, consulta)
+            self._em_andamento[chave] = tarefa
+            tarefa.add_done_callback(lambda _: self._em_andamento.pop(chave, None))
+        return await asyncio.shield(tarefa)
+
+    async def tratar(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            linha = await reader.readline()
+            while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                pass  # cabeçalhos ignorados
+            try:
+                metodo, alvo, _ = linha.decode("latin-1").split(" ", 2)
+            except ValueError:
+                return await self._enviar(writer, HTTPStatus.BAD_REQUEST, _corpo({"erro": "requisição inválida"}))
+            if metodo != "GET":
+                return await self._enviar(writer, HTTPStatus.METHOD_NOT_ALLOWED, _corpo({"erro": "use GET"}))
+
+            url = urlsplit(alvo)
+            rota = url.path.rstrip("/") or "/saude"
+            if rota not in _ROTAS:
+                return await self._enviar(
+                    writer, HTTPStatus.NOT_FOUND, _corpo({"erro": f"rota desconhecida: {rota}", "rotas": list(_ROTAS)}))
+            try:
+                corpo = await self._resposta(rota, parse_qsl(url.query))
+            except ErroConsulta as e:
+                await self._enviar(writer, HTTPStatus.BAD_REQUEST, _corpo({"erro": str(e)}))
+            else:
+                await self._enviar(writer, HTTPStatus.OK, corpo)
+        except Exception as e:  # uma consulta com erro não derruba o serviço
+            await self._enviar(writer, HTTPStatus.INTERNAL_SERVER_ERROR, _corpo({"erro": repr(e)}))
+        finally:
+            writer.close()
+
+    async def _enviar(self, writer: asyncio.StreamWriter, status: HTTPStatus, corpo: bytes) -> None:
+        cabecalho = (
+            f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+            "Content-Type: application/json; charset=utf-8\r\n"
+            f"Content-Length: {len(corpo)}\r\n"
+            "Connection: close\r\n\r\n"
+        ).encode("latin-1")
+        writer.write(cabecalho + corpo)
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+
+    async def servir(self, host: str = None, porta: int = None) -> None:
+        """Carrega os dados e atende até ser interrompido."""
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._executor, self.servico.atualizar)
+        servidor = await asyncio.start_server(self.tratar, host or config.API_HOST, porta or config.API_PORTA)
+        enderecos = ", ".join(str(s.getsockname()) for s in servidor.sockets)
+        print(f"API de métricas em {enderecos}")
+        async with servidor:
+            await servidor.serve_forever()
+
+def main():
+    parser = argparse.ArgumentParser(description="API HTTP/JSON local de métricas da frota.")
+    parser.add_argument("--host", default=config.API_HOST)
+    parser.add_argument("--porta", type=int, default=config.API_PORTA)
+    parser.add_argument("--workers", type=int, default=config.API_WORKERS)
+    args = parser.parse_args()
+    try:
+        asyncio.run(ServidorMetricas(workers=args.workers).servir(args.host, args.porta))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
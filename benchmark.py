@@ -0,0 +1,415 @@
+"""
+Benchmark do pipeline com dados sintéticos de frota.
+
+1. Gera CSVs com o mesmo schema dos `reinan_costa_*_db.csv` na escala pedida
+   (veículos, motoristas, despesas de viagem e fixas).
+2. Aponta o `config` para esses arquivos e cronometra as etapas do dashboard:
+   carregar_dados_brutos, enriquecer_dados, filtros, calcular_metricas_gerais,
+   checar_anomalias, calcular_comissao e a simulação de cenários de comissão.
+3. Grava um relatório JSON (com o commit atual) para comparar execuções.
+
+Uso:
+    python benchmark.py --veiculos 500 --despesas-viagem 1000000 --saida bench.json
+    python benchmark.py --veiculos 500 --despesas-viagem 1000000 --comparar bench.json
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+import config
+import captacao_e_geracao_dados as cgd
+import calculos_e_formulas as calculos
+import utils_filtro as uf
+from simulacao_comissao import grade_cenarios, simular_cenarios
+from utils_comissao import calcular_comissao, calcular_comissao_lote
+from utils_validacao import checar_anomalias
+
+# Arquivos do config redirecionados para a pasta de dados sintéticos
+_ARQUIVOS_CONFIG = [
+    "DESPESAS_VIAGEM_FILE",
+    "DESPESAS_FIXAS_FILE",
+    "MOTORISTA_FILE",
+    "VEICULO_FILE",
+    "VIAGEM_COMPLETA_FILE",
+]
+
+# Distribuições aproximadas das categorias dos CSVs reais
+CATEGORIAS_DESPESA_VIAGEM = {
+    "COMBUSTIVEL": 30, "ARLA": 23, "DIVERSOS": 14, "MANUTENCAO": 6, "COMISSAO": 6,
+    "GORJETA": 6, "DIARIA": 5, "LAVAGEM": 4, "ESTACIONAMENTO": 3, "BORRACHARIA": 2,
+    "PEDAGIO": 1,
+}
+CATEGORIAS_DESPESA_FIXA = {
+    "SEGURO": 18, "SALARIO MOTORISTA": 17, "ADMINISTRADOR": 16, "SASCAR RASTREAMENTO": 13,
+    "DIVERSOS": 10, "PEDAGIO": 9, "MANUTENCAO": 5, "PLANO MANUTENCAO": 4, "BORRACHARIA": 3,
+    "MECANICO": 2, "PNEU": 1, "DETRAN": 1, "PRESTACAO": 1,
+}
+
+COLUNAS_DESPESA_VIAGEM = [
+    "id", "descricao", "data", "valor", "categoria", "pago_por", "km_abastecimento",
+    "lts_combustivel", "preco_combustivel", "viagem_id", "veiculo_id",
+]
+COLUNAS_VIAGEM = [
+    "id", "identificador", "credito_motorista", "frete_ida", "frete_volta", "frete_extra",
+    "destinos_ida", "destinos_volta", "destinos_extra", "data_ida", "data_volta", "status",
+    "transportador_ida", "transportador_volta", "veiculo_id", "motorista_id", "lucro_bruto",
+    "gasto_motorista", "gasto_empresa", "total_despesas_viagem", "troco_da_viagem",
+    "destinos_ida_origem_standard", "destinos_ida_destino_standard",
+    "destinos_volta_origem_standard", "destinos_volta_destino_standard", "media_e_km_id",
+    "km_inicial", "km_total", "lts_combustivel", "preco_combustivel", "km_final", "media",
+]
+
+# ============================
+# 1. Geração de dados sintéticos
+# ============================
+
+def _ids(prefixo: str, n: int, inicio: int = 0) -> np.ndarray:
+    """Ids de 32 caracteres no formato dos CSVs (prefixo + sequencial)."""
+    seq = np.arange(inicio, inicio + n).astype(str)
+    return np.char.add(prefixo, np.char.zfill(seq, 32 - len(prefixo)))
+
+def _sortear(rng, distribuicao: dict, n: int) -> np.ndarray:
+    nomes = np.array(list(distribuicao))
+    pesos = np.array(list(distribuicao.values()), dtype=float)
+    return nomes[rng.choice(len(nomes), size=n, p=pesos / pesos.sum())]
+
+def _datas_str(datas: np.ndarray) -> np.ndarray:
+    return np.datetime_as_string(datas.astype("datetime64[D]"), unit="D")
+
+def gerar_dados_sinteticos(
+    destino: str,
+    n_veiculos: int = 50,
+    n_despesas_viagem: int = 10_000,
+    n_motoristas: int = None,
+    n_despesas_fixas: int = None,
+    meses: int = 24,
+    despesas_por_viagem: int = 21,
+    semente: int = 0,
+    tamanho_lote: int = 1_000_000,
+) -> dict:
+    """
+    Grava em `destino` os cinco CSVs lidos por `carregar_dados_brutos`, com os
+    nomes de arquivo do `config`. As despesas de viagem são geradas e gravadas em
+    lotes de `tamanho_lote` linhas para caber em memória na escala de milhões.
+    Retorna a quantidade de linhas de cada tabela.
+    """
+    rng = np.random.default_rng(semente)
+    os.makedirs(destino, exist_ok=True)
+    arquivo = lambda attr: os.path.join(destino, os.path.basename(getattr(config, attr)))
+
+    n_motoristas = n_motoristas or 2 * n_veiculos
+    n_despesas_fixas = n_despesas_fixas or 4 * n_veiculos * meses
+    n_viagens = max(1, n_despesas_viagem // despesas_por_viagem)
+    dias = max(1, meses * 30)
+    inicio = np.datetime64("2024-01-01") - np.timedelta64(dias // 2, "D")
+
+    # ── Cadastros ──
+    ids_veiculo = _ids("ve", n_veiculos)
+    placas = np.char.add("SIM ", np.char.zfill(np.arange(n_veiculos).astype(str), 4))
+    pd.DataFrame({"id": ids_veiculo, "placa": placas}).to_csv(arquivo("VEICULO_FILE"), index=False)
+
+    ids_motorista = _ids("mo", n_motoristas)
+    nomes = np.char.add("Motorista ", np.arange(n_motoristas).astype(str))
+    pd.DataFrame({"id": ids_motorista, "nome": nomes, "apelido": nomes}).to_csv(
+        arquivo("MOTORISTA_FILE"), index=False)
+
+    # ── Viagens (totais de despesa preenchidos depois das despesas) ──
+    veiculo = rng.integers(0, n_veiculos, n_viagens)
+    ida = inicio + rng.integers(0, dias, n_viagens).astype("timedelta64[D]")
+    duracao = rng.integers(3, 21, n_viagens)
+    volta = ida + duracao.astype("timedelta64[D]")
+    km_total = rng.integers(1500, 14000, n_viagens)
+    media = np.round(rng.uniform(2.0, 3.3, n_viagens), 2)
+    km_inicial = rng.integers(0, 500_000, n_viagens)
+
+    # ── Despesas de viagem, em lotes ──
+    ids_viagem = _ids("vi", n_viagens)
+    gasto_motorista = np.zeros(n_viagens)
+    gasto_empresa = np.zeros(n_viagens)
+    gravadas = 0
+    with open(arquivo("DESPESAS_VIAGEM_FILE"), "w", newline="") as f:
+        while gravadas < n_despesas_viagem:
+            n = min(tamanho_lote, n_despesas_viagem - gravadas)
+            viagem = rng.integers(0, n_viagens, n)
+            categoria = _sortear(rng, CATEGORIAS_DESPESA_VIAGEM, n)
+            combustivel = categoria == "COMBUSTIVEL"
+            lts = np.where(combustivel, np.round(rng.uniform(200, 600, n), 2), np.nan)
+            preco = np.where(combustivel, np.round(rng.uniform(5.4, 6.3, n), 2), np.nan)
+            valor = np.where(combustivel, np.round(lts * preco, 2),
+                             np.round(rng.lognormal(4.8, 0.9, n), 2))
+            motorista_pagou = rng.random(n) < 0.7
+            gasto_motorista += np.bincount(viagem, weights=valor * motorista_pagou, minlength=n_viagens)
+            gasto_empresa += np.bincount(viagem, weights=valor * ~motorista_pagou, minlength=n_viagens)
+            data = ida[viagem] + (rng.random(n) * (duracao[viagem] + 1)).astype("timedelta64[D]")
+
+            pd.DataFrame({
+                "id": _ids("dv", n, gravadas),
+                "descricao": np.where(combustivel, "POSTO SINTETICO", "DESPESA SINTETICA"),
+                "data": _datas_str(data),
+                "valor": valor,
+                "categoria": categoria,
+                "pago_por": np.where(motorista_pagou, "MOTORISTA", "EMPRESA"),
+                "km_abastecimento": np.nan,
+                "lts_combustivel": lts,
+                "preco_combustivel": preco,
+                "viagem_id": ids_viagem[viagem],
+                "veiculo_id": ids_veiculo[veiculo[viagem]],
+            }, columns=COLUNAS_DESPESA_VIAGEM).to_csv(f, index=False, header=gravadas == 0)
+            gravadas += n
+
+    frete_ida = np.round(rng.uniform(4000, 14000, n_viagens), 2)
+    frete_volta = np.where(rng.random(n_viagens) < 0.5, np.round(rng.uniform(3500, 26000, n_viagens), 2), np.nan)
+    frete_extra = np.where(rng.random(n_viagens) < 0.2, np.round(rng.uniform(2000, 60000, n_viagens), 2), np.nan)
+    total_despesas = np.round(gasto_motorista + gasto_empresa, 2)
+    lucro_bruto = np.round(
+        np.nan_to_num(frete_ida) + np.nan_to_num(frete_volta) + np.nan_to_num(frete_extra) - total_despesas, 2)
+    credito = np.round(gasto_motorista + rng.uniform(0, 3000, n_viagens), 2)
+    lts_viagem = np.round(km_total / media, 2)
+    data_ida_str = _datas_str(ida)
+    identificador = np.char.add(
+        np.char.add(np.char.add(data_ida_str, " "), placas[veiculo]),
+        np.char.add(" NV ", np.arange(n_viagens).astype(str)),
+    )
+
+    pd.DataFrame({
+        "id": ids_viagem,
+        "identificador": identificador,
+        "credito_motorista": credito,
+        "frete_ida": frete_ida,
+        "frete_volta": frete_volta,
+        "frete_extra": frete_extra,
+        "destinos_ida": "FORTALEZA",
+        "destinos_volta": "ARAPIRACA",
+        "destinos_extra": np.nan,
+        "data_ida": data_ida_str,
+        "data_volta": _datas_str(volta),
+        "status": np.where(rng.random(n_viagens) < 0.97, "FIM DE VIAGEM", "EM VIAGEM"),
+        "transportador_ida": "TRANSPORTADORA SINTETICA",
+        "transportador_volta": np.nan,
+        "veiculo_id": ids_veiculo[veiculo],
+        "motorista_id": ids_motorista[rng.integers(0, n_motoristas, n_viagens)],
+        "lucro_bruto": lucro_bruto,
+        "gasto_motorista": np.round(gasto_motorista, 2),
+        "gasto_empresa": np.round(gasto_empresa, 2),
+        "total_despesas_viagem": total_despesas,
+        "troco_da_viagem": np.round(credito - gasto_motorista, 2),
+        "destinos_ida_origem_standard": "Fortaleza - CE - Brasil",
+        "destinos_ida_destino_standard": np.nan,
+        "destinos_volta_origem_standard": np.nan,
+        "destinos_volta_destino_standard": np.nan,
+        "media_e_km_id": _ids("mk", n_viagens),
+        "km_inicial": km_inicial,
+        "km_total": km_total,
+        "lts_combustivel": lts_viagem,
+        "preco_combustivel": np.round(rng.uniform(5.4, 6.3, n_viagens), 2),
+        "km_final": (km_inicial + km_total).astype(float),
+        "media": media,
+    }, columns=COLUNAS_VIAGEM).to_csv(arquivo("VIAGEM_COMPLETA_FILE"), index=False)
+
+    # ── Despesas fixas ──
+    data_fixa = inicio + rng.integers(0, dias, n_despesas_fixas).astype("timedelta64[D]")
+    pd.DataFrame({
+        "id": _ids("df", n_despesas_fixas),
+        "descricao": "DESPESA FIXA SINTETICA",
+        "data": _datas_str(data_fixa),
+        "valor": np.round(rng.uniform(100, 6000, n_despesas_fixas), 2),
+        "categoria": _sortear(rng, CATEGORIAS_DESPESA_FIXA, n_despesas_fixas),
+        "veiculo_id": ids_veiculo[rng.integers(0, n_veiculos, n_despesas_fixas)],
+    }).to_csv(arquivo("DESPESAS_FIXAS_FILE"), index=False)
+
+    return {
+        "veiculos": n_veiculos,
+        "motoristas": n_motoristas,
+        "viagens": n_viagens,
+        "despesas_viagem": n_despesas_viagem,
+        "despesas_fixas": n_despesas_fixas,
+    }
+
+# ============================
+# 2. Benchmarks
+# ============================
+
+def apontar_config(diretorio: str) -> None:
+    """Redireciona os CSVs, o cache colunar, o log de perfil e o banco SQLite do `config` para `diretorio`."""
+    for attr in _ARQUIVOS_CONFIG:
+        setattr(config, attr, os.path.join(diretorio, os.path.basename(getattr(config, attr))))
+    config.CACHE_COLUNAR_DIR = os.path.join(diretorio, ".cache_dados")
+    # derivados de CACHE_COLUNAR_DIR na importação do config: recalculados para a nova pasta
+    for attr in ("PERFIL_ARQUIVO_LOG", "SQLITE_ARQUIVO"):
+        setattr(config, attr, os.path.join(config.CACHE_COLUNAR_DIR, os.path.basename(getattr(config, attr))))
+
+def _cronometrar(funcao, repeticoes: int):
+    """Executa `funcao` `repeticoes` vezes; retorna (último resultado, estatísticas em segundos)."""
+    tempos = []
+    resultado = None
+    for _ in range(repeticoes):
+        t0 = time.perf_counter()
+        resultado = funcao()
+        tempos.append(time.perf_counter() - t0)
+    return resultado, {
+        "min_s": min(tempos),
+        "mediana_s": statistics.median(tempos),
+        "repeticoes": repeticoes,
+    }
+
+def _commit_atual():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def executar_benchmarks(repeticoes: int = 3, amostra_comissao: int = 200) -> dict:
+    """
+    Cronometra as etapas do pipeline sobre os CSVs apontados pelo `config`.
+    Os filtros são medidos por `utils_filtro.IndiceFiltros` (o que
+    `dashboard.filtrar_dados_completos` executa, sem os widgets do Streamlit).
+    """
+    resultados = {}
+
+    # 1. Carregamento (CSV direto e via cache colunar já aquecido)
+    usar_cache = config.USAR_CACHE_COLUNAR
+    config.USAR_CACHE_COLUNAR = False
+    brutos, resultados["carregar_dados_brutos (csv)"] = _cronometrar(cgd.carregar_dados_brutos, repeticoes)
+    config.USAR_CACHE_COLUNAR = True
+    cgd.carregar_dados_brutos()
+    _, resultados["carregar_dados_brutos (cache colunar)"] = _cronometrar(cgd.carregar_dados_brutos, repeticoes)
+    config.USAR_CACHE_COLUNAR = usar_cache
+
+    # 2. Enriquecimento (completo e via snapshot persistido já aquecido)
+    dados, resultados["enriquecer_dados"] = _cronometrar(lambda: cgd.enriquecer_dados(*brutos), repeticoes)
+    usar_snapshot = config.USAR_SNAPSHOT_ENRIQUECIDO
+    config.USAR_SNAPSHOT_ENRIQUECIDO = True
+    cgd.carregar_dados_enriquecidos()
+    _, resultados["carregar_dados_enriquecidos (snapshot)"] = _cronometrar(
+        cgd.carregar_dados_enriquecidos, repeticoes)
+    config.USAR_SNAPSHOT_ENRIQUECIDO = usar_snapshot
+
+    # 3. Filtros (índice + cenários típicos da sidebar)
+    indice, resultados["indice_filtros (construcao)"] = _cronometrar(lambda: uf.IndiceFiltros(dados), repeticoes)
+    fim = indice.data_max
+    cenarios = {
+        "sem filtro": {},
+        "1 veiculo": {"veiculos": list(indice.veiculos[:1])},
+        "ultimos 30 dias": {"periodo": [fim - pd.Timedelta(days=30), fim]},
+    }
+    for nome, filtros in cenarios.items():
+        _, resultados[f"filtrar_dados_completos ({nome})"] = _cronometrar(
+            lambda: indice.filtrar(dados, incluir_futuras=False, **filtros), repeticoes)
+
+    # 4. Métricas e anomalias
+    _, resultados["calcular_metricas_gerais"] = _cronometrar(
+        lambda: calculos.MetricasEngine(
+            dados["viagens"], dados["despesas_viagem"], dados["despesas_fixas"]
+        ).calcular(),
+        repeticoes,
+    )
+    _, resultados["checar_anomalias"] = _cronometrar(lambda: checar_anomalias(dados), repeticoes)
+
+    # 5. Comissão: lote sobre todas as viagens; por linha só numa amostra
+    viagens = dados["viagens"]
+    _, resultados["calcular_comissao_lote (todas as viagens)"] = _cronometrar(
+        lambda: calcular_comissao_lote(viagens), repeticoes)
+    amostra = viagens.head(amostra_comissao)
+    _, stats = _cronometrar(
+        lambda: [calcular_comissao(row, viagens) for _, row in amostra.iterrows()], 1)
+    stats["viagens"] = len(amostra)
+    stats["por_viagem_s"] = stats["min_s"] / max(len(amostra), 1)
+    stats["estimativa_todas_s"] = stats["por_viagem_s"] * len(viagens)
+    resultados["calcular_comissao (por viagem, amostra)"] = stats
+    grade = grade_cenarios({"PESO_CONSUMO": [0.5, 0.6, 0.7, 0.8], "COMISSAO_MAXIMA": [400, 500, 600, 700, 800],
+                            "DIAS_OCIOSIDADE_NORMAL": [2, 4, 6, 8, 10]})
+    _, resultados[f"simular_cenarios ({len(grade)} cenarios)"] = _cronometrar(
+        lambda: simular_cenarios(viagens, grade), repeticoes)
+
+    return resultados
+
+def comparar_relatorios(atual: dict, anterior: dict) -> list:
+    """Linhas "etapa: anterior → atual (razão)" para as etapas presentes nos dois relatórios."""
+    linhas = []
+    for etapa, stats in atual["resultados"].items():
+        antes = anterior.get("resultados", {}).get(etapa)
+        if antes is None:
+            continue
+        razao = stats["min_s"] / antes["min_s"] if antes["min_s"] else float("nan")
+        linhas.append(f"{etapa}: {antes['min_s']:.4f}s → {stats['min_s']:.4f}s ({razao:.2f}x)")
+    return linhas
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark do pipeline com dados sintéticos de frota.")
+    parser.add_argument("--veiculos", type=int, default=50)
+    parser.add_argument("--motoristas", type=int, default=None, help="padrão: 2 por veículo")
+    parser.add_argument("--despesas-viagem", type=int, default=10_000)
+    parser.add_argument("--despesas-fixas", type=int, default=None, help="padrão: 4 por veículo/mês")
+    parser.add_argument("--meses", type=int, default=24)
+    parser.add_argument("--semente", type=int, default=0)
+    parser.add_argument("--repeticoes", type=int, default=3)
+    parser.add_argument("--amostra-comissao", type=int, default=200)
+    parser.add_argument("--dir", default=None, help="pasta dos CSVs (padrão: temporária, apagada no fim)")
+    parser.add_argument("--apenas-gerar", action="store_true", help="só gera os CSVs em --dir (obrigatório)")
+    parser.add_argument("--saida", default="benchmark.json")
+    parser.add_argument("--comparar", default=None, help="relatório JSON anterior para comparação")
+    args = parser.parse_args()
+    if args.apenas_gerar and args.dir is None:
+        parser.error("--apenas-gerar requer --dir (a pasta temporária seria apagada no fim)")
+
+    diretorio = args.dir or tempfile.mkdtemp(prefix="benchmark_frota_")
+    try:
+        t0 = time.perf_counter()
+        tamanhos = gerar_dados_sinteticos(
+            diretorio,
+            n_veiculos=args.veiculos,
+            n_despesas_viagem=args.despesas_viagem,
+            n_motoristas=args.motoristas,
+            n_despesas_fixas=args.despesas_fixas,
+            meses=args.meses,
+            semente=args.semente,
+        )
+        print(f"Dados gerados em {diretorio} ({time.perf_counter() - t0:.1f}s): {tamanhos}")
+        if args.apenas_gerar:
+            return
+
+        apontar_config(diretorio)
+        resultados = executar_benchmarks(args.repeticoes, args.amostra_comissao)
+    finally:
+        if args.dir is None:
+            shutil.rmtree(diretorio, ignore_errors=True)
+
+    relatorio = {
+        "gerado_em": datetime.now().isoformat(timespec="seconds"),
+        "commit": _commit_atual(),
+        "ambiente": {
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "numpy": np.__version__,
+            "formato_cache": cgd._FORMATO_CACHE,
+        },
+        "parametros": vars(args),
+        "tamanhos": tamanhos,
+        "resultados": resultados,
+    }
+    with open(args.saida, "w", encoding="utf-8") as f:
+        json.dump(relatorio, f, ensure_ascii=False, indent=2)
+
+    for etapa, stats in resultados.items():
+        print(f"{etapa:<45} {stats['min_s']:.4f}s")
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            print("\n".join(["", f"Comparação com {args.comparar}:"] + comparar_relatorios(relatorio, json.load(f))))
+    print(f"Relatório: {args.saida}")
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,4 @@
+import numpy as np
 import pandas as pd
 import config
 
@@ -178,50 +179,87 @@ def calcular_ebitda(lucro_liquido, df_desp_fixa):
     
     return lucro_liquido + impostos
 
-def calcular_faturamento_por_mes(df_viagens, df_desp_viagem, df_desp_fixa):
-    # cópias seguras
-    df_v  = df_viagens.copy()
-    df_dv = df_desp_viagem.copy()
-    df_df = df_desp_fixa.copy()
-
-    df_v["data_ida"] = pd.to_datetime(df_v["data_ida"], errors="coerce")
-    df_dv["data"]    = pd.to_datetime(df_dv["data"], errors="coerce")
-    df_df["data"]    = pd.to_datetime(df_df["data"], errors="coerce")
-
-    # RECEITA BRUTA por mês
-    receita_bruta = (
-        df_v.groupby(pd.Grouper(key="data_ida", freq="M"))
-            .apply(lambda g: calcular_receita_bruta(g))
-            .rename("receita_bruta")
-            .reset_index()
-            .rename(columns={"data_ida": "data"})   # ← padroniza
-    )
+def _fim_do_mes(serie: pd.Series) -> pd.Series:
+    """Último dia do mês de cada data (mesmo rótulo do pd.Grouper(freq="M")); NaT continua NaT."""
+    datas = pd.to_datetime(serie, errors="coerce").to_numpy("datetime64[ns]")
+    fim = (datas.astype("datetime64[M]") + 1).astype("datetime64[ns]") - np.timedelta64(1, "D")
+    return pd.Series(fim, index=serie.index, name="data")
 
-    # DESPESA VARIÁVEL por mês
-    despesa_var = calcular_custo_variavel_por_mes(df_dv)      # já vem com col. 'data'
+def _somar_por_mes(df, col_data, valores, chaves, nome):
+    """
+    Soma nativa de `valores` por mês de `col_data` (+ `chaves`). Sem chaves, os meses
+    vazios entre o primeiro e o último entram com 0, como no pd.Grouper.
+    """
+    grupos = [_fim_do_mes(df[col_data])] + [df[c] for c in chaves]
+    soma = pd.Series(valores, index=df.index).groupby(grupos, observed=True).sum()
+    if not chaves:
+        soma = _completar_meses(soma)
+    return soma.rename(nome)
+
+def _completar_meses(soma):
+    """Série indexada por fim de mês → todos os meses entre o primeiro e o último (vazios = 0)."""
+    if not len(soma):
+        return soma
+    meses = pd.date_range(soma.index.min(), soma.index.max(), freq="M", name="data")
+    return soma.reindex(meses, fill_value=0)
+
+def _montar_pl(partes, chaves):
+    """Junta as somas mensais (receita_bruta, despesa_var, despesa_fixa) no formato de calcular_pl_mensal."""
+    colunas = ["receita_bruta", "despesa_var", "despesa_fixa"]
+    partes = [p for p in partes if len(p)]
+
+    if partes:
+        pl = pd.concat(partes, axis=1).reindex(columns=colunas).fillna(0).sort_index()
+        pl.index.names = ["data"] + chaves
+        pl = pl.reset_index()
+    else:
+        pl = pd.DataFrame({c: pd.Series(dtype=float) for c in ["data"] + chaves + colunas})
+        pl["data"] = pl["data"].astype("datetime64[ns]")
+
+    pl["lucro_bruto"]   = pl["receita_bruta"] - pl["despesa_var"]
+    pl["lucro_liquido"] = pl["lucro_bruto"]  - pl["despesa_fixa"]
+    return pl
+
+def calcular_pl_mensal(df_viagens, df_desp_viagem, df_desp_fixa, chaves=None,
+                       col_data_despesa_viagem="data"):
+    """
+    P&L mensal vetorizado: receita bruta (fretes), despesa variável e despesa fixa
+    somadas por mês (fim do mês, coluna `data`) e, opcionalmente, por `chaves`
+    extras presentes nas três tabelas (ex.: ["veiculo"]).
 
-    # DESPESA FIXA por mês
-    despesa_fixa = (
-        df_df.groupby(pd.Grouper(key="data", freq="M"))["valor"]
-             .sum()
-             .rename("despesa_fixa")
-             .reset_index()                                  # col. 'data'
-    )
+    `col_data_despesa_viagem` escolhe a data das despesas de viagem
+    ("data" = data do lançamento, "data_viagem" = data de ida da viagem).
 
-    # MERGE final
-    df_merge = (
-        receita_bruta
-        .merge(despesa_var,  on="data", how="outer")
-        .merge(despesa_fixa, on="data", how="outer")
-        .fillna(0)
-        .sort_values("data")
-        .reset_index(drop=True)
+    Retorna: data, *chaves, receita_bruta, despesa_var, despesa_fixa,
+    lucro_bruto, lucro_liquido — ordenado por data e chaves.
+    """
+    chaves = list(chaves or [])
+    receita = (
+        df_viagens["frete_ida"].fillna(0)
+        + df_viagens["frete_volta"].fillna(0)
+        + df_viagens["frete_extra"].fillna(0)
     )
+    partes = [
+        _somar_por_mes(df_viagens, "data_ida", receita, chaves, "receita_bruta"),
+        _somar_por_mes(df_desp_viagem, col_data_despesa_viagem, df_desp_viagem["valor"], chaves, "despesa_var"),
+        _somar_por_mes(df_desp_fixa, "data", df_desp_fixa["valor"], chaves, "despesa_fixa"),
+    ]
+    return _montar_pl(partes, chaves)
 
-    df_merge["lucro_bruto"]   = df_merge["receita_bruta"] - df_merge["despesa_var"]
-    df_merge["lucro_liquido"] = df_merge["lucro_bruto"]  - df_merge["despesa_fixa"]
+def pl_mensal_de_somas(receita_bruta, despesa_var, despesa_fixa):
+    """
+    P&L mensal (formato de calcular_faturamento_por_mes) a partir de somas já feitas
+    por fim de mês, ex.: no banco (utils_sqlite). Cada argumento: Série indexada por data.
+    """
+    partes = [
+        _completar_meses(soma).rename(nome)
+        for soma, nome in ((receita_bruta, "receita_bruta"), (despesa_var, "despesa_var"), (despesa_fixa, "despesa_fixa"))
+    ]
+    return _montar_pl(partes, [])
 
-    return df_merge
+def calcular_faturamento_por_mes(df_viagens, df_desp_viagem, df_desp_fixa):
+    """Receita, despesas e lucros por mês da frota inteira (ver calcular_pl_mensal)."""
+    return calcular_pl_mensal(df_viagens, df_desp_viagem, df_desp_fixa)
 
 def calcular_custo_variavel_por_mes(df_desp_viagem: pd.DataFrame) -> pd.DataFrame:
     """
@@ -301,7 +339,7 @@ def calcular_idle_medio(df_viagens: pd.DataFrame) -> float:
     # diferença entre ida atual e volta anterior no mesmo caminhão
     v["idle"] = (
         v["data_ida"] -
-        v.groupby("veiculo")["data_volta"].shift()
+        v.groupby("veiculo", observed=True)["data_volta"].shift()
     ).dt.days.clip(lower=0)           # dias negativos viram 0
 
     return round(v["idle"].mean(), 1)
@@ -313,10 +351,317 @@ def idle_medio_por_veiculo(df_viagens: pd.DataFrame) -> dict:
     idle_dict = {}
     for placa, grp in (
         df_viagens.sort_values(["veiculo", "data_ida"])
-                  .groupby("veiculo")
+                  .groupby("veiculo", observed=True)
     ):
         diff = (
             grp["data_ida"] - grp["data_volta"].shift()
         ).dt.days.clip(lower=0)
         idle_dict[placa] = round(diff.mean(), 1) if not diff.empty else 0.0
-    return idle_dict
\ No newline at end of file
+    return idle_dict
+
+# ============================
+# 4.1 Motor de Métricas (categorias classificadas uma única vez)
+# ============================
+
+# Baldes de categoria usados pelos KPIs; cada regra reproduz o filtro da função original
+_BALDES_DESPESA_VIAGEM = {
+    "combustivel":     lambda c: c.str.contains(config.CATEGORIA_COMBUSTIVEL, case=False, na=False),  # calcular_custo_combustivel_por_km
+    "pneu":            lambda c: c.str.contains(config.CATEGORIA_PNEU, case=False, na=False),         # calcular_custo_pneus_por_km
+    "manutencao":      lambda c: c.str.upper().isin(config.CATEGORIAS_MANUTENCAO_VIAGEM_UPPER),      # custo_manut
+    "manutencao_freq": lambda c: c.str.lower().isin(config.CATEGORIAS_MANUTENCAO_VIAGEM),            # calcular_frequencia_manutencao
+}
+_BALDES_DESPESA_FIXA = {
+    "imposto":         lambda c: c.str.upper().isin(config.CATEGORIAS_IMPOSTO),                       # despesa_livre_impostos
+    "capex":           lambda c: c.str.upper().eq(config.CATEGORIA_CAPEX),                            # capex
+    "prestacao":       lambda c: c.eq(config.CATEGORIA_CAPEX),                                        # calcular_cpk_sem_capex (exato)
+    "manutencao":      lambda c: c.str.upper().isin(config.CATEGORIAS_MANUTENCAO_FIXAS_UPPER),        # custo_manut
+    "manutencao_freq": lambda c: c.str.lower().isin(config.CATEGORIAS_MANUTENCAO_FIXAS),              # calcular_frequencia_manutencao
+}
+
+def _classificar_despesas(df, baldes):
+    """
+    Fatoriza `categoria` e classifica só as categorias distintas.
+    Retorna (códigos por linha, valores por linha, {balde: máscara por categoria}).
+    O código 0 é reservado para categoria nula, que não pertence a nenhum balde.
+    """
+    codigos, unicos = pd.factorize(df["categoria"])
+    tabela = {
+        nome: np.concatenate([[False], mascara])
+        for nome, mascara in _classificar_categorias(unicos, baldes).items()
+    }
+    return codigos + 1, df["valor"].to_numpy(dtype=float), tabela
+
+def _classificar_categorias(categorias, baldes):
+    """{balde: máscara} para uma lista de categorias distintas (nula não pertence a nenhum balde)."""
+    categorias = pd.Series(np.asarray(categorias, dtype=object), dtype=object)
+    return {nome: regra(categorias).to_numpy(dtype=bool) for nome, regra in baldes.items()}
+
+def somas_por_categoria(categorias, somas, qtds, despesa="viagem"):
+    """
+    (soma, qtd, {balde: máscara}) de `metricas_de_agregados` para somas já feitas por
+    categoria distinta (ex.: GROUP BY categoria no banco); `despesa` = "viagem" ou "fixa".
+    """
+    baldes = _BALDES_DESPESA_VIAGEM if despesa == "viagem" else _BALDES_DESPESA_FIXA
+    return (
+        np.asarray(somas, dtype=float),
+        np.asarray(qtds, dtype=np.int64),
+        _classificar_categorias(categorias, baldes),
+    )
+
+def _selecionar(df, selecao):
+    """Linhas de `df` por máscara booleana ou posições inteiras (None = tabela inteira)."""
+    if selecao is None:
+        return df
+    selecao = np.asarray(selecao)
+    return df[selecao] if selecao.dtype == bool else df.take(selecao)
+
+def _somar_por_categoria(classificacao, selecao=None):
+    """Soma de `valor` (ignorando NaN) e contagem de linhas por categoria."""
+    codigos, valores, tabela = classificacao
+    if selecao is not None:
+        selecao = np.asarray(selecao)
+        codigos, valores = codigos[selecao], valores[selecao]
+    n = len(next(iter(tabela.values())))
+    soma = np.bincount(codigos, weights=np.where(np.isnan(valores), 0.0, valores), minlength=n).astype(float)
+    qtd = np.bincount(codigos, minlength=n)
+    return soma, qtd
+
+class MetricasEngine:
+    """
+    Calcula o dicionário de `dashboard.calcular_metricas_gerais` classificando as
+    categorias de despesa uma única vez (combustível, pneu, manutenção, CAPEX, imposto).
+    Os KPIs saem de somas por categoria, sem refiltrar `categoria` como texto.
+
+    Reutilizável para qualquer recorte (veículo, motorista, viagem): basta passar
+    máscaras booleanas ou posições inteiras das tabelas em `calcular`.
+    """
+
+    def __init__(self, df_viagens, df_desp_viagem, df_desp_fixa):
+        self.viagens = df_viagens
+        self.despesas_viagem = df_desp_viagem
+        self.despesas_fixas = df_desp_fixa
+        self._cls_viagem = _classificar_despesas(df_desp_viagem, _BALDES_DESPESA_VIAGEM)
+        self._cls_fixa = _classificar_despesas(df_desp_fixa, _BALDES_DESPESA_FIXA)
+
+    def calcular(self, viagens=None, despesas_viagem=None, despesas_fixas=None):
+        """
+        Retorna o dicionário de métricas para o recorte indicado pelas máscaras
+        ou posições (None = tabela inteira), idêntico ao de `calcular_metricas_gerais`.
+        """
+        df_viagens = _selecionar(self.viagens, viagens)
+        df_desp_viagem = _selecionar(self.despesas_viagem, despesas_viagem)
+        df_desp_fixa = _selecionar(self.despesas_fixas, despesas_fixas)
+        soma_dv, qtd_dv = _somar_por_categoria(self._cls_viagem, despesas_viagem)
+        soma_df, qtd_df = _somar_por_categoria(self._cls_fixa, despesas_fixas)
+
+        agregados = {
+            "km_total":                 km_total(df_viagens),
+            "total_viagens":            total_viagens(df_viagens),
+            "receita_bruta":            calcular_receita_bruta(df_viagens),
+            "custo_variavel":           custo_variavel_total(df_desp_viagem),
+            "custo_fixo":               despesa_fixa_total(df_desp_fixa),
+            "total_despesas_viagem":    df_viagens["total_despesas_viagem"].sum(),   # calcular_cpk
+            "litros_combustivel":       litros_combustivel_total(df_viagens),
+            "consumo_medio_km_l":       calcular_consumo_km_por_litro(df_viagens),
+            "receita_media_por_viagem": calcular_receita_media_por_viagem(df_viagens),
+            "preco_medio_combustivel":  df_desp_viagem["preco_combustivel"].mean(),
+            "idle_medio":               calcular_idle_medio(df_viagens),
+            "gasto_empresa":            gasto_empresa_total(df_viagens),
+            "gasto_motorista":          gasto_motorista_total(df_viagens),
+            "troco":                    troco_total(df_viagens),
+        }
+        return metricas_de_agregados(
+            agregados,
+            (soma_dv, qtd_dv, self._cls_viagem[2]),
+            (soma_df, qtd_df, self._cls_fixa[2]),
+            calcular_faturamento_por_mes(df_viagens, df_desp_viagem, df_desp_fixa),
+        )
+
+def metricas_de_agregados(agregados, categorias_viagem, categorias_fixas, df_lucro_mensal):
+    """
+    Dicionário de `calcular_metricas_gerais` a partir de agregados já calculados
+    (pelo MetricasEngine em pandas ou por SQL em utils_sqlite):
+      • agregados: totais das viagens/despesas (chaves de MetricasEngine.calcular);
+      • categorias_*: (soma de valor, qtd de linhas, {balde: máscara}) por categoria distinta;
+      • df_lucro_mensal: P&L mensal do recorte (formato de calcular_faturamento_por_mes).
+    """
+    soma_dv, qtd_dv, baldes_dv = categorias_viagem
+    soma_df, qtd_df, baldes_df = categorias_fixas
+
+    # ────────────────────────────────────────────
+    # Pré-cálculos fundamentais (usados por vários KPIs)
+    # ────────────────────────────────────────────
+    km               = agregados["km_total"]
+    n_viagens        = agregados["total_viagens"]
+    receita_bruta_tot = agregados["receita_bruta"]
+    custo_var_tot    = agregados["custo_variavel"]
+    custo_fixo_tot   = agregados["custo_fixo"]
+    lucro_bruto_tot  = receita_bruta_tot - custo_var_tot
+    lucro_liq_tot    = lucro_bruto_tot - custo_fixo_tot
+
+    fixa_livre_impostos = soma_df[~baldes_df["imposto"]].sum()
+    fixa_sem_prestacao  = soma_df[~baldes_df["prestacao"]].sum()
+    manut_total = soma_df[baldes_df["manutencao"]].sum() + soma_dv[baldes_dv["manutencao"]].sum()
+    combustivel = soma_dv[baldes_dv["combustivel"]].sum()
+    pneus       = soma_dv[baldes_dv["pneu"]].sum()
+
+    try:
+        cpk_sem_capex = (custo_var_tot + fixa_sem_prestacao) / km
+    except ZeroDivisionError:
+        cpk_sem_capex = pd.NA
+
+    metricas = {
+
+        # 1️⃣  Totais de volume e uso
+        "km_total":                    km,
+        "total_viagens":               n_viagens,
+        "litros_combustivel_total":    agregados["litros_combustivel"],
+
+        # 2️⃣  Totais financeiros brutos
+        "receita_bruta_total":         receita_bruta_tot,
+        "custo_variavel_total":        custo_var_tot,
+        "custo_fixo_total":            custo_fixo_tot,
+
+        # 3️⃣  Lucros agregados
+        "lucro_bruto_total":           lucro_bruto_tot,
+        "lucro_liquido_total":         lucro_liq_tot,
+        "lucro_liquido_mensal_df":     df_lucro_mensal,            # dataframe inteiro
+        "lucro_liquido_mensal_total":  df_lucro_mensal["lucro_liquido"].sum(),
+
+        # 4️⃣  Indicadores de margem / eficiência global
+        "margem_lucro_liquido_%":      calcular_margem_lucro_liquido(lucro_liq_tot, receita_bruta_tot),
+        "cpk_completo":                (agregados["total_despesas_viagem"] + custo_fixo_tot) / km if km else 0,
+        "cpk_sem_capex":               cpk_sem_capex,
+        "rpk":                         calcular_rpk(receita_bruta_tot, km),
+        "margem_lucro_por_km":         calcular_margem_por_km(
+                                           receita_bruta_tot, custo_var_tot + custo_fixo_tot, km),
+        "ebitda":                      lucro_liq_tot + (custo_fixo_tot - fixa_livre_impostos),
+
+        # 5️⃣  Custos / receitas unitários
+        "custo_combustivel_km":        combustivel / km if km else 0,
+        "custo_manutencao_km":         manut_total / km if km else 0,
+        "custo_pneus_km":              pneus / km if km else 0,
+
+        # 6️⃣  Médias por viagem / consumo
+        "consumo_medio_km_l":          agregados["consumo_medio_km_l"],
+        "receita_media_por_viagem":    agregados["receita_media_por_viagem"],
+        "despesa_media_por_viagem":    custo_var_tot / n_viagens if n_viagens else 0,
+        "preco_medio_combustivel":     agregados["preco_medio_combustivel"],
+        "media_tempo_ocioso_por_mes":  agregados["idle_medio"],
+
+        # 7️⃣  Manutenção / CAPEX
+        "capex_total":                 soma_df[baldes_df["capex"]].sum(),
+        "total_manutencoes":           manut_total,
+        "frequencia_manutencao":       int(qtd_dv[baldes_dv["manutencao_freq"]].sum()
+                                           + qtd_df[baldes_df["manutencao_freq"]].sum()),
+
+        # 8️⃣  Gastos diretos com pessoal
+        "gasto_empresa_total":         agregados["gasto_empresa"],
+        "gasto_motorista_total":       agregados["gasto_motorista"],
+        "troco_total":                 agregados["troco"],
+    }
+
+    # ────────────────────────────────────────────
+    # Arredondamento de valores numéricos
+    # ────────────────────────────────────────────
+    for k, v in metricas.items():
+        if isinstance(v, (int, float)):
+            metricas[k] = round(v, 2) if not pd.isna(v) else 0
+
+    return metricas
+
+# ============================
+# 4.2 Métricas por Dimensão (veículo, motorista, mês)
+# ============================
+
+def _chave_dimensao(df, dim, col_data):
+    """Série de agrupamento para `dim`; meses são representados pelo 1º dia do mês."""
+    if dim == "mes":
+        return pd.to_datetime(df[col_data], errors="coerce").dt.to_period("M").dt.to_timestamp()
+    return df[dim]
+
+def _somas_despesas_por_chave(df, chave, baldes, colunas):
+    """Soma `valor` por chave, total e por balde (classificação única por categoria distinta)."""
+    codigos, valores, tabela = _classificar_despesas(df, baldes)
+    valores = np.where(np.isnan(valores), 0.0, valores)
+    somas = pd.DataFrame({"total": valores}, index=df.index)
+    for nome in colunas:
+        somas[nome] = np.where(tabela[nome][codigos], valores, 0.0)
+    return somas.groupby(chave.to_numpy(), sort=False).sum()
+
+def metricas_por_dimensao(dados, dim="veiculo"):
+    """
+    RPK, CPK, Lucro/km, EBITDA, CAPEX, margem e custo de manutenção/km por
+    veículo, motorista ou mês, com uma agregação por tabela (sem laço por grupo).
+
+    Mesmas fórmulas dos cálculos individuais (calcular_rpk, calcular_cpk,
+    calcular_lucro_liquido, calcular_ebitda, capex, calcular_custo_manutencao_por_km).
+    Linhas = grupos presentes em `dados["viagens"]`. Para motorista, as despesas
+    fixas de cada veículo são rateadas pela fração de viagens do motorista no
+    veículo (mesmo critério de `preparar_df_eficiencia_motoristas`).
+    """
+    if dim not in ("veiculo", "motorista", "mes"):
+        raise ValueError(f"Dimensão inválida: {dim!r} (use 'veiculo', 'motorista' ou 'mes')")
+
+    df_viagens = dados["viagens"]
+    df_desp_viagem = dados["despesas_viagem"]
+    df_desp_fixa = dados["despesas_fixas"]
+
+    # 1. Viagens
+    chave_v = _chave_dimensao(df_viagens, dim, "data_ida")
+    viagens = (
+        pd.DataFrame({
+            "receita_bruta": (df_viagens["frete_ida"].fillna(0)
+                              + df_viagens["frete_volta"].fillna(0)
+                              + df_viagens["frete_extra"].fillna(0)),
+            "km_total": df_viagens["km_total"],
+            "total_despesas_viagem": df_viagens["total_despesas_viagem"],
+        }, index=df_viagens.index)
+        .groupby(chave_v.to_numpy(), sort=True)
+        .sum()
+    )
+
+    # 2. Despesas de viagem
+    desp_viagem = _somas_despesas_por_chave(
+        df_desp_viagem, _chave_dimensao(df_desp_viagem, dim, "data"),
+        _BALDES_DESPESA_VIAGEM, ["manutencao"],
+    )
+
+    # 3. Despesas fixas (rateadas por uso do veículo quando dim == "motorista")
+    colunas_fixas = ["imposto", "capex", "manutencao"]
+    if dim == "motorista":
+        fixas_veic = _somas_despesas_por_chave(
+            df_desp_fixa, df_desp_fixa["veiculo"], _BALDES_DESPESA_FIXA, colunas_fixas
+        )
+        uso = df_viagens.groupby(["veiculo", "motorista"], observed=True).size()
+        fracao = uso / uso.groupby(level="veiculo", observed=True).transform("sum")
+        desp_fixa = (
+            fixas_veic.reindex(fracao.index, level="veiculo").fillna(0)
+            .mul(fracao, axis=0)
+            .groupby(level="motorista").sum()
+        )
+    else:
+        desp_fixa = _somas_despesas_por_chave(
+            df_desp_fixa, _chave_dimensao(df_desp_fixa, dim, "data"),
+            _BALDES_DESPESA_FIXA, colunas_fixas,
+        )
+
+    # 4. Consolidação e indicadores
+    desp_viagem = desp_viagem.reindex(viagens.index, fill_value=0.0)
+    desp_fixa = desp_fixa.reindex(viagens.index, fill_value=0.0)
+
+    df = viagens.copy()
+    df["custo_variavel"] = desp_viagem["total"]
+    df["custo_fixo"] = desp_fixa["total"]
+    df["lucro_liquido"] = df["receita_bruta"] - (df["custo_variavel"] + df["custo_fixo"])
+    df["ebitda"] = df["lucro_liquido"] + desp_fixa["imposto"]
+    df["capex"] = desp_fixa["capex"]
+
+    km = df["km_total"].replace(0, np.nan)
+    df["rpk"] = (df["receita_bruta"] / km).fillna(0)
+    df["cpk"] = ((df["total_despesas_viagem"] + df["custo_fixo"]) / km).fillna(0)
+    df["lucro_por_km"] = (df["lucro_liquido"] / km).fillna(0)
+    df["custo_manutencao_km"] = ((desp_viagem["manutencao"] + desp_fixa["manutencao"]) / km).fillna(0)
+    df["margem_lucro_liquido_%"] = (df["lucro_liquido"] / df["receita_bruta"].replace(0, np.nan) * 100).fillna(0)
+
+    return df.rename_axis(dim).reset_index()
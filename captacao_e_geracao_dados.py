@@ -1,47 +1,261 @@
+import hashlib
+import json
+import os
+import threading
+import time
+import numpy as np
 import pandas as pd
 from datetime import datetime
 import config
+import calculos_e_formulas as calculos
+import utils_perfil as perfil
+
+try:
+    import pyarrow  # noqa: F401  (necessário apenas para o cache em Parquet)
+    _FORMATO_CACHE = "parquet"
+except ImportError:
+    _FORMATO_CACHE = "pickle"
+
+# Incrementar sempre que a tipagem das colunas mudar (invalida caches antigos)
+_VERSAO_CACHE = 2
 
 # ============================
 # 1. Carregamento de Dados Brutos
 # ============================
-def carregar_dados_brutos():
-    """Carrega todos os DataFrames brutos sem modificações."""
-    df_desp_viagem = pd.read_csv(
-        config.DESPESAS_VIAGEM_FILE, 
-        parse_dates=["data"]
+def _esquema(tabela):
+    return config.ESQUEMA_TABELAS.get(tabela, {}) if tabela else {}
+
+def _colunas_data(tabela):
+    return [c for c, tipo in _esquema(tabela).items() if tipo.startswith("datetime")] or None
+
+def _tipar_colunas(df, tabela=None):
+    """
+    Aplica `config.ESQUEMA_TABELAS[tabela]` às colunas presentes em `df`.
+    Colunas fora do esquema mantêm o tipo inferido; int32 só é aplicado sem nulos.
+    """
+    for col, tipo in _esquema(tabela).items():
+        if col not in df.columns:
+            continue
+        if tipo.startswith("category"):
+            if not isinstance(df[col].dtype, pd.CategoricalDtype):
+                df[col] = df[col].astype("category")
+        elif tipo.startswith("datetime"):
+            df[col] = pd.to_datetime(df[col])
+        elif tipo.startswith("int") and df[col].isna().any():
+            continue
+        else:
+            df[col] = df[col].astype(tipo)
+    return df
+
+def _unificar_dominios(tabelas):
+    """
+    Dá às colunas de um mesmo domínio ("category:<domínio>" no esquema) as mesmas
+    categorias, para que os merges entre tabelas comparem códigos inteiros.
+    """
+    dominios = {}
+    for tabela, df in tabelas.items():
+        for col, tipo in _esquema(tabela).items():
+            if tipo.startswith("category:") and col in df.columns:
+                dominios.setdefault(tipo.split(":", 1)[1], []).append((df, col))
+    for colunas in dominios.values():
+        uniao = colunas[0][0][colunas[0][1]].cat.categories
+        for df, col in colunas[1:]:
+            uniao = uniao.union(df[col].cat.categories)
+        for df, col in colunas:
+            df[col] = df[col].cat.set_categories(uniao)
+    return tabelas
+
+def _assinatura_arquivo(caminho, tabela=None):
+    """Identifica a versão de um CSV por mtime, tamanho, formato/versão do cache e esquema de tipos."""
+    st = os.stat(caminho)
+    return {
+        "mtime_ns": st.st_mtime_ns,
+        "tamanho": st.st_size,
+        "formato": _FORMATO_CACHE,
+        "versao": _VERSAO_CACHE,
+        "esquema": _esquema(tabela),
+    }
+
+def _caminhos_cache(caminho, sufixo=""):
+    nome = os.path.splitext(os.path.basename(caminho))[0] + sufixo
+    base = os.path.join(config.CACHE_COLUNAR_DIR, nome)
+    return f"{base}.{_FORMATO_CACHE}", f"{base}.json"
+
+def _ler_df(caminho):
+    if _FORMATO_CACHE == "parquet":
+        return pd.read_parquet(caminho)
+    return pd.read_pickle(caminho)
+
+def _gravar_df(df, caminho):
+    """Grava `df` no formato do cache de forma atômica (arquivo temporário + rename)."""
+    tmp = f"{caminho}.tmp"
+    if _FORMATO_CACHE == "parquet":
+        df.to_parquet(tmp, index=False)
+    else:
+        df.to_pickle(tmp)
+    os.replace(tmp, caminho)
+
+def _ler_json(caminho):
+    try:
+        with open(caminho, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _gravar_json(obj, caminho):
+    with open(f"{caminho}.tmp", "w", encoding="utf-8") as f:
+        json.dump(obj, f)
+    os.replace(f"{caminho}.tmp", caminho)
+
+def _ler_cache(arq_dados, arq_meta, assinatura):
+    """Retorna o DataFrame em cache se a assinatura bater; caso contrário, None."""
+    if _ler_json(arq_meta) != assinatura:
+        return None
+    try:
+        return _ler_df(arq_dados)
+    except (OSError, ValueError):
+        return None
+
+def _gravar_cache(df, arq_dados, arq_meta, assinatura):
+    """Grava dados e metadados; falhas apenas desativam o cache."""
+    try:
+        os.makedirs(config.CACHE_COLUNAR_DIR, exist_ok=True)
+        _gravar_df(df, arq_dados)
+        _gravar_json(assinatura, arq_meta)
+    except (OSError, ValueError, TypeError):
+        pass
+
+def ler_tabela(caminho, tabela=None, leitor=None, sufixo_cache=""):
+    """
+    Lê um CSV bruto já tipado segundo `config.ESQUEMA_TABELAS[tabela]`.
+    Com `config.USAR_CACHE_COLUNAR`, reaproveita o arquivo colunar em
+    `config.CACHE_COLUNAR_DIR` enquanto mtime e tamanho do CSV não mudarem.
+    `leitor(caminho)` substitui o pd.read_csv padrão (ex.: leitura em lotes) e entra
+    na assinatura do cache. Um leitor que devolve {sufixo: DataFrame} gera vários produtos
+    numa só leitura: todos são gravados no cache e o de `sufixo_cache` é devolvido.
+    """
+    ler = leitor or (lambda c: pd.read_csv(c, parse_dates=_colunas_data(tabela)))
+    if not config.USAR_CACHE_COLUNAR:
+        produtos = ler(caminho)
+        return _tipar_colunas(produtos[sufixo_cache] if isinstance(produtos, dict) else produtos, tabela)
+
+    assinatura = _assinatura_arquivo(caminho, tabela)
+    if leitor is not None:
+        assinatura["leitor"] = leitor.__name__
+    arq_dados, arq_meta = _caminhos_cache(caminho, sufixo_cache)
+    df = _ler_cache(arq_dados, arq_meta, assinatura)
+    if df is None:
+        produtos = ler(caminho)
+        if not isinstance(produtos, dict):
+            produtos = {sufixo_cache: produtos}
+        for sufixo, produto in produtos.items():
+            _gravar_cache(_tipar_colunas(produto, tabela), *_caminhos_cache(caminho, sufixo), assinatura)
+        df = produtos[sufixo_cache]
+    return df
+
+# ----------------------------
+# 1.1 Leitura em lotes das despesas de viagem
+# ----------------------------
+# tipos de leitura derivados de ESQUEMA_TABELAS["despesas_viagem"]; valor, litros e preço
+# seguem em float64 (somas exibidas ao centavo), só o km é reduzido pelo esquema
+_COLUNAS_FLOAT64_EM_LOTES = ["valor", "lts_combustivel", "preco_combustivel"]
+_CHAVES_AGREGADO_DESPESAS_VIAGEM = ["viagem_id", "veiculo_id", "data", "categoria"]
+_SOMAS_AGREGADO_DESPESAS_VIAGEM = ["valor", "lts_combustivel"]
+_SUFIXO_AGREGADO = "_agregado"
+
+def _tipos_em_lotes():
+    """dtypes do read_csv em lotes: categóricas do esquema e números em float64 (reduzidos depois por `_tipar_colunas`)."""
+    tipos = {}
+    for col, tipo in _esquema("despesas_viagem").items():
+        if tipo.startswith("category"):
+            tipos[col] = "category"
+        elif tipo.startswith(("int", "float")):
+            tipos[col] = "float64"
+    tipos.update(dict.fromkeys(_COLUNAS_FLOAT64_EM_LOTES, "float64"))
+    return tipos
+
+def _unir_lotes(partes, colunas):
+    """Concatena lotes mantendo as categóricas (categorias unificadas antes do concat)."""
+    if not partes:
+        return pd.DataFrame(columns=colunas)
+    for col in partes[0].select_dtypes("category").columns:
+        uniao = partes[0][col].cat.categories
+        for parte in partes[1:]:
+            uniao = uniao.union(parte[col].cat.categories)
+        for parte in partes:
+            parte[col] = parte[col].cat.set_categories(uniao)
+    return pd.concat(partes, ignore_index=True)
+
+def _agregar_lote(lote):
+    """Somas e `qtd` de um lote por viagem, veículo, mês (fim do mês, em `data`) e categoria."""
+    grupos = [lote["viagem_id"], lote["veiculo_id"], calculos._fim_do_mes(lote["data"]), lote["categoria"]]
+    return (
+        lote[_SOMAS_AGREGADO_DESPESAS_VIAGEM].assign(qtd=1)
+        .groupby(grupos, observed=True, dropna=False)
+        .sum()
+        .reset_index()
     )
-    df_desp_fixa = pd.read_csv(
-        config.DESPESAS_FIXAS_FILE, 
-        parse_dates=["data"]
+
+def ler_despesas_viagem_em_lotes(caminho, tamanho_lote=None):
+    """
+    Lê o CSV de despesas de viagem numa única passada, em lotes de `tamanho_lote` linhas
+    (padrão `config.TAMANHO_LOTE_CSV`), com os tipos de `config.ESQUEMA_TABELAS`.
+
+    Retorna os dois produtos gravados por `ler_tabela` (chave = sufixo do cache):
+      • ""          – detalhe: colunas do CSV tipadas pelo esquema (texto repetitivo em category,
+                      km em float32; valor, litros e preço em float64);
+      • "_agregado" – uma linha por viagem_id × veiculo_id × mês (`data`, fim do mês) × categoria
+                      com `valor` e `lts_combustivel` somados e `qtd` de linhas.
+    Os lotes brutos são descartados à medida que são lidos; ficam só o detalhe compacto e os agregados.
+    """
+    partes, agregados = [], []
+    lotes = pd.read_csv(
+        caminho,
+        dtype=_tipos_em_lotes(),
+        parse_dates=_colunas_data("despesas_viagem"),
+        chunksize=tamanho_lote or config.TAMANHO_LOTE_CSV,
     )
-    df_motorista = pd.read_csv(config.MOTORISTA_FILE)
-    df_veiculo = pd.read_csv(config.VEICULO_FILE)
-    df_viagem = pd.read_csv(
-        config.VIAGEM_COMPLETA_FILE, 
-        parse_dates=["data_ida", "data_volta"]
+    for lote in lotes:
+        agregados.append(_agregar_lote(lote))
+        partes.append(_tipar_colunas(lote, "despesas_viagem"))
+
+    # chaves presentes em mais de um lote são somadas de novo
+    agregado = (
+        _unir_lotes(agregados, _CHAVES_AGREGADO_DESPESAS_VIAGEM + _SOMAS_AGREGADO_DESPESAS_VIAGEM + ["qtd"])
+        .groupby(_CHAVES_AGREGADO_DESPESAS_VIAGEM, observed=True, dropna=False)
+        .sum()
+        .reset_index()
     )
+    return {"": _unir_lotes(partes, list(_tipos_em_lotes())), _SUFIXO_AGREGADO: agregado}
+
+def carregar_agregados_despesas_viagem():
+    """
+    Pré-agregado das despesas de viagem (ver `ler_despesas_viagem_em_lotes`), do mesmo cache
+    colunar que o detalhe lido por `carregar_dados_brutos` na leitura em lotes.
+    """
+    return ler_tabela(config.DESPESAS_VIAGEM_FILE, "despesas_viagem",
+                      leitor=ler_despesas_viagem_em_lotes, sufixo_cache=_SUFIXO_AGREGADO)
+
+@perfil.medir()
+def carregar_dados_brutos():
+    """Carrega todos os DataFrames brutos, tipados por `config.ESQUEMA_TABELAS` (via cache colunar, se ativo)."""
+    leitores = {"despesas_viagem": ler_despesas_viagem_em_lotes} if config.LEITURA_EM_LOTES_DESPESAS_VIAGEM else {}
+    tabelas = _unificar_dominios({
+        tabela: ler_tabela(caminho, tabela, leitor=leitores.get(tabela))
+        for tabela, caminho in _fontes_brutas().items()
+    })
+    df_desp_viagem, df_desp_fixa, df_motorista, df_veiculo, df_viagem = tabelas.values()
     return df_desp_viagem, df_desp_fixa, df_motorista, df_veiculo, df_viagem
 
 # ============================
 # 2. Enriquecimento de Dados
 # ============================
-def enriquecer_dados(df_desp_viagem, df_desp_fixa, df_motorista, df_veiculo, df_viagem):
-    """
-    Aplica filtros estáticos e enriquece dados com relacionamentos:
-    1. Filtra viagens não iniciadas
-    2. Adiciona motorista/veículo às viagens
-    3. Adiciona metadados às despesas
-    """
-    # Filtros iniciais
+def _enriquecer_viagens(df_viagem, df_motorista, df_veiculo):
+    """Filtra viagens não iniciadas/em andamento e adiciona motorista e placa."""
     df_viagem_filtrado = df_viagem[
-        ~df_viagem["status"].isin(["NAO INICIADA", "EM VIAGEM"])]
-    
-    df_desp_viagem_filtrado = df_desp_viagem[
-        df_desp_viagem["viagem_id"].isin(df_viagem_filtrado["id"])]
+        ~df_viagem["status"].isin(config.STATUS_EXCLUIDOS)]
 
-    # 3. Enriquecimento de viagens
-    df_viagem_enriquecido = (
+    return (
         df_viagem_filtrado
         .merge(
             df_motorista[["id", "nome"]], 
@@ -62,8 +276,12 @@ def enriquecer_dados(df_desp_viagem, df_desp_fixa, df_motorista, df_veiculo, df_
         .drop(columns=["id_motorista", "id_veiculo"])  # Colunas geradas pelos sufixos
     )
 
-    # 4. Enriquecimento de despesas de viagem
-    df_desp_viagem_enriquecido = (
+def _enriquecer_despesas_viagem(df_desp_viagem, df_viagem_enriquecido):
+    """Mantém só despesas de viagens válidas e adiciona motorista, placa e data da viagem."""
+    df_desp_viagem_filtrado = df_desp_viagem[
+        df_desp_viagem["viagem_id"].isin(df_viagem_enriquecido["id"])]
+
+    return (
         df_desp_viagem_filtrado
         .merge(
             df_viagem_enriquecido[["id", "motorista", "veiculo", "data_ida"]],
@@ -76,8 +294,9 @@ def enriquecer_dados(df_desp_viagem, df_desp_fixa, df_motorista, df_veiculo, df_
         .drop(columns=["id_viagem"])  # Dropa a coluna gerada pelo merge
     )
 
-    # 5. Enriquecimento de despesas fixas
-    df_desp_fixa_enriquecido = (
+def _enriquecer_despesas_fixas(df_desp_fixa, df_veiculo):
+    """Adiciona a placa às despesas fixas."""
+    return (
         df_desp_fixa
         .merge(
             df_veiculo[["id", "placa"]],
@@ -90,60 +309,333 @@ def enriquecer_dados(df_desp_viagem, df_desp_fixa, df_motorista, df_veiculo, df_
         .drop(columns=["id_veiculo"])  # Dropa a coluna gerada pelo merge
     )
 
+@perfil.medir()
+def enriquecer_dados(df_desp_viagem, df_desp_fixa, df_motorista, df_veiculo, df_viagem):
+    """
+    Aplica filtros estáticos e enriquece dados com relacionamentos:
+    1. Filtra viagens não iniciadas
+    2. Adiciona motorista/veículo às viagens
+    3. Adiciona metadados às despesas
+    """
+    df_viagem_enriquecido = _enriquecer_viagens(df_viagem, df_motorista, df_veiculo)
+
     return {
         "viagens": df_viagem_enriquecido,
-        "despesas_viagem": df_desp_viagem_enriquecido,
-        "despesas_fixas": df_desp_fixa_enriquecido
+        "despesas_viagem": _enriquecer_despesas_viagem(df_desp_viagem, df_viagem_enriquecido),
+        "despesas_fixas": _enriquecer_despesas_fixas(df_desp_fixa, df_veiculo)
+    }
+
+# ----------------------------
+# 2.1 Snapshot persistido do enriquecimento
+# ----------------------------
+# Incrementar sempre que o formato do enriquecimento mudar (força reconstrução completa)
+_VERSAO_SNAPSHOT = 2
+_TABELAS_SNAPSHOT = ["viagens", "despesas_viagem", "despesas_fixas"]
+
+def _fontes_brutas():
+    """Arquivos brutos na mesma ordem devolvida por `carregar_dados_brutos`."""
+    return {
+        "despesas_viagem": config.DESPESAS_VIAGEM_FILE,
+        "despesas_fixas": config.DESPESAS_FIXAS_FILE,
+        "motorista": config.MOTORISTA_FILE,
+        "veiculo": config.VEICULO_FILE,
+        "viagem": config.VIAGEM_COMPLETA_FILE,
+    }
+
+def versao_fontes():
+    """Identificador barato (mtime, tamanho) dos CSVs brutos; muda sempre que algum arquivo é regravado."""
+    return tuple(
+        (os.stat(c).st_mtime_ns, os.stat(c).st_size) for c in _fontes_brutas().values()
+    )
+
+class MonitorFontes:
+    """
+    Observa os CSVs do `config` por polling de (mtime, tamanho), no máximo a cada
+    `intervalo_s`, e numera as versões do conjunto de dados.
+
+    Uma mudança só é aceita quando o arquivo fica igual em duas verificações seguidas
+    (exportação em andamento não é lida pela metade). `assinatura` tem o formato de
+    `versao_fontes()` e serve de chave para os caches derivados; `alteradas` diz quais
+    fontes mudaram na última versão (as demais seguem nos caches em disco de `ler_tabela`).
+    """
+
+    def __init__(self, intervalo_s=None):
+        self.intervalo_s = config.INTERVALO_MONITOR_FONTES_S if intervalo_s is None else intervalo_s
+        self.versao = 0
+        self.alteradas = ()
+        self.momento = datetime.now()
+        self._trava = threading.Lock()
+        self._ultima = None
+        self._estado = self._ler_estado()
+        self._pendente = None
+
+    @staticmethod
+    def _ler_estado():
+        estado = {}
+        for tabela, caminho in _fontes_brutas().items():
+            try:
+                info = os.stat(caminho)
+                estado[tabela] = (info.st_mtime_ns, info.st_size)
+            except OSError:
+                estado[tabela] = None  # arquivo sendo substituído: tratado como mudança pendente
+        return estado
+
+    @property
+    def assinatura(self):
+        return tuple(self._estado.values())
+
+    def verificar(self, forcar=False):
+        """Relê os mtimes se o intervalo passou; devolve a `assinatura` da versão aceita."""
+        with self._trava:
+            agora = time.monotonic()
+            if not forcar and self._ultima is not None and agora - self._ultima < self.intervalo_s:
+                return self.assinatura
+            self._ultima = agora
+            estado = self._ler_estado()
+            if estado == self._estado or None in estado.values():
+                self._pendente = None
+            elif estado != self._pendente:
+                self._pendente = estado  # confirma na próxima verificação
+            else:
+                self.alteradas = tuple(t for t in estado if estado[t] != self._estado[t])
+                self._estado = estado
+                self._pendente = None
+                self.versao += 1
+                self.momento = datetime.now()
+            return self.assinatura
+
+def _dir_snapshot():
+    return os.path.join(config.CACHE_COLUNAR_DIR, "enriquecido")
+
+def _arquivo_snapshot(tabela, versao):
+    return os.path.join(_dir_snapshot(), f"{tabela}_v{versao}.{_FORMATO_CACHE}")
+
+def _sha1_arquivo(caminho, corte):
+    """Retorna (sha1 dos primeiros `corte` bytes, sha1 do arquivo inteiro) em uma única leitura."""
+    h = hashlib.sha1()
+    prefixo = None
+    lidos = 0
+    with open(caminho, "rb") as f:
+        while True:
+            bloco = f.read(1 << 20)
+            if prefixo is None and lidos + len(bloco) >= corte:
+                h.update(bloco[:corte - lidos])
+                prefixo = h.hexdigest()
+                h.update(bloco[corte - lidos:])
+            else:
+                h.update(bloco)
+            lidos += len(bloco)
+            if not bloco:
+                break
+    return prefixo, h.hexdigest()
+
+def _estado_fontes(brutos, anterior):
+    """
+    Compara cada CSV com o estado gravado no snapshot.
+    Retorna (estados, inicio), onde `inicio[nome]` é a primeira linha nova
+    (== len(df) se nada mudou) ou None se o arquivo não cresceu só por append.
+    """
+    estados, inicio = {}, {}
+    for (nome, caminho), df in zip(_fontes_brutas().items(), brutos):
+        st = os.stat(caminho)
+        ant = (anterior or {}).get(nome)
+        if ant and (ant["mtime_ns"], ant["tamanho"], ant["linhas"]) == (st.st_mtime_ns, st.st_size, len(df)):
+            estados[nome], inicio[nome] = ant, len(df)
+            continue
+
+        corte = ant["tamanho"] if ant else 0
+        prefixo, total = _sha1_arquivo(caminho, corte)
+        apenas_append = (
+            ant is not None
+            and st.st_size > ant["tamanho"]
+            and len(df) >= ant["linhas"]
+            and prefixo == ant["sha1"]
+        )
+        estados[nome] = {"mtime_ns": st.st_mtime_ns, "tamanho": st.st_size, "linhas": len(df), "sha1": total}
+        inicio[nome] = ant["linhas"] if apenas_append else None
+    return estados, inicio
+
+def _fontes_inalteradas(anterior):
+    """(mtime, tamanho) de todos os CSVs iguais aos gravados no snapshot — sem ler os arquivos."""
+    try:
+        for nome, caminho in _fontes_brutas().items():
+            st = os.stat(caminho)
+            if (anterior[nome]["mtime_ns"], anterior[nome]["tamanho"]) != (st.st_mtime_ns, st.st_size):
+                return False
+    except (OSError, KeyError, TypeError):
+        return False
+    return True
+
+def _anexar(df_antigo, df_novo):
+    """Concatena linhas novas ao snapshot preservando as colunas categóricas."""
+    if df_novo.empty:
+        return df_antigo
+    df = pd.concat([df_antigo, df_novo], ignore_index=True)
+    for col in df_antigo.select_dtypes("category").columns:
+        df[col] = df[col].astype("category")
+    return df
+
+def _enriquecer_incremental(snapshot, brutos, inicio):
+    """Enriquece apenas as linhas anexadas aos CSVs e as acrescenta ao snapshot."""
+    df_desp_viagem, df_desp_fixa, df_motorista, df_veiculo, df_viagem = brutos
+
+    viagens_novas = _enriquecer_viagens(df_viagem.iloc[inicio["viagem"]:], df_motorista, df_veiculo)
+    viagens = _anexar(snapshot["viagens"], viagens_novas)
+
+    # despesas novas + despesas antigas que só agora encontram sua viagem
+    candidatas = df_desp_viagem.iloc[inicio["despesas_viagem"]:]
+    if not viagens_novas.empty:
+        antigas = df_desp_viagem.iloc[:inicio["despesas_viagem"]]
+        antigas = antigas[antigas["viagem_id"].isin(viagens_novas["id"])]
+        candidatas = pd.concat([antigas, candidatas])
+
+    return {
+        "viagens": viagens,
+        "despesas_viagem": _anexar(
+            snapshot["despesas_viagem"], _enriquecer_despesas_viagem(candidatas, viagens)
+        ),
+        "despesas_fixas": _anexar(
+            snapshot["despesas_fixas"],
+            _enriquecer_despesas_fixas(df_desp_fixa.iloc[inicio["despesas_fixas"]:], df_veiculo),
+        ),
     }
+
+def _gravar_snapshot(dados, versao, estados, versao_anterior, linhagem):
+    """`linhagem` = versão da última reconstrução completa (mantida enquanto só há appends)."""
+    try:
+        os.makedirs(_dir_snapshot(), exist_ok=True)
+        for tabela in _TABELAS_SNAPSHOT:
+            _gravar_df(dados[tabela], _arquivo_snapshot(tabela, versao))
+        _gravar_json(
+            {"schema": _VERSAO_SNAPSHOT, "formato": _FORMATO_CACHE, "versao": versao,
+             "status_excluidos": list(config.STATUS_EXCLUIDOS), "linhagem": linhagem, "fontes": estados},
+            os.path.join(_dir_snapshot(), "snapshot.json"),
+        )
+        if versao_anterior is not None:
+            for tabela in _TABELAS_SNAPSHOT:
+                os.remove(_arquivo_snapshot(tabela, versao_anterior))
+    except (OSError, ValueError, TypeError):
+        pass
+
+@perfil.medir()
+def carregar_dados_enriquecidos():
+    """
+    Equivalente a `enriquecer_dados(*carregar_dados_brutos())`, reaproveitando o
+    snapshot enriquecido gravado em disco:
+      • CSVs inalterados (mesmo mtime e tamanho) → snapshot lido direto, sem carregar os brutos;
+      • linhas apenas anexadas às viagens/despesas → só as novas são enriquecidas;
+      • qualquer outra mudança (inclusive em motoristas/veículos) → reconstrução completa.
+    """
+    if not config.USAR_SNAPSHOT_ENRIQUECIDO:
+        return enriquecer_dados(*carregar_dados_brutos())
+
+    meta = _ler_json(os.path.join(_dir_snapshot(), "snapshot.json"))
+    # numeração contínua mesmo quando o snapshot é descartado: a linhagem nunca se repete
+    versao_anterior = meta.get("versao") if isinstance(meta, dict) and isinstance(meta.get("versao"), int) else None
+    if (not meta or meta.get("schema") != _VERSAO_SNAPSHOT or meta.get("formato") != _FORMATO_CACHE
+            or meta.get("status_excluidos") != list(config.STATUS_EXCLUIDOS)):
+        meta = None  # snapshot de outro formato ou de outra lista de status excluídos: reconstrução completa
+    if meta and _fontes_inalteradas(meta["fontes"]):
+        try:
+            return {t: _ler_df(_arquivo_snapshot(t, meta["versao"])) for t in _TABELAS_SNAPSHOT}
+        except (OSError, ValueError):
+            pass  # snapshot ilegível: segue pela comparação completa (e reconstrução)
+
+    brutos = carregar_dados_brutos()
+    estados, inicio = _estado_fontes(brutos, meta and meta["fontes"])
+
+    dimensoes_iguais = all(inicio[n] == len(df) for n, df in zip(["motorista", "veiculo"], brutos[2:4]))
+    if meta and dimensoes_iguais and None not in inicio.values():
+        try:
+            snapshot = {t: _ler_df(_arquivo_snapshot(t, meta["versao"])) for t in _TABELAS_SNAPSHOT}
+        except (OSError, ValueError):
+            snapshot = None
+        if snapshot is not None:
+            if all(inicio[n] == len(df) for n, df in zip(_fontes_brutas(), brutos)):
+                return snapshot
+            dados = _enriquecer_incremental(snapshot, brutos, inicio)
+            _gravar_snapshot(dados, meta["versao"] + 1, estados, meta["versao"],
+                             meta.get("linhagem", meta["versao"]))
+            return dados
+
+    dados = enriquecer_dados(*brutos)
+    versao = (versao_anterior or 0) + 1
+    _gravar_snapshot(dados, versao, estados, versao_anterior, versao)
+    return dados
+
+def linhagem_dados():
+    """
+    Linhagem do snapshot enriquecido: muda a cada reconstrução completa e se mantém
+    enquanto as tabelas só recebem linhas no final. None sem snapshot.
+    """
+    if not config.USAR_SNAPSHOT_ENRIQUECIDO:
+        return None
+    meta = _ler_json(os.path.join(_dir_snapshot(), "snapshot.json"))
+    return meta.get("linhagem", meta["versao"]) if meta else None  # snapshots antigos: a própria versão
+
 # ============================
 # 3. Cruzamento de Dados e Geração dos DataFrames Necessários
 # ============================
 
+def _marcar_categorias(categoria, nomes):
+    """
+    Flag booleana por linha: categoria (em maiúsculas) está em `nomes`.
+    O teste roda uma vez por categoria distinta; categoria nula = False.
+    """
+    codigos, unicos = pd.factorize(categoria)
+    marcas = np.append(pd.Index(unicos).astype(str).str.upper().isin(nomes), False)
+    return marcas[codigos]  # código -1 (nulo) cai no False final
+
 def processar_dados_historicos(df_viagem,
                                df_desp_viagem,
                                df_desp_fixas):
-    """Consolida KPIs mensais (robusto a datas vazias)."""
-
-    # ───── 1. Sanitiza colunas de data ────────────────────────────
-    for _df, col in [(df_desp_viagem, "data"), (df_desp_fixas, "data")]:
-        _df[col] = pd.to_datetime(_df[col], errors="coerce")
-        _df.dropna(subset=[col], inplace=True)
-
-    # ───── 2. KPIs de viagens (já estavam OK) ─────────────────────
-    df = df_viagem.copy()
-    df["soma_frete_row"] = (
-        df["frete_ida"].fillna(0)
-        + df["frete_volta"].fillna(0)
-        + df["frete_extra"].fillna(0)
-    )
+    """Consolida KPIs mensais (robusto a datas vazias), sem alterar os DataFrames recebidos."""
+
+    # ───── 1. KPIs de viagens ─────────────────────────────────────
+    viagens = pd.DataFrame({
+        "data_ida": df_viagem["data_ida"],
+        "soma_frete_row": (
+            df_viagem["frete_ida"].fillna(0)
+            + df_viagem["frete_volta"].fillna(0)
+            + df_viagem["frete_extra"].fillna(0)
+        ),
+        "lucro_bruto": df_viagem["lucro_bruto"],
+        "km_total": df_viagem["km_total"],
+    })
     historico_mensal = (
-        df.groupby(pd.Grouper(key="data_ida", freq="M"))
+        viagens.groupby(pd.Grouper(key="data_ida", freq="M"))
           .agg(soma_fretes=("soma_frete_row", "sum"),
                lucro_bruto=("lucro_bruto", "sum"),
                km_total   =("km_total",    "sum"))
           .reset_index()
     )
 
-    # ───── 3. Despesas viagem/fixas via RESAMPLE ─────────────────
+    # ───── 2. Despesas de viagem por mês (datas sanitizadas) ───────
     despesas_viagem_mensal = (
-        df_desp_viagem
+        pd.DataFrame({
+            "data": pd.to_datetime(df_desp_viagem["data"], errors="coerce"),
+            "valor": df_desp_viagem["valor"],
+        })
+            .dropna(subset=["data"])
             .resample("M", on="data")["valor"]
             .sum()
             .reset_index(name="despesa_total_viagem")
     )
 
-    def _is_imposto(cat: pd.Series) -> pd.Series:
-        return cat.str.upper().isin(["IMPOSTO", "DETRAN"])
-
+    # ───── 3. Despesas fixas: flags is_imposto / is_capex + somas nativas ─
+    is_imposto = _marcar_categorias(df_desp_fixas["categoria"], config.CATEGORIAS_IMPOSTO)
+    is_capex   = _marcar_categorias(df_desp_fixas["categoria"], [config.CATEGORIA_CAPEX])
+    valor = df_desp_fixas["valor"]
     despesas_fixas_mensal = (
-        df_desp_fixas
+        pd.DataFrame({
+            "data": pd.to_datetime(df_desp_fixas["data"], errors="coerce"),
+            "despesa_fixa_total": valor,
+            "despesa_livre_impostos": valor.where(~is_imposto, 0),
+            "capex": valor.where(is_capex, 0),
+        })
+            .dropna(subset=["data"])
             .resample("M", on="data")
-            .agg(despesa_fixa_total=("valor", "sum"),
-                 despesa_livre_impostos=("valor",
-                     lambda x: x[~_is_imposto(df_desp_fixas.loc[x.index, "categoria"])].sum()),
-                 capex=("valor",
-                     lambda x: x[df_desp_fixas.loc[x.index, "categoria"]
-                                   .str.upper().eq("PRESTACAO")].sum()))
+            .sum()
             .reset_index()
     )
 
@@ -167,9 +659,14 @@ def processar_dados_historicos(df_viagem,
 
     return hist.fillna(0)
 
+def _contagem(df):
+    """Agregação que conta linhas; nas células de utils_cubo.CuboMensal soma a coluna `qtd`."""
+    return ("qtd", "sum") if "qtd" in df.columns else ("categoria", "count")
+
 def preparar_df_manutencao_por_veiculo(df_viagem, df_fixas):
     """
-    Retorna a quantidade de manutenções por veículo E CATEGORIA.
+    Retorna a quantidade de manutenções por veículo E CATEGORIA
+    (aceita também as células do cubo mensal).
     """
     # Categorias de manutenção (case insensitive)
     categorias_viagem = config.CATEGORIAS_MANUTENCAO_VIAGEM
@@ -178,16 +675,16 @@ def preparar_df_manutencao_por_veiculo(df_viagem, df_fixas):
     # Processa despesas de viagem
     manut_viagem = (
         df_viagem[df_viagem["categoria"].str.lower().isin(categorias_viagem)]
-        .groupby(["veiculo", "categoria"])
-        .agg(qtd_manutencoes=("categoria", "count"))
+        .groupby(["veiculo", "categoria"], observed=True)
+        .agg(qtd_manutencoes=_contagem(df_viagem))
         .reset_index()
     )
 
     # Processa despesas fixas
     manut_fixas = (
         df_fixas[df_fixas["categoria"].str.lower().isin(categorias_fixas)]
-        .groupby(["veiculo", "categoria"])
-        .agg(qtd_manutencoes=("categoria", "count"))
+        .groupby(["veiculo", "categoria"], observed=True)
+        .agg(qtd_manutencoes=_contagem(df_fixas))
         .reset_index()
     )
 
@@ -233,7 +730,7 @@ def preparar_df_manutencao_ao_longo_do_tempo(df_viagem, df_fixas):
     return df_final[["data", "qtd_total"]].rename(columns={"qtd_total": "qtd_manutencoes"})
 
 def preparar_df_manutencao_vs_km(df):
-    return df.groupby("veiculo").agg(
+    return df.groupby("veiculo", observed=True).agg(
         valor=("valor", "sum"),
         km_total=("km_total", "sum"),
         qtd_manutencoes=("categoria", "count")
@@ -254,7 +751,7 @@ def preparar_df_consumo_km_por_litro(df_viagens):
     )
     
     return (
-        df_filtrado.groupby("veiculo")
+        df_filtrado.groupby("veiculo", observed=True)
         .agg(km_por_litro=("km_por_litro", "mean"))
         .reset_index()
     )
@@ -268,7 +765,7 @@ def preparar_df_preco_medio_combustivel(df):
 
 def preparar_df_custo_combustivel_por_km(df):
     df_comb = df[df["categoria"].str.contains("COMBUSTIVEL", case=False, na=False)].copy()
-    return df_comb.groupby("veiculo").agg(
+    return df_comb.groupby("veiculo", observed=True).agg(
         custo_comb_km=(lambda d: d["valor"].sum() / d["km_abastecimento"].replace(0, pd.NA).sum())
     ).reset_index()
     
@@ -311,18 +808,18 @@ def preparar_df_eficiencia_motoristas(df_viagens, df_desp_viagem, df_desp_fixas)
     # 3. Calcular custos fixos proporcionais por motorista
     uso_veiculos = (
         df_viagens
-        .groupby(['veiculo', 'motorista'])
+        .groupby(['veiculo', 'motorista'], observed=True)
         .size()
         .reset_index(name='viagens_por_veiculo')
     )
 
     custos_fixos_proporcionais = (
         df_desp_fixas
-        .groupby('veiculo', as_index=False)
+        .groupby('veiculo', as_index=False, observed=True)
         .agg(custo_fixo_total=('valor', 'sum'))
         .merge(uso_veiculos, on='veiculo')
         .assign(custo_fixo_proporcional=lambda x: 
-            x['custo_fixo_total'] * x['viagens_por_veiculo'] / x.groupby('veiculo')['viagens_por_veiculo'].transform('sum'))
+            x['custo_fixo_total'] * x['viagens_por_veiculo'] / x.groupby('veiculo', observed=True)['viagens_por_veiculo'].transform('sum'))
         .groupby('motorista', as_index=False)
         .agg(custo_fixo=('custo_fixo_proporcional', 'sum'))
     )
@@ -1,3 +1,5 @@
+import os
+
 # Caminhos de arquivos CSV de dados brutos (utilizados em captacao_e_geracao_dados.carregar_dados_brutos)
 DESPESAS_VIAGEM_FILE = "reinan_costa_despesas_de_viagem_db.csv"      # Despesas variáveis de viagem
 DESPESAS_FIXAS_FILE = "reinan_costa_despesas_fixas_db.csv"           # Despesas fixas mensais
@@ -5,6 +7,66 @@ MOTORISTA_FILE = "reinan_costa_motorista_db.csv"                     # Dados dos
 VEICULO_FILE = "reinan_costa_veiculo_db.csv"                         # Dados dos veículos
 VIAGEM_COMPLETA_FILE = "reinan_costa_viagem_completa.csv"            # Dados completos das viagens
 
+# Cache colunar em disco dos CSVs brutos (utilizado em captacao_e_geracao_dados.carregar_dados_brutos)
+USAR_CACHE_COLUNAR = True                     # Desative para sempre reler os CSVs
+CACHE_COLUNAR_DIR  = ".cache_dados"           # Pasta dos arquivos Parquet (ou pickle, sem pyarrow) + metadados
+# Esquema de tipos das tabelas brutas (aplicado em captacao_e_geracao_dados.ler_tabela)
+#   "category:<domínio>" → categórica com categorias comuns a todas as colunas do domínio (joins por código)
+#   "int32"/"float32"    → só onde não há perda (km inteiro; com nulos fica em float32, exato até 16 milhões)
+#   dinheiro, litros e preços seguem em float64: entram em somas exibidas ao centavo
+ESQUEMA_TABELAS = {
+    "despesas_viagem": {
+        "descricao": "category", "data": "datetime64[ns]", "categoria": "category",
+        "pago_por": "category", "km_abastecimento": "float32",
+        "viagem_id": "category:viagem", "veiculo_id": "category:veiculo",
+    },
+    "despesas_fixas": {
+        "descricao": "category", "data": "datetime64[ns]", "categoria": "category",
+        "veiculo_id": "category:veiculo",
+    },
+    "motorista": {"id": "category:motorista"},
+    "veiculo": {"id": "category:veiculo", "placa": "category"},
+    "viagem": {
+        "id": "category:viagem", "data_ida": "datetime64[ns]", "data_volta": "datetime64[ns]",
+        "status": "category", "veiculo_id": "category:veiculo", "motorista_id": "category:motorista",
+        "km_inicial": "int32", "km_total": "int32", "km_final": "float32",
+    },
+}
+USAR_SNAPSHOT_ENRIQUECIDO = True              # Persiste o resultado de enriquecer_dados e só enriquece linhas anexadas
+LEITURA_EM_LOTES_DESPESAS_VIAGEM = False      # Lê as despesas de viagem em lotes (categóricas, mesmo esquema) com pré-agregação
+TAMANHO_LOTE_CSV = 250_000                    # Linhas por lote na leitura em lotes
+
+# Recarga automática quando os CSVs mudam (utilizada em captacao_e_geracao_dados.MonitorFontes)
+INTERVALO_MONITOR_FONTES_S = 2                # Intervalo mínimo entre leituras dos mtimes (mudança aceita após 2 leituras iguais)
+RECARGA_AUTOMATICA_DADOS = True               # O dashboard verifica as fontes nesse intervalo e recarrega sozinho
+
+# Cache em memória dos recortes da sidebar (utilizado em dashboard.py via utils_filtro.CacheLRU)
+CACHE_FILTROS_MAX_ENTRADAS = 16               # Seleções distintas guardadas (dados filtrados, anomalias e métricas)
+USAR_VALIDACAO_INCREMENTAL = True             # Anomalias validadas só nas linhas novas (estado em CACHE_COLUNAR_DIR/anomalias.json)
+RENDERIZACAO_PREGUICOSA_ABAS = True           # Só a aba escolhida é calculada a cada rerun (abas viram um seletor horizontal)
+USAR_CUBO_MENSAL = True                       # Somas mensais das abas saem do cubo (utils_cubo) quando o período não corta um mês ao meio
+
+# Cache das figuras Plotly (utilizado em dashboard_helper.figura_em_cache)
+USAR_CACHE_FIGURAS = True                     # Reaproveita figuras enquanto dados e argumentos do gráfico não mudarem
+CACHE_FIGURAS_MAX_ENTRADAS = 64               # Figuras guardadas (LRU)
+CACHE_FIGURAS_MAX_MB = 200                    # Limite de memória estimada do cache de figuras
+MAX_PONTOS_SERIE = 500                        # Pontos por série nos gráficos temporais (resolução D/W/M automática + LTTB)
+
+# Perfil de execução por etapa (utilizado em utils_perfil; também ligado por DASHBOARD_PERFIL=1)
+PERFIL_ATIVO = False                          # Mede tempo e memória de carga, filtros, validação, métricas e abas
+PERFIL_ARQUIVO_LOG = os.path.join(CACHE_COLUNAR_DIR, "perfil.jsonl")  # Uma linha JSON por rerun medido
+USUARIOS_ADMIN = ["reinan"]                   # Usuários que veem o painel de perfil na sidebar
+
+# API HTTP/JSON local de métricas (utilizada em api_metricas.py)
+API_HOST = "127.0.0.1"                        # Interface de escuta (só local por padrão)
+API_PORTA = 8510                              # Porta do serviço
+API_CACHE_MAX_ENTRADAS = 64                   # Seleções de filtros com respostas guardadas (LRU)
+API_WORKERS = 2                               # Threads que calculam respostas fora do laço assíncrono
+
+# Armazenamento das tabelas (utilizado em dashboard.py via utils_sqlite.IndiceSQLite)
+BACKEND_DADOS = "memoria"                     # "memoria" (CSVs em DataFrames) ou "sqlite" (filtros e KPIs em SQL)
+SQLITE_ARQUIVO = os.path.join(CACHE_COLUNAR_DIR, "frota.sqlite")  # Banco local com as cinco tabelas, índices e visões enriquecidas
+
 # Credenciais de login (utilizadas na função de autenticação em dashboard.py)
 USUARIOS = {
     "carlos": "110712",
@@ -56,3 +118,7 @@ DEFAULT_CONFIG = {
 
 NOTA_BASE           = 0.50  # Pontuação base (baseline) para nota de desempenho do motorista
 PESO_NOTA_ADICIONAL = 0.50  # Peso da parcela variável da nota (somado à NOTA_BASE totaliza 1.0 na nota máxima)
+
+# Simulação de cenários de comissão (utilizada em simulacao_comissao.py)
+SIMULACAO_PROCESSOS = None                    # Processos do pool (None = um por núcleo da CPU)
+SIMULACAO_CENARIOS_POR_TAREFA = 50            # Cenários avaliados por tarefa enviada a um processo
@@ -6,8 +6,12 @@ import plotly.graph_objects as go
 import captacao_e_geracao_dados as cgd
 import dashboard_helper as dh
 import calculos_e_formulas as calculos
-from utils_validacao import checar_anomalias
+from utils_validacao import checar_anomalias, EstadoAnomalias
 from utils_comissao import calcular_comissao
+import utils_filtro as uf
+import utils_perfil as perfil
+import utils_sqlite
+import utils_cubo
 import config
 import unicodedata
 
@@ -40,6 +44,7 @@ def _autenticar():
 
     if user in USUARIOS and pwd == USUARIOS[user]:
         st.session_state.autenticado = True
+        st.session_state.usuario = user
     else:
         st.session_state.erro_login = True
 
@@ -58,20 +63,63 @@ if not st.session_state.autenticado:
 # ──────────────────────────────────────────────────────────────
 
 st.set_page_config(page_title="Dashboard", layout="wide")
+perfil.iniciar_execucao()  # sem efeito com o perfil desligado (ver utils_perfil)
 
-@st.cache_data
-def carregar_dados():
-    """Carrega e processa todos os dados necessários"""
-    dados_brutos = cgd.carregar_dados_brutos()
-    dados_processados = cgd.enriquecer_dados(*dados_brutos)
-    return dados_processados
+@st.cache_resource
+def obter_monitor_fontes():
+    """Monitor dos CSVs compartilhado entre sessões (ver cgd.MonitorFontes)."""
+    return cgd.MonitorFontes()
 
-dados_carregados = carregar_dados()
+monitor_fontes = obter_monitor_fontes()
+versao_dados = monitor_fontes.verificar()
+
+@st.cache_resource(max_entries=2)
+def carregar_dados(versao):
+    """
+    Carrega e processa todos os dados necessários (e a linhagem do snapshot que os originou)
+    da `versao` das fontes; numa versão nova, só as tabelas alteradas são relidas e só as
+    linhas anexadas são enriquecidas (caches em disco de cgd).
+    As tabelas são o mesmo objeto em todas as execuções e sessões (índice, cubo e recortes
+    as compartilham, sem cópia por rerun): somente leitura.
+    """
+    return cgd.carregar_dados_enriquecidos(), cgd.linhagem_dados()
+
+# com config.BACKEND_DADOS = "sqlite" as tabelas completas ficam no banco e só os recortes são lidos
+usar_sqlite = config.BACKEND_DADOS == "sqlite"
+with perfil.etapa("carregar_dados"):
+    dados_carregados, linhagem_dados = (None, None) if usar_sqlite else carregar_dados(versao_dados)
+
+@st.cache_resource
+def obter_estado_anomalias():
+    """Estado incremental da validação, compartilhado entre sessões (ver utils_validacao.EstadoAnomalias)."""
+    return EstadoAnomalias()
 
 # ============================
 # 6. Filtros
 # ============================
 
+@st.cache_resource(max_entries=2)
+def carregar_indice_filtros(_data_dict, versao):
+    """Índice dos filtros, construído uma vez por versão dos dados (não é copiado a cada rerun)."""
+    if usar_sqlite:
+        return utils_sqlite.IndiceSQLite()  # sincroniza no banco só as tabelas alteradas
+    return uf.IndiceFiltros(_data_dict)
+
+@st.cache_resource
+def obter_cache_filtros():
+    """Cache LRU compartilhado: dados filtrados, anomalias e métricas por seleção da sidebar."""
+    return uf.CacheLRU(config.CACHE_FILTROS_MAX_ENTRADAS)
+
+cache_filtros = obter_cache_filtros()
+
+def obter_indice_filtros(data_dict):
+    """Índice da versão atual dos dados (reconstruído se as tabelas não baterem com o índice em cache)."""
+    indice = carregar_indice_filtros(data_dict, versao_dados)
+    if not indice.compativel(data_dict):
+        indice = uf.IndiceFiltros(data_dict)
+    return indice
+
+@perfil.medir()
 def filtrar_dados_completos(data_dict, filter_future=True):
     """
     Applies unified filtering across all data sources with relationships maintained
@@ -81,39 +129,27 @@ def filtrar_dados_completos(data_dict, filter_future=True):
         filter_future (bool): Whether to exclude future dates
     
     Returns:
-        dict: Filtered DataFrames
+        tuple: (Filtered DataFrames, cache key of the selection, filters passed to the index).
+        The DataFrames are shared through cache_filtros and must be treated as read-only.
     """
-    # 1. Get unified filter values from all sources
-    all_vehicles = pd.concat([
-        data_dict["viagens"]["veiculo"],
-        data_dict["despesas_fixas"]["veiculo"]
-    ]).dropna().unique()
-    
-    all_drivers = data_dict["viagens"]["motorista"].dropna().unique()
-    
-    # 2. Create unified filters
+    indice = obter_indice_filtros(data_dict)
+
+    # 1. Create unified filters (options come from the prebuilt index)
     selected_vehicles = st.sidebar.multiselect(
         "Veículos", 
-        options=all_vehicles,
+        options=indice.veiculos,
         placeholder="Todos veículos"
     )
     
     selected_drivers = st.sidebar.multiselect(
         "Motoristas",
-        options=all_drivers,
+        options=indice.motoristas,
         placeholder="Todos motoristas"
     )
     
-    # 3. Date range (using most inclusive dates)
-    min_date = min(
-        data_dict["viagens"]["data_ida"].min(),
-        data_dict["despesas_fixas"]["data"].min()
-    ).date()
-    
-    max_date = max(
-        data_dict["viagens"]["data_volta"].max(),
-        data_dict["despesas_fixas"]["data"].max()
-    ).date()
+    # 2. Date range (using most inclusive dates)
+    min_date = indice.data_min.date()
+    max_date = indice.data_max.date()
     
     date_range = st.sidebar.date_input(
         "Período",
@@ -122,61 +158,43 @@ def filtrar_dados_completos(data_dict, filter_future=True):
         max_value=max_date
     )
     
-    # 4. Future data toggle
+    # 3. Future data toggle
+    incluir_futuras = True
     if filter_future:
         incluir_futuras = st.sidebar.toggle(
             "Incluir dados futuros?",
             value=False
         )
     
-    # 5. Apply filters to each DataFrame
-    filtered_data = {}
-    
-    # Filter trips first (will affect travel expenses)
-    mask_viagem = pd.Series(True, index=data_dict["viagens"].index)
-    
-    if selected_vehicles:
-        mask_viagem &= data_dict["viagens"]["veiculo"].isin(selected_vehicles)
-    if selected_drivers:
-        mask_viagem &= data_dict["viagens"]["motorista"].isin(selected_drivers)
-    if len(date_range) == 2:
-        inicio, fim = map(pd.to_datetime, date_range)
-        mask_viagem &= data_dict["viagens"]["data_ida"].between(inicio, fim)
-    if filter_future and not incluir_futuras:
-        mask_viagem &= (data_dict["viagens"]["data_ida"] <= pd.Timestamp.now())
-    
-    filtered_data["viagens"] = data_dict["viagens"][mask_viagem].copy()
-    
-    # Filter travel expenses based on filtered trips
-    filtered_data["despesas_viagem"] = data_dict["despesas_viagem"][
-        data_dict["despesas_viagem"]["viagem_id"].isin(filtered_data["viagens"]["id"])
-    ].copy()
-    
-    # Filter fixed expenses
-    mask_fixas = pd.Series(True, index=data_dict["despesas_fixas"].index)
-    
-    if selected_vehicles:
-        mask_fixas &= data_dict["despesas_fixas"]["veiculo"].isin(selected_vehicles)
-    if len(date_range) == 2:
-        inicio, fim = map(pd.to_datetime, date_range)
-        mask_fixas &= data_dict["despesas_fixas"]["data"].between(inicio, fim)
-    if filter_future and not incluir_futuras:
-        mask_fixas &= (data_dict["despesas_fixas"]["data"] <= pd.Timestamp.now())
-    
-    filtered_data["despesas_fixas"] = data_dict["despesas_fixas"][mask_fixas].copy()
-    
-    return filtered_data
+    # 4. Resolve filters through the index (trips drive travel expenses),
+    #    memoized by the normalized selection + dataset version
+    filtros = dict(
+        veiculos=selected_vehicles,
+        motoristas=selected_drivers,
+        periodo=date_range,
+        incluir_futuras=incluir_futuras,
+        agora=pd.Timestamp.now(),
+    )
+    chave = (versao_dados, indice.assinatura(**filtros))
+    filtered_data = cache_filtros.obter(chave, "dados", lambda: indice.filtrar(data_dict, **filtros))
+    return filtered_data, chave, filtros
 
 with st.sidebar:
     st.header("🔍 Filtros Integrados")
-    dados_filtrados = filtrar_dados_completos(dados_carregados)
+    dados_filtrados, chave_filtros, filtros_sidebar = filtrar_dados_completos(dados_carregados)
     
 # ============================
 # 5.1. Validacao
 # ============================
 with st.sidebar:
     st.header("🔔 Qualidade dos Dados")
-    avisos = checar_anomalias(dados_filtrados)
+    with perfil.etapa("validacao"):
+        if config.USAR_VALIDACAO_INCREMENTAL and not usar_sqlite:
+            # valida só as linhas novas da base completa e cruza com o recorte atual
+            estado_anomalias = obter_estado_anomalias().atualizar(dados_carregados, linhagem_dados)
+            avisos = cache_filtros.obter(chave_filtros, "avisos", lambda: estado_anomalias.relatorio(dados_filtrados))
+        else:
+            avisos = cache_filtros.obter(chave_filtros, "avisos", lambda: checar_anomalias(dados_filtrados))
     if avisos:
         for a in avisos:
             container = {
@@ -201,98 +219,73 @@ def calcular_metricas_gerais(df_viagens, df_desp_viagem, df_desp_fixa):
     """
     Consolida todos os indicadores financeiros e operacionais,
     já ordenados por correlação (do mais fundamental ao derivado).
+    (ver calculos.MetricasEngine)
     """
-    # ────────────────────────────────────────────
-    # Pré-cálculos fundamentais (usados por vários KPIs)
-    # ────────────────────────────────────────────
-    km_total           = calculos.km_total(df_viagens)
-    receita_bruta_tot  = calculos.calcular_receita_bruta(df_viagens)
-    custo_var_tot      = calculos.custo_variavel_total(df_desp_viagem)
-    custo_fixo_tot     = calculos.despesa_fixa_total(df_desp_fixa)
-    lucro_bruto_tot    = receita_bruta_tot - custo_var_tot
-    lucro_liq_tot      = lucro_bruto_tot - custo_fixo_tot
-
-    # Séries mensais (DataFrame)
-    df_lucro_mensal = calculos.calcular_faturamento_por_mes(
-        df_viagens, df_desp_viagem, df_desp_fixa
+    return calculos.MetricasEngine(df_viagens, df_desp_viagem, df_desp_fixa).calcular()
+
+def obter_motor_metricas():
+    """Motor de métricas do recorte, reaproveitado nos recortes por viagem (aba1); criado só quando usado."""
+    return cache_filtros.obter(chave_filtros, "motor", lambda: calculos.MetricasEngine(
+        dados_filtrados['viagens'], 
+        dados_filtrados['despesas_viagem'], 
+        dados_filtrados['despesas_fixas']
+    ))
+
+with perfil.etapa("calcular_metricas_gerais"):
+    if usar_sqlite:
+        # somas e contagens dos KPIs feitas no banco (ver utils_sqlite.IndiceSQLite.metricas_gerais)
+        indice_sqlite = obter_indice_filtros(dados_carregados)
+        metricas_gerais = cache_filtros.obter(
+            chave_filtros, "metricas_gerais", lambda: indice_sqlite.metricas_gerais(**filtros_sidebar))
+    else:
+        metricas_gerais = cache_filtros.obter(chave_filtros, "metricas_gerais", obter_motor_metricas().calcular)
+
+def obter_metricas_veiculo():
+    """RPK, CPK, EBITDA, CAPEX etc. por placa (aba3 e aba4), calculados só quando uma delas é desenhada."""
+    return cache_filtros.obter(
+        chave_filtros, "metricas_veiculo",
+        lambda: calculos.metricas_por_dimensao(dados_filtrados, "veiculo")
     )
 
-    # ────────────────────────────────────────────
-    # Métricas agrupadas por “grau de parentesco”
-    # ────────────────────────────────────────────
-    metricas = {
-
-        # 1️⃣  Totais de volume e uso
-        "km_total":                    km_total,
-        "total_viagens":               calculos.total_viagens(df_viagens),
-        "litros_combustivel_total":    calculos.litros_combustivel_total(df_viagens),
-
-        # 2️⃣  Totais financeiros brutos
-        "receita_bruta_total":         receita_bruta_tot,
-        "custo_variavel_total":        custo_var_tot,
-        "custo_fixo_total":            custo_fixo_tot,
-
-        # 3️⃣  Lucros agregados
-        "lucro_bruto_total":           lucro_bruto_tot,
-        "lucro_liquido_total":         lucro_liq_tot,
-        "lucro_liquido_mensal_df":     df_lucro_mensal,            # dataframe inteiro
-        "lucro_liquido_mensal_total":  df_lucro_mensal["lucro_liquido"].sum(),
-
-        # 4️⃣  Indicadores de margem / eficiência global
-        "margem_lucro_liquido_%":      calculos.calcular_margem_lucro_liquido(
-                                           lucro_liq_tot, receita_bruta_tot),
-        "cpk_completo":                calculos.calcular_cpk(df_viagens, custo_fixo_tot),
-        "cpk_sem_capex":               calculos.calcular_cpk_sem_capex(
-                                           df_desp_viagem, df_desp_fixa, km_total),
-        "rpk":                         calculos.calcular_rpk(receita_bruta_tot, km_total),
-        "margem_lucro_por_km":         calculos.calcular_margem_por_km(
-                                           receita_bruta_tot,
-                                           custo_var_tot + custo_fixo_tot,
-                                           km_total),
-        "ebitda":                      calculos.calcular_ebitda(lucro_liq_tot, df_desp_fixa),
-
-        # 5️⃣  Custos / receitas unitários
-        "custo_combustivel_km":        calculos.calcular_custo_combustivel_por_km(
-                                           df_desp_viagem, km_total),
-        "custo_manutencao_km":         calculos.calcular_custo_manutencao_por_km(
-                                           df_desp_viagem, df_desp_fixa, km_total),
-        "custo_pneus_km":              calculos.calcular_custo_pneus_por_km(
-                                           df_desp_viagem, km_total),
-
-        # 6️⃣  Médias por viagem / consumo
-        "consumo_medio_km_l":          calculos.calcular_consumo_km_por_litro(df_viagens),
-        "receita_media_por_viagem":    calculos.calcular_receita_media_por_viagem(df_viagens),
-        "despesa_media_por_viagem":    calculos.calcular_despesa_media_por_viagem(
-                                           df_desp_viagem, df_viagens),
-        "preco_medio_combustivel":     df_desp_viagem["preco_combustivel"].mean(),
-        "media_tempo_ocioso_por_mes": calculos.calcular_idle_medio(df_viagens),
-
-        # 7️⃣  Manutenção / CAPEX
-        "capex_total":                 calculos.capex(df_desp_fixa),
-        "total_manutencoes":           calculos.custo_manut(df_desp_fixa, df_desp_viagem),
-        "frequencia_manutencao":       calculos.calcular_frequencia_manutencao(
-                                           df_desp_viagem, df_desp_fixa),
-
-        # 8️⃣  Gastos diretos com pessoal
-        "gasto_empresa_total":         calculos.gasto_empresa_total(df_viagens),
-        "gasto_motorista_total":       calculos.gasto_motorista_total(df_viagens),
-        "troco_total":                 calculos.troco_total(df_viagens),
-    }
-
-    # ────────────────────────────────────────────
-    # Arredondamento de valores numéricos
-    # ────────────────────────────────────────────
-    for k, v in metricas.items():
-        if isinstance(v, (int, float)):
-            metricas[k] = round(v, 2) if not pd.isna(v) else 0
-
-    return metricas
-
-metricas_gerais = calcular_metricas_gerais(
-    dados_filtrados['viagens'], 
-    dados_filtrados['despesas_viagem'], 
-    dados_filtrados['despesas_fixas']
-)
+@st.cache_resource(max_entries=2)
+def carregar_cubo_mensal(_data_dict, versao):
+    """
+    Cubo mês × veículo × motorista × categoria, construído uma vez por versão dos dados;
+    na leitura em lotes, as despesas de viagem vêm do pré-agregado da leitura.
+    """
+    agregado = cgd.carregar_agregados_despesas_viagem() if config.LEITURA_EM_LOTES_DESPESAS_VIAGEM else None
+    return utils_cubo.CuboMensal(_data_dict, agregado)
+
+def dados_mensais():
+    """
+    Células do cubo mensal no recorte da sidebar (mesmas colunas, datas no fim do mês) ou,
+    se o período corta um mês ao meio, os próprios dados filtrados. Só para contas que somam.
+    """
+    if not config.USAR_CUBO_MENSAL or dados_carregados is None:
+        return dados_filtrados
+    celulas = cache_filtros.obter(chave_filtros, "cubo_mensal", lambda: (
+        carregar_cubo_mensal(dados_carregados, versao_dados).recortar(**filtros_sidebar)
+    ))
+    return dados_filtrados if celulas is None else celulas
+
+with st.sidebar:
+    stats = cache_filtros.estatisticas()
+    st.caption(f"Cache de filtros: {stats['acertos']} acertos / {stats['falhas']} falhas")
+    stats = dh.cache_figuras.estatisticas()
+    st.caption(f"Cache de figuras: {stats['acertos']} acertos / {stats['falhas']} falhas ({stats['mb']} MB)")
+    if monitor_fontes.versao:
+        st.caption(f"Dados recarregados às {monitor_fontes.momento:%H:%M:%S} "
+                   f"(versão {monitor_fontes.versao}: {', '.join(monitor_fontes.alteradas)})")
+
+if config.RECARGA_AUTOMATICA_DADOS:
+    @st.fragment(run_every=config.INTERVALO_MONITOR_FONTES_S)
+    def monitorar_fontes():
+        """Roda sozinho a cada intervalo; recarrega a página quando há uma nova versão dos CSVs."""
+        if monitor_fontes.verificar() != versao_dados:
+            st.rerun()
+
+    with st.sidebar:
+        monitorar_fontes()
 
 # ============================
 # 6. Estilização para Relatório
@@ -314,32 +307,41 @@ def bar_with_sign(df, x, y, title, labels, text_fmt="%{y:.2f}"):
 # 7. Relatórios
 # ============================
 
-aba1, aba2, aba3, aba4, aba5, aba6, aba7, aba8 = st.tabs([
-    "Relatório de Viagem",
-    "Lucro de Viagem por Mês",
-    "Análise Financeira",
-    "Análise Operacional",
-    "Custos Detalhados",
-    "Manutenção Detalhada",
-    "Combustível Detalhado",
-    "Calculadora de Comissão"
-])
+# Cada aba é uma função registrada em ABAS, na ordem de exibição; com
+# config.RENDERIZACAO_PREGUICOSA_ABAS só a aba escolhida é executada no rerun
+ABAS = {}
+
+def aba(titulo):
+    """Registra a função que desenha a aba `titulo`."""
+    def registrar(renderizar):
+        ABAS[titulo] = renderizar
+        return renderizar
+    return registrar
 
 # ============================
 # 7. Relatórios
 # ============================
-with aba1:  # Relatório de Viagem
+@aba("Relatório de Viagem")
+def renderizar_relatorio_viagem():
     st.header("Relatório Individual de Viagem")
 
-    opcoes = dados_filtrados["viagens"][["identificador", "id"]]
-    sel = st.selectbox("Selecione a Viagem", opcoes["identificador"])
-    if sel:
-        vid = opcoes.loc[opcoes["identificador"] == sel, "id"].iloc[0]
-        df_v = dados_filtrados["viagens"].query("id == @vid")
-        df_dv = dados_filtrados["despesas_viagem"].query("viagem_id == @vid")
+    # a viagem é escolhida pela posição no recorte (sem comparar identificadores); a chave do
+    # widget muda com o recorte, para a posição antiga não apontar para outra viagem
+    identificadores = dados_filtrados["viagens"]["identificador"].to_numpy()
+    pos = st.selectbox("Selecione a Viagem", options=range(len(identificadores)),
+                       format_func=lambda i: identificadores[i], key=f"sel_viagem:{hash(chave_filtros)}")
+    if pos is not None:
+        pos_v = [pos]
+        df_v = dados_filtrados["viagens"].iloc[pos_v]
+        vid = df_v["id"].iloc[0]
+        # despesas da viagem pelo índice viagem → despesas (rótulo = posição na base completa)
+        pos_dv = obter_indice_filtros(dados_carregados).despesas_no_recorte(
+            dados_filtrados["despesas_viagem"], df_v.index
+        )
+        df_dv = dados_filtrados["despesas_viagem"].take(pos_dv)
         r = df_v.iloc[0]
 
-        met = calcular_metricas_gerais(df_v, df_dv, dados_filtrados["despesas_fixas"])
+        met = cache_filtros.obter(chave_filtros, f"metricas_viagem:{vid}", lambda: obter_motor_metricas().calcular(pos_v, pos_dv))
         rep = {
             **met,
             **{k: (float(r.get(k)) if pd.notna(r.get(k)) else 0.0) for k in [
@@ -413,7 +415,7 @@ with aba1:  # Relatório de Viagem
             st.info("Nenhuma despesa variável registrada.")
         else:
             # Agrupa despesas por categoria
-            df_cat = df_dv.groupby("categoria", as_index=False)["valor"].sum()
+            df_cat = df_dv.groupby("categoria", as_index=False, observed=True)["valor"].sum().astype({"categoria": object})
             
             # Interface para usuário selecionar as categorias que quer ver
             categorias_disponiveis = df_cat["categoria"].unique().tolist()
@@ -442,54 +444,29 @@ with aba1:  # Relatório de Viagem
                 
                 st.plotly_chart(fig, use_container_width=True)
             
-with aba2: #Lucro de Viagem por mês
+@aba("Lucro de Viagem por Mês")
+def renderizar_lucro_mensal():
     st.header("Visão Geral do Mês da Frota")
 
-    # 1. Prepara dados com mês e ano
-    df_v = dados_filtrados['viagens'].copy()
-    df_v['mes'] = df_v['data_ida'].dt.month
-    df_v['ano'] = df_v['data_ida'].dt.year
-    
-    df_var = dados_filtrados['despesas_viagem'].copy()
-    df_var['mes'] = df_var['data_viagem'].dt.month
-    df_var['ano'] = df_var['data_viagem'].dt.year
-
-    df_f = dados_filtrados['despesas_fixas'].copy()
-    df_f['mes'] = df_f['data'].dt.month
-    df_f['ano'] = df_f['data'].dt.year
-
-    # 2. Calcula Lucro Bruto e Despesa Fixa por ano, mês e veículo
-    df_rec = (
-        df_v
-        .groupby(['ano','mes','veiculo'])
-        .apply(lambda g: calculos.calcular_receita_bruta(g))
-        .reset_index(name='Receita Bruta')
-    )
-    
-    df_var_group = (
-        df_var
-        .groupby(['ano','mes','veiculo'])
-        .apply(lambda g: calculos.custo_variavel_total(g))
-        .reset_index(name='Despesa Variável')
-    )
-
-    df_fix = (
-        df_f
-        .groupby(['ano','mes','veiculo'])
-        .apply(lambda g: calculos.despesa_fixa_total(g))
-        .reset_index(name='Despesa Fixa')
-    )
-    
-    df_kpi = (
-        df_rec
-        .merge(df_var_group, on=['ano','mes','veiculo'], how='outer')
-        .merge(df_fix,       on=['ano','mes','veiculo'], how='outer')
-        .fillna(0)
-    )
-
-    # 3. Junta e calcula Lucro Líquido
-    df_kpi['Lucro Bruto']   = df_kpi['Receita Bruta'] - df_kpi['Despesa Variável']
-    df_kpi['Lucro Líquido'] = df_kpi['Lucro Bruto']    - df_kpi['Despesa Fixa']
+    # 1-3. P&L mensal por veículo (despesas de viagem pelo mês da viagem), com somas nativas
+    mensais = dados_mensais()
+    df_kpi = cache_filtros.obter(chave_filtros, "pl_mensal_veiculo", lambda: (
+        calculos.calcular_pl_mensal(
+            mensais['viagens'],
+            mensais['despesas_viagem'],
+            mensais['despesas_fixas'],
+            chaves=['veiculo'],
+            col_data_despesa_viagem='data_viagem'
+        )
+        .rename(columns={
+            'receita_bruta': 'Receita Bruta',
+            'despesa_var':   'Despesa Variável',
+            'despesa_fixa':  'Despesa Fixa',
+            'lucro_bruto':   'Lucro Bruto',
+            'lucro_liquido': 'Lucro Líquido'
+        })
+        .assign(mes=lambda d: d['data'].dt.month, ano=lambda d: d['data'].dt.year)
+    ))
 
     # 4. Cards de resumo
     total_gross = df_kpi['Lucro Bruto'].sum()
@@ -556,7 +533,8 @@ with aba2: #Lucro de Viagem por mês
     with col_left:
         st.dataframe(df_styled, use_container_width=True)
     
-with aba3:  #Análise Financeira
+@aba("Análise Financeira")
+def renderizar_analise_financeira():
     st.header("📈 Indicadores Financeiros")
 
     # Linha 2 de métricas
@@ -599,25 +577,16 @@ with aba3:  #Análise Financeira
     
     st.subheader("📋 Financeiro por Veículo")
 
-    kpis = []
-    for veic, df_v in dados_filtrados['viagens'].groupby('veiculo'):
-        df_df = dados_filtrados['despesas_fixas'].query("veiculo == @veic")
-        df_dv = dados_filtrados['despesas_viagem'].query("veiculo == @veic")
-
-        soma_fretes = calculos.calcular_receita_bruta(df_v)
-        capex      = calculos.capex(df_df)
-        lucro_liq  = calculos.calcular_lucro_liquido(df_v, df_dv, df_df)
-        ebitda     = calculos.calcular_ebitda(lucro_liq, df_df)
-        margem_pct = calculos.calcular_margem_lucro_liquido(lucro_liq, soma_fretes)
-
-        kpis.append({
-            "Placa": veic,
-            "EBITDA": ebitda,
-            "CAPEX": capex,
-            "Margem (%)": margem_pct
+    df_fin = (
+        obter_metricas_veiculo()
+        .rename(columns={
+            "veiculo": "Placa",
+            "ebitda": "EBITDA",
+            "capex": "CAPEX",
+            "margem_lucro_liquido_%": "Margem (%)"
         })
-
-    df_fin = pd.DataFrame(kpis)
+        .loc[:, ["Placa", "EBITDA", "CAPEX", "Margem (%)"]]
+    )
 
     # cores por placa
     palette = px.colors.qualitative.Plotly
@@ -646,12 +615,13 @@ with aba3:  #Análise Financeira
     with col_left:
         st.dataframe(styled, use_container_width=True)
         
+    mensais = dados_mensais()
     dh.plot_area_evolucao_financeira(
-        cgd.processar_dados_historicos(
-            dados_filtrados['viagens'],
-            dados_filtrados['despesas_viagem'],
-            dados_filtrados['despesas_fixas']
-        ),
+        cache_filtros.obter(chave_filtros, "historico", lambda: cgd.processar_dados_historicos(
+            mensais['viagens'],
+            mensais['despesas_viagem'],
+            mensais['despesas_fixas']
+        )),
         y_cols=['soma_fretes', 'despesa_total'],
         x_col="data_ida",
         stacked=False
@@ -661,7 +631,8 @@ with aba3:  #Análise Financeira
         "Passe o mouse sobre a linha para ver valores exatos."
     )
 
-with aba4:  # Análise Operacional
+@aba("Análise Operacional")
+def renderizar_analise_operacional():
     st.header("🚚 Indicadores Operacionais")
     
     col1, col2, col3, col4 = st.columns(4)
@@ -705,45 +676,35 @@ with aba4:  # Análise Operacional
     st.subheader("📊 Comparativo de Métricas por Veículo")
     st.info("💡 **Como usar:** compare CPK e Lucro/KM entre placas. O ideal é Lucro/KM maior que CPK.")
     
-    idle_dict = calculos.idle_medio_por_veiculo(dados_filtrados["viagens"])
-
-    # 1. Monta a lista de dicts com RPK, CPK, Lucro/KM e Custo Manutenção/KM por veículo
-    metricas_por_veiculo = []
-    metricas_por_veiculo = []
-    for veic, df_v in dados_filtrados['viagens'].groupby('veiculo'):
-        df_dv = dados_filtrados['despesas_viagem'].query("veiculo == @veic")
-        df_df = dados_filtrados['despesas_fixas'].query("veiculo == @veic")
-        km = calculos.km_total(df_v)
-        metricas_por_veiculo.append({
-            "Veículo": veic,
-            "RPK": calculos.calcular_rpk(calculos.calcular_receita_bruta(df_v), km),
-            "CPK": calculos.calcular_cpk(df_v, calculos.despesa_fixa_total(df_df)),
-            "Lucro/KM": calculos.calcular_lucro_liquido(df_v, df_dv, df_df) / km if km else 0,
-            "Custo Manutenção/KM": calculos.calcular_custo_manutencao_por_km(df_dv, df_df, km),
-            "Dias Ociosos": idle_dict.get(veic, 0.0)
+    idle_dict = cache_filtros.obter(
+        chave_filtros, "idle_por_veiculo", lambda: calculos.idle_medio_por_veiculo(dados_filtrados["viagens"])
+    )
+
+    # 1. RPK, CPK, Lucro/KM e Custo Manutenção/KM por veículo
+    metricas_por_veiculo = (
+        obter_metricas_veiculo()
+        .rename(columns={
+            "veiculo": "Veículo",
+            "rpk": "RPK",
+            "cpk": "CPK",
+            "lucro_por_km": "Lucro/KM",
+            "custo_manutencao_km": "Custo Manutenção/KM"
         })
+        .loc[:, ["Veículo", "RPK", "CPK", "Lucro/KM", "Custo Manutenção/KM"]]
+    )
+    metricas_por_veiculo["Dias Ociosos"] = metricas_por_veiculo["Veículo"].map(idle_dict).fillna(0.0)
 
     # 2. Transforma pra long e plota
-    dfm = pd.DataFrame(metricas_por_veiculo).melt(
+    dfm = metricas_por_veiculo.melt(
         id_vars="Veículo",
         value_vars=["Lucro/KM", "RPK", "CPK", "Custo Manutenção/KM"],
         var_name="Métrica",
         value_name="Valor"
     )
     
-    dh.plot_bar_base(
-        dfm,
-        x_col="Veículo",
-        y_col="Valor",
-        color_col="Métrica",
-        barmode="group",
-        title="Comparativo de Métricas por Veículo",
-        labels={"Valor": "R$/km", "Veículo": "Veículo"}
-    )
+    dh.plot_bar_comparativo_metricas_veiculo(dfm)
     
-    df_kpi = pd.DataFrame(metricas_por_veiculo)
-
-    df_kpi = pd.DataFrame(metricas_por_veiculo).rename(columns={"Veículo": "Placa"})
+    df_kpi = metricas_por_veiculo.rename(columns={"Veículo": "Placa"})
     unique_plates, palette = df_kpi["Placa"].unique(), px.colors.qualitative.Plotly
     plate_colors = {p: palette[i % len(palette)] for i, p in enumerate(unique_plates)}
 
@@ -777,11 +738,12 @@ with aba4:  # Análise Operacional
     
     st.subheader("📊 Eficiência dos Motoristas")
     
-    df_eficiencia_motoristas = cgd.preparar_df_eficiencia_motoristas(dados_filtrados['viagens'], dados_filtrados['despesas_viagem'], dados_filtrados['despesas_fixas'])
+    df_eficiencia_motoristas = cache_filtros.obter(chave_filtros, "eficiencia_motoristas", lambda: cgd.preparar_df_eficiencia_motoristas(dados_filtrados['viagens'], dados_filtrados['despesas_viagem'], dados_filtrados['despesas_fixas']))
     dh.plot_bar_eficiencia_motoristas(df_eficiencia_motoristas)
     st.info("💡 Eficiência é Lucro Liquido por Km Rodado. Passe o mouse sobre as barras para detalhes.")
     
-with aba5:
+@aba("Custos Detalhados")
+def renderizar_custos_detalhados():
     st.header("Detalhamento de Custo")
 
     # ────────────────────────────
@@ -794,8 +756,12 @@ with aba5:
         "Mouse em cima do bloco para detalhar."
     )
     
-    df_f_f = dados_filtrados["despesas_fixas"]
-    df_comp_fixas = df_f_f.groupby("categoria", as_index=False)["valor"].sum()
+    # composições e evolução mensal só somam: saem do cubo mensal quando possível
+    mensais = dados_mensais()
+    df_f_f = mensais["despesas_fixas"]
+    df_comp_fixas = cache_filtros.obter(chave_filtros, "composicao_fixas", lambda: (
+        df_f_f.groupby("categoria", as_index=False, observed=True)["valor"].sum().astype({"categoria": object})
+    ))
 
     cats_fixas = df_comp_fixas["categoria"].unique().tolist()
     sel_fixas = st.multiselect(
@@ -830,8 +796,10 @@ with aba5:
         "💡 Mostra a distribuição das despesas variáveis associadas às viagens."
         "Ideal para encontrar gargalos de custo."
     )
-    df_dv = dados_filtrados["despesas_viagem"]
-    df_comp_viagem = df_dv.groupby("categoria", as_index=False)["valor"].sum()
+    df_dv = mensais["despesas_viagem"]
+    df_comp_viagem = cache_filtros.obter(chave_filtros, "composicao_viagem", lambda: (
+        df_dv.groupby("categoria", as_index=False, observed=True)["valor"].sum().astype({"categoria": object})
+    ))
 
     cats_viagem = df_comp_viagem["categoria"].unique().tolist()
     sel_viagem = st.multiselect(
@@ -867,23 +835,29 @@ with aba5:
         "Passe o mouse sobre a linha para valores exatos."
     )
     # prepara séries temporais agregadas (mês)
-    df_f_f_ts = (
-        df_f_f.assign(data=pd.to_datetime(df_f_f["data"]))
-               .groupby(pd.Grouper(key="data", freq="M"))["valor"]
-               .sum()
-               .reset_index()
-               .assign(tipo="Fixas")
-    )
+    def despesas_mensais():
+        df_f_f_ts = (
+            df_f_f.assign(data=pd.to_datetime(df_f_f["data"]))
+                   .groupby(pd.Grouper(key="data", freq="M"))["valor"]
+                   .sum()
+                   .reset_index()
+                   .assign(tipo="Fixas")
+        )
 
-    df_dv_ts = (
-        df_dv.assign(data=pd.to_datetime(df_dv["data_viagem"]))
-              .groupby(pd.Grouper(key="data", freq="M"))["valor"]
-              .sum()
-              .reset_index()
-              .assign(tipo="Viagem")
-    )
+        df_dv_ts = (
+            df_dv.assign(data=pd.to_datetime(df_dv["data_viagem"]))
+                  .groupby(pd.Grouper(key="data", freq="M"))["valor"]
+                  .sum()
+                  .reset_index()
+                  .assign(tipo="Viagem")
+        )
 
-    df_ts = pd.concat([df_f_f_ts, df_dv_ts]).sort_values("data")
+        return pd.concat([df_f_f_ts, df_dv_ts]).sort_values("data")
+
+    df_ts = cache_filtros.obter(
+        chave_filtros, "despesas_mensais",
+        lambda: dh.reduzir_pontos(despesas_mensais(), "data", "valor", grupo_col="tipo")
+    )
 
     fig_tempo = px.line(
         df_ts,
@@ -897,7 +871,8 @@ with aba5:
     fig_tempo.update_layout(xaxis_tickformat="%b/%Y", hovermode="x unified")
     st.plotly_chart(fig_tempo, use_container_width=True)
     
-with aba6:  # Manutenção Detalhada 
+@aba("Manutenção Detalhada")
+def renderizar_manutencao():
     st.header("🔧 Indicadores de Manutenção")
     
     tip_ckm  = "Custo manutenção por quilômetro rodado."
@@ -929,14 +904,16 @@ with aba6:  # Manutenção Detalhada
     st.subheader("📊 Análise de Manutenção")
     st.info("💡 **Frequência por Veículo:** alta frequência pode indicar problema.")
     
-    # Gráfico de Barras (Frequência por Veículo)
+    # Gráfico de Barras (Frequência por Veículo), contado nas células do cubo mensal
+    mensais = dados_mensais()
     dh.plot_bar_freq_manutencao_por_veiculo(
-        dados_filtrados['despesas_viagem'],  # DataFrame de despesas variáveis (viagem)
-        dados_filtrados['despesas_fixas']    # DataFrame de despesas fixas
+        mensais['despesas_viagem'],  # DataFrame de despesas variáveis (viagem)
+        mensais['despesas_fixas']    # DataFrame de despesas fixas
     )
 
 
-with aba7:  # Combustível Detalhado
+@aba("Combustível Detalhado")
+def renderizar_combustivel():
     st.header("⛽ Indicadores de Combustível")
     
     tip_cons = "Km rodados por litro — quanto maior melhor."
@@ -973,19 +950,23 @@ with aba7:  # Combustível Detalhado
     st.info("💡 **Preço Médio do Litro:** entenda o impacto de aumentos no oleo diesel.")
     dh.plot_line_preco_medio_combustivel(dados_filtrados['despesas_viagem'])
 
-with aba8:
+@aba("Calculadora de Comissão")
+def renderizar_calculadora_comissao():
     st.header("💰 Calculadora de Comissão")
 
-    # escolha da viagem
-    opcoes = dados_filtrados["viagens"][["identificador", "id"]]
-    sel = st.selectbox("Selecione a Viagem", opcoes["identificador"], key="sel_viagem_comissao")
+    # escolha da viagem (posição no recorte; chave do widget por recorte, como na aba1)
+    identificadores = dados_filtrados["viagens"]["identificador"].to_numpy()
+    pos = st.selectbox("Selecione a Viagem", options=range(len(identificadores)),
+                       format_func=lambda i: identificadores[i], key=f"sel_viagem_comissao:{hash(chave_filtros)}")
 
-    if sel:
-        vid = opcoes.loc[opcoes["identificador"] == sel, "id"].iloc[0]
-        row = dados_filtrados["viagens"].loc[dados_filtrados["viagens"]["id"] == vid].iloc[0]
+    if pos is not None:
+        row = dados_filtrados["viagens"].iloc[pos]
+        vid = row["id"]
 
         # cálculo
-        detalhes = calcular_comissao(row, dados_filtrados["viagens"])
+        detalhes = cache_filtros.obter(
+            chave_filtros, f"comissao:{vid}", lambda: calcular_comissao(row, dados_filtrados["viagens"])
+        )
         
         tip_media = "Consumo médio desta viagem comparado à média histórica do veículo."
         tip_rec   = "Receita bruta da viagem dividida pelo número de dias fora de casa."
@@ -1012,4 +993,35 @@ with aba8:
         st.metric("Comissão Sugerida", f"R$ {detalhes['comissao']:.2f}", delta=None)
         st.caption(f"Parâmetros atuais: COMISSAO_MAX = R$ {config.DEFAULT_CONFIG['COMISSAO_MAXIMA']:.0f}, "
                    f"PESO_CONSUMO={config.DEFAULT_CONFIG['PESO_CONSUMO']:.0%}, PESO_RECEITA={config.DEFAULT_CONFIG['PESO_RECEITA']:.0%}, "
-                   f"Ociosidade máx. {config.DEFAULT_CONFIG['PENALIDADE_OCIOSIDADE_MAX']:.0%}.")
\ No newline at end of file
+                   f"Ociosidade máx. {config.DEFAULT_CONFIG['PENALIDADE_OCIOSIDADE_MAX']:.0%}.")
+
+# ============================
+# 8. Abas
+# ============================
+if config.RENDERIZACAO_PREGUICOSA_ABAS:
+    # só a aba visível é calculada; a escolha sobrevive aos reruns pela key
+    aba_ativa = st.radio(
+        "Relatório", list(ABAS), horizontal=True, key="aba_ativa", label_visibility="collapsed"
+    )
+    with perfil.etapa(f"aba: {aba_ativa}"):
+        ABAS[aba_ativa]()
+else:
+    for container, (titulo, renderizar) in zip(st.tabs(list(ABAS)), ABAS.items()):
+        with container, perfil.etapa(f"aba: {titulo}"):
+            renderizar()
+
+# ============================
+# 9. Perfil de execução
+# ============================
+execucao = perfil.finalizar_execucao()
+if execucao and st.session_state.get("usuario") in config.USUARIOS_ADMIN:
+    with st.sidebar.expander("⏱️ Perfil de execução"):
+        st.caption(f"Rerun: {execucao['total_ms']:.0f} ms · RSS {execucao['memoria_mb']} MB")
+        etapas = pd.DataFrame(execucao["etapas"])
+        etapas["etapa"] = ["  " * n + e for n, e in zip(etapas["nivel"], etapas["etapa"])]
+        st.dataframe(etapas[["etapa", "duracao_ms", "memoria_mb"]], hide_index=True, use_container_width=True)
+        historico = [r["total_ms"] for r in perfil.ler_log(ultimas=20)]
+        if len(historico) > 1:
+            st.caption("Últimos reruns (ms)")
+            st.line_chart(historico, height=120)
+        st.caption(f"Log: {config.PERFIL_ARQUIVO_LOG}")
\ No newline at end of file
@@ -1,7 +1,213 @@
+import functools
+import hashlib
+import threading
+import weakref
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
 import streamlit as st
 import plotly.express as px
 import plotly.graph_objects as go
 import captacao_e_geracao_dados as dados
+import config
+
+# ============================
+# 4. Cache de Figuras
+# ============================
+class CacheFiguras:
+    """
+    Cache LRU das figuras Plotly já montadas, limitado em entradas e em memória
+    estimada (tamanho do JSON das figuras guardadas). As figuras são compartilhadas
+    entre execuções e sessões: não devem ser alteradas depois de exibidas.
+    """
+
+    def __init__(self, max_entradas=64, max_bytes=200 * 1024 ** 2):
+        self.max_entradas = max_entradas
+        self.max_bytes = max_bytes
+        self.acertos = 0
+        self.falhas = 0
+        self._bytes = 0
+        self._entradas = OrderedDict()  # chave → (figuras, tamanho)
+        self._trava = threading.Lock()
+
+    def obter(self, chave):
+        with self._trava:
+            entrada = self._entradas.get(chave)
+            if entrada is None:
+                self.falhas += 1
+                return None
+            self._entradas.move_to_end(chave)
+            self.acertos += 1
+            return entrada[0]
+
+    def guardar(self, chave, figuras, tamanho):
+        with self._trava:
+            antiga = self._entradas.pop(chave, None)
+            if antiga is not None:
+                self._bytes -= antiga[1]
+            if tamanho > self.max_bytes:
+                return
+            self._entradas[chave] = (figuras, tamanho)
+            self._bytes += tamanho
+            while len(self._entradas) > self.max_entradas or self._bytes > self.max_bytes:
+                self._bytes -= self._entradas.popitem(last=False)[1][1]
+
+    def limpar(self):
+        with self._trava:
+            self._entradas.clear()
+            self._bytes = 0
+
+    def estatisticas(self):
+        """Acertos, falhas, entradas e memória estimada (MB) do cache."""
+        return {"acertos": self.acertos, "falhas": self.falhas,
+                "entradas": len(self._entradas), "mb": round(self._bytes / 1024 ** 2, 1)}
+
+cache_figuras = CacheFiguras(config.CACHE_FIGURAS_MAX_ENTRADAS, config.CACHE_FIGURAS_MAX_MB * 1024 ** 2)
+
+# hash de conteúdo por objeto: os DataFrames do dashboard são compartilhados e somente leitura,
+# então o mesmo objeto (com o mesmo formato) não é re-hasheado a cada rerun
+_hashes = {}
+_captura = threading.local()
+
+def _hash_conteudo(df):
+    if isinstance(df, pd.DataFrame):
+        formato = (df.shape, tuple(map(str, df.columns)), tuple(map(str, df.dtypes)))
+    else:
+        formato = (df.shape, str(df.name), str(df.dtype))
+    memo = _hashes.get(id(df))
+    if memo is not None and memo[0]() is df and memo[1] == formato:
+        return memo[2]
+    h = hashlib.sha1(repr(formato).encode())
+    h.update(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes())
+    digest = h.hexdigest()
+    try:
+        ref = weakref.ref(df, lambda _, i=id(df): _hashes.pop(i, None))
+    except TypeError:
+        return digest
+    _hashes[id(df)] = (ref, formato, digest)
+    return digest
+
+def _assinatura(valor):
+    if isinstance(valor, (pd.DataFrame, pd.Series)):
+        return _hash_conteudo(valor)
+    return repr(valor)
+
+def _exibir(fig):
+    """Envia a figura ao Streamlit e a registra nas funções em cache que estão montando figuras."""
+    for figuras in getattr(_captura, "pilha", []):
+        figuras.append(fig)
+    st.plotly_chart(fig, use_container_width=True)
+
+def figura_em_cache(funcao):
+    """
+    Reaproveita as figuras emitidas por `funcao` enquanto o conteúdo dos DataFrames
+    e os demais argumentos não mudarem (chave: nome da função + hash + argumentos).
+    Só para funções cuja única saída na tela são gráficos (sem widgets). Aplicado só aos
+    gráficos nomeados, nunca aos `plot_*_base` que eles chamam (a figura seria guardada duas vezes).
+    """
+    @functools.wraps(funcao)
+    def envoltorio(*args, **kwargs):
+        if not config.USAR_CACHE_FIGURAS:
+            return funcao(*args, **kwargs)
+        chave = (
+            funcao.__qualname__,
+            tuple(_assinatura(a) for a in args),
+            tuple(sorted((k, _assinatura(v)) for k, v in kwargs.items())),
+        )
+        figuras = cache_figuras.obter(chave)
+        if figuras is not None:
+            for fig in figuras:
+                _exibir(fig)
+            return None
+
+        pilha = _captura.__dict__.setdefault("pilha", [])
+        figuras = []
+        pilha.append(figuras)
+        try:
+            resultado = funcao(*args, **kwargs)
+        finally:
+            pilha.pop()
+        # tamanho estimado pelo JSON das próprias figuras (o que o Streamlit envia ao navegador)
+        cache_figuras.guardar(chave, figuras, sum(len(fig.to_json()) for fig in figuras))
+        return resultado
+    return envoltorio
+
+# ============================
+# 4.1 Redução de Séries Temporais
+# ============================
+# Resoluções tentadas da mais fina para a mais grossa
+_RESOLUCOES = {"D": "diária", "W": "semanal", "M": "mensal"}
+
+def escolher_resolucao(inicio, fim, max_pontos=None):
+    """Resolução mais fina (D, W ou M) em que o período [inicio, fim] cabe em `max_pontos` pontos."""
+    max_pontos = max_pontos or config.MAX_PONTOS_SERIE
+    inicio, fim = pd.Timestamp(inicio), pd.Timestamp(fim)
+    dias = (fim - inicio).days + 1
+    pontos = {"D": dias, "W": dias // 7 + 2}
+    for freq, n in pontos.items():
+        if n <= max_pontos:
+            return freq
+    return "M"
+
+def agregar_por_resolucao(df, x_col, y_cols, agregacao="sum", max_pontos=None):
+    """
+    Reagrupa a série na resolução de `escolher_resolucao` (a própria tabela se a diária couber).
+    Retorna (df, freq).
+    """
+    if df.empty:
+        return df, "D"
+    freq = escolher_resolucao(df[x_col].min(), df[x_col].max(), max_pontos)
+    if freq == "D":
+        return df, freq
+    return df.groupby(pd.Grouper(key=x_col, freq=freq))[y_cols].agg(agregacao).reset_index(), freq
+
+def lttb(x, y, n_saida):
+    """
+    Índices escolhidos pelo Largest-Triangle-Three-Buckets: divide a série em `n_saida - 2`
+    baldes e, em cada um, fica o ponto que forma o maior triângulo com o ponto escolhido
+    no balde anterior e a média do seguinte. Primeiro e último pontos são sempre mantidos.
+    """
+    n = len(x)
+    if n_saida >= n or n_saida < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    limites = np.linspace(1, n - 1, n_saida - 1).astype(np.int64)
+    indices = np.empty(n_saida, dtype=np.int64)
+    indices[0], indices[-1] = 0, n - 1
+    a = 0
+    for i in range(n_saida - 2):
+        inicio, fim = limites[i], limites[i + 1]
+        prox_fim = limites[i + 2] if i + 2 < len(limites) else n
+        mx = np.nanmean(x[fim:prox_fim])
+        my = np.nanmean(y[fim:prox_fim]) if not np.isnan(y[fim:prox_fim]).all() else y[a]
+        areas = np.abs((x[a] - mx) * (y[inicio:fim] - y[a]) - (x[a] - x[inicio:fim]) * (my - y[a]))
+        a = inicio + int(np.argmax(np.nan_to_num(areas, nan=-1.0)))
+        indices[i + 1] = a
+    return indices
+
+def reduzir_pontos(df, x_col, y_cols, max_pontos=None, grupo_col=None):
+    """
+    Limita cada série (uma por `grupo_col`, se houver) a `max_pontos` pontos com LTTB.
+    Séries que já cabem voltam sem alteração.
+    """
+    max_pontos = max_pontos or config.MAX_PONTOS_SERIE
+    y_cols = [y_cols] if isinstance(y_cols, str) else list(y_cols)
+    if grupo_col is not None:
+        if df.groupby(grupo_col, observed=True).size().max() <= max_pontos:
+            return df
+        return pd.concat(
+            [reduzir_pontos(g, x_col, y_cols, max_pontos) for _, g in df.groupby(grupo_col, sort=False, observed=True)]
+        )
+    if len(df) <= max_pontos:
+        return df
+    df = df.sort_values(x_col)
+    x = df[x_col]
+    x = x.to_numpy("datetime64[ns]").view("int64") if pd.api.types.is_datetime64_any_dtype(x) else x.to_numpy()
+    por_coluna = max(max_pontos // len(y_cols), 3)
+    indices = np.unique(np.concatenate([lttb(x, df[c].to_numpy(), por_coluna) for c in y_cols]))
+    return df.iloc[indices]
 
 # ============================
 # 5. Métodos para Geração de Gráficos
@@ -97,7 +303,7 @@ def card_compacto(
 
 def plot_pie_base(df, names_col, values_col, title="", **kwargs):
     fig = px.pie(df, names=names_col, values=values_col, title=title, **kwargs)
-    st.plotly_chart(fig, use_container_width=True)
+    _exibir(fig)
 
 def plot_bar_base(df, x_col, y_col,
                   title="", labels=None,
@@ -116,15 +322,15 @@ def plot_bar_base(df, x_col, y_col,
         params["barmode"] = barmode
         
     fig = px.bar(df, **params, **kwargs)
-    st.plotly_chart(fig, use_container_width=True)
+    _exibir(fig)
 
 def plot_line_base(df, x_col, y_col, title="", labels=None, **kwargs):
     fig = px.line(df, x=x_col, y=y_col, title=title, labels=labels or {}, **kwargs)
-    st.plotly_chart(fig, use_container_width=True)
+    _exibir(fig)
 
 def plot_area_base(df, x_col, y_col, title="", labels=None, **kwargs):
     fig = px.area(df, x=x_col, y=y_col, title=title, labels=labels or {}, **kwargs)
-    st.plotly_chart(fig, use_container_width=True)
+    _exibir(fig)
 
 def plot_scatter_base(df, x_col, y_col, size_col=None,
                       color_col=None, hover_name=None,
@@ -134,19 +340,19 @@ def plot_scatter_base(df, x_col, y_col, size_col=None,
                     size=size_col, color=color_col,
                     hover_name=hover_name, hover_data=hover_data,
                     title=title, labels=labels or {}, **kwargs)
-    st.plotly_chart(fig, use_container_width=True)
+    _exibir(fig)
 
 def plot_funnel_base(df, x_col, y_col, title="", **kwargs):
     fig = px.funnel(df, x=x_col, y=y_col, title=title, **kwargs)
-    st.plotly_chart(fig, use_container_width=True)
+    _exibir(fig)
 
 def plot_line_polar_base(df, r_col, theta_col, title="", **kwargs):
     fig = px.line_polar(df, r=r_col, theta=theta_col, line_close=True, title=title, **kwargs)
-    st.plotly_chart(fig, use_container_width=True)
+    _exibir(fig)
 
 def plot_treemap_base(df, path_cols, value_col, title="", **kwargs):
     fig = px.treemap(df, path=path_cols, values=value_col, title=title, **kwargs)
-    st.plotly_chart(fig, use_container_width=True)
+    _exibir(fig)
     
 def plot_gauge_base(valor, titulo="Indicador", unidade="", cor_barra="darkblue", faixa=None):
     faixa = faixa or [0, max(10, valor + 1)]
@@ -160,7 +366,7 @@ def plot_gauge_base(valor, titulo="Indicador", unidade="", cor_barra="darkblue",
         },
         number={"suffix": f" {unidade}" if unidade else ""}
     ))
-    st.plotly_chart(fig, use_container_width=True)
+    _exibir(fig)
 
 def plot_gauge_indicador_base(valor, titulo="Indicador", unidade="", cor_barra="darkblue", faixa=None, fator_ampliacao=1.5):
     """
@@ -214,7 +420,7 @@ def plot_gauge_indicador_base(valor, titulo="Indicador", unidade="", cor_barra="
         height=300  # Altura fixa para melhor responsividade
     )
     
-    st.plotly_chart(fig, use_container_width=True)
+    _exibir(fig)
     
 # ============================
 # 5.3 - Funções Específicas para Relatórios
@@ -222,25 +428,35 @@ def plot_gauge_indicador_base(valor, titulo="Indicador", unidade="", cor_barra="
 
 # BAR ------------------------------------------
 
+@figura_em_cache
 def plot_bar_composicao_fretes(df):
     df_plot = df[["frete_ida", "frete_volta", "frete_extra"]].sum().reset_index()
     df_plot.columns = ["tipo", "valor"]
     plot_bar_base(df_plot, x_col="tipo", y_col="valor", title="Composição de Fretes", labels={"tipo":"Tipo de Frete","valor":"Valor (R$)"})
 
+@figura_em_cache
 def plot_bar_capex_mensal(df):
     plot_bar_base(df, x_col="data", y_col="capex", title="CAPEX Mensal", labels={"data":"Mês","capex":"Valor (R$)"})
 
+@figura_em_cache
 def plot_bar_margem_liquida_mensal(df):
     plot_bar_base(df, x_col="data", y_col="margem_lucro_liquido", title="Margem Líquida Mensal", labels={"data":"Mês","margem_lucro_liquido":"Margem"})
 
+@figura_em_cache
 def plot_bar_lucro_por_km_veiculo(df):
     plot_bar_base(df, x_col="veiculo", y_col="Lucro/km", title="Lucro por Km Rodado", labels={"veiculo":"Veículo", "Lucro/km":"Lucro por Km"})
 
+@figura_em_cache
+def plot_bar_comparativo_metricas_veiculo(df):
+    plot_bar_base(df, x_col="Veículo", y_col="Valor", color_col="Métrica", barmode="group",
+                  title="Comparativo de Métricas por Veículo", labels={"Valor": "R$/km", "Veículo": "Veículo"})
+
+@figura_em_cache
 def plot_bar_eficiencia_motoristas(df):
     """Plot otimizado com tratamento de valores negativos e formatação monetária"""
     
-    # Criar coluna de cor condicional
-    df['cor'] = df['eficiencia'].apply(lambda x: '#00C853' if x >= 0 else '#FF1744')
+    # Criar coluna de cor condicional (sem alterar o DataFrame recebido)
+    df = df.assign(cor=df['eficiencia'].apply(lambda x: '#00C853' if x >= 0 else '#FF1744'))
     
     # Ordenar por eficiência
     df = df.sort_values('eficiencia', ascending=True).round(2)
@@ -314,11 +530,13 @@ def plot_bar_eficiencia_motoristas(df):
         line_color="rgba(255,255,255,0.5)"
     )
     
-    st.plotly_chart(fig, use_container_width=True)
+    _exibir(fig)
 
+@figura_em_cache
 def plot_bar_custo_manutencao_por_km(df):
     plot_bar_base(df, x_col="veiculo", y_col="custo_manut_km", title="Custo de Manutenção por Km", labels={"veiculo": "Veículo", "custo_manut_km": "R$/Km"})
 
+@figura_em_cache
 def plot_bar_freq_manutencao_por_veiculo(df_viagem, df_fixas):
     df_proc = dados.preparar_df_manutencao_por_veiculo(df_viagem, df_fixas)
     
@@ -344,31 +562,38 @@ def plot_bar_freq_manutencao_por_veiculo(df_viagem, df_fixas):
     )
     
     fig.update_layout(barmode="stack")
-    st.plotly_chart(fig, use_container_width=True)
+    _exibir(fig)
     
+@figura_em_cache
 def plot_bar_consumo_km_por_litro(df):
     df_proc = dados.preparar_df_consumo_km_por_litro(df)
     plot_bar_base(df_proc, x_col="veiculo", y_col="km_por_litro", title="Consumo Médio (Km/L) por Veículo", labels={"veiculo": "Veículo", "km_por_litro": "Km/L"})
 
+@figura_em_cache
 def plot_bar_custo_combustivel_por_km(df):
     df_proc = dados.preparar_df_custo_combustivel_por_km(df)
     plot_bar_base(df_proc, x_col="veiculo", y_col="custo_comb_km", title="Custo de Combustível por Km", labels={"veiculo": "Veículo", "custo_comb_km": "R$/Km"})
 
 # PIE -------------------------------------
+@figura_em_cache
 def plot_pie_distribuicao_categorias(df):
     plot_pie_base(df, names_col="categoria", values_col="valor", title="Distribuição de Categorias")
     
 # LINE -----------------------------------
+@figura_em_cache
 def plot_line_faturamento_vs_despesas(df, x_col="data_ida"):
+    df = reduzir_pontos(df, x_col, ["frete_ida", "total_despesas_viagem"])
     plot_line_base(df, x_col=x_col, y_col=["frete_ida", "total_despesas_viagem"],
                    title="Faturamento vs Despesas",
                    labels={"value": "Valor (R$)", "variable": "Tipo", x_col: "Data"})
     
+@figura_em_cache
 def plot_line_polar_lucro_por_veiculo(df):
     plot_line_polar_base(df, r_col="lucro_bruto", theta_col="veiculo", title="Comparação Radial de Lucro")
     
+@figura_em_cache
 def plot_line_preco_medio_combustivel(df, x_col="data"):
-    df_proc = dados.preparar_df_preco_medio_combustivel(df)
+    df_proc = reduzir_pontos(dados.preparar_df_preco_medio_combustivel(df), x_col, "preco_medio_combustivel")
     plot_line_base(df_proc, x_col=x_col, y_col="preco_medio_combustivel",
                    title="Preço Médio do Combustível ao Longo do Tempo",
                    labels={x_col: "Data", "preco_medio_combustivel": "R$/Litro"})
@@ -377,7 +602,11 @@ def plot_line_manutencoes_ao_longo_do_tempo(df_viagem, df_fixas):
     """
     Plota manutenções ao longo do tempo com opção de escala logarítmica.
     """
-    df_proc = dados.preparar_df_manutencao_ao_longo_do_tempo(df_viagem, df_fixas)
+    # série diária reagrupada por semana/mês quando o período não cabe em config.MAX_PONTOS_SERIE
+    df_proc, freq = agregar_por_resolucao(
+        dados.preparar_df_manutencao_ao_longo_do_tempo(df_viagem, df_fixas), "data", ["qtd_manutencoes"]
+    )
+    df_proc = reduzir_pontos(df_proc, "data", "qtd_manutencoes")
     
     # Widget para seleção de escala
     usar_log = st.toggle("Usar escala logarítmica (Y)", value=False)
@@ -386,7 +615,7 @@ def plot_line_manutencoes_ao_longo_do_tempo(df_viagem, df_fixas):
         df_proc,
         x="data",
         y="qtd_manutencoes",
-        title="Manutenções ao Longo do Tempo",
+        title=f"Manutenções ao Longo do Tempo ({_RESOLUCOES[freq]})",
         labels={"data": "Data", "qtd_manutencoes": "Quantidade"},
         markers=True
     )
@@ -395,10 +624,11 @@ def plot_line_manutencoes_ao_longo_do_tempo(df_viagem, df_fixas):
         fig.update_layout(yaxis_type="log", yaxis_title="Quantidade (log)")
         fig.update_yaxes(tickvals=[0, 1, 10, 30], ticktext=["0", "1", "10", "30"])  # Personalize conforme seus dados
     
-    st.plotly_chart(fig, use_container_width=True)
+    _exibir(fig)
     
 # Scatter ---------------------------------
 
+@figura_em_cache
 def plot_scatter_custo_vs_lucro_motoristas(df):
     plot_scatter_base(
         df,
@@ -413,6 +643,7 @@ def plot_scatter_custo_vs_lucro_motoristas(df):
             } 
     )
 
+@figura_em_cache
 def plot_scatter_custo_vs_lucro_veiculo(df):
     
     # 1) Filtrar viagens inválidas (opção A)
@@ -437,6 +668,7 @@ def plot_scatter_custo_vs_lucro_veiculo(df):
             } 
     )
     
+@figura_em_cache
 def plot_scatter_custo_manutencao_vs_km(df):
     df_proc = dados.preparar_df_manutencao_vs_km(df)
     plot_scatter_base(
@@ -450,8 +682,9 @@ def plot_scatter_custo_manutencao_vs_km(df):
 
 # AREA ----------------------------------------
 
+@figura_em_cache
 def plot_area_evolucao_financeira(df, y_cols, x_col="data", stacked=False, **kwargs):
-    df = df.sort_values(x_col)
+    df = reduzir_pontos(df.sort_values(x_col), x_col, y_cols)
 
     if stacked:
         # comportamento atual: áreas empilhadas
@@ -481,22 +714,26 @@ def plot_area_evolucao_financeira(df, y_cols, x_col="data", stacked=False, **kwa
             **kwargs
         )
 
-    st.plotly_chart(fig, use_container_width=True)
+    _exibir(fig)
 
 # TREEMAP ----------------------------------------
+@figura_em_cache
 def plot_treemap_faturamento_por_veiculo(df):
     plot_treemap_base(df, path_cols=["veiculo"], value_col="frete_ida", title="Participação no Faturamento por Veículo")
 
 # BOX ---------------------------------------------
+@figura_em_cache
 def plot_box_lucro_motoristas(df):
     fig = px.box(df, y="lucro_bruto", title="Distribuição de Lucratividade")
-    st.plotly_chart(fig, use_container_width=True)
+    _exibir(fig)
 
 # FUNNEL -------------------------------------------
+@figura_em_cache
 def plot_funnel_ranking_lucro_motoristas(df):
     plot_funnel_base(df, x_col="lucro_bruto", y_col="motorista", title="Ranking de Lucratividade por Motorista")
 
 # GAUGE ------------------------------------------
+@figura_em_cache
 def plot_gauge_media_consumo_combustivel(valor):
     plot_gauge_base(valor, titulo="Consumo Médio de Combustível (Km/L)", unidade="Km/L", cor_barra="darkblue")
 
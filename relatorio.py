@@ -0,0 +1,222 @@
+"""
+Relatórios de fechamento sem o Streamlit (para cron / linha de comando).
+
+1. Carrega os dados enriquecidos uma única vez (mesmo snapshot/cache do dashboard)
+   e monta um `utils_filtro.IndiceFiltros` para todos os recortes.
+2. Para cada cenário de filtro (veículos, motoristas, período) calcula os KPIs de
+   `calcular_metricas_gerais`, o P&L mensal de `calcular_faturamento_por_mes`, as
+   métricas por veículo e a comissão de todas as viagens (`calcular_comissao_lote`).
+3. Grava uma pasta por cenário (CSV/Parquet) ou uma planilha por cenário (XLSX,
+   requer openpyxl), mais um `resumo` com os KPIs de todos os cenários.
+
+Uso:
+    python relatorio.py --mes 2025-05 --saida relatorios/2025-05
+    python relatorio.py --mes 2025-05 --por-veiculo --formato csv xlsx
+    python relatorio.py --cenarios cenarios.json --formato parquet
+
+`cenarios.json` é uma lista de objetos com "nome" e, opcionais, "veiculos",
+"motoristas", "inicio" e "fim" (AAAA-MM-DD), "mes" (AAAA-MM) e "incluir_futuras".
+"""
+import argparse
+import json
+import os
+import re
+import time
+
+import pandas as pd
+
+import captacao_e_geracao_dados as cgd
+import calculos_e_formulas as calculos
+import utils_filtro as uf
+from utils_comissao import calcular_comissao_lote
+
+FORMATOS = ("csv", "parquet", "xlsx")
+
+# ============================
+# 1. Cenários
+# ============================
+
+def _periodo_do_mes(mes: str) -> list:
+    """'AAAA-MM' → [primeiro dia, último dia] do mês."""
+    inicio = pd.Period(mes, freq="M")
+    return [inicio.start_time.normalize(), inicio.end_time.normalize()]
+
+def normalizar_cenario(cenario: dict) -> dict:
+    """Converte um cenário (CLI ou JSON) nos argumentos de `IndiceFiltros.filtrar`."""
+    periodo = None
+    if cenario.get("mes"):
+        periodo = _periodo_do_mes(cenario["mes"])
+    elif cenario.get("inicio") or cenario.get("fim"):
+        periodo = [pd.Timestamp(cenario.get("inicio") or pd.Timestamp.min),
+                   pd.Timestamp(cenario.get("fim") or pd.Timestamp.max)]
+    return {
+        "veiculos": list(cenario.get("veiculos") or []) or None,
+        "motoristas": list(cenario.get("motoristas") or []) or None,
+        "periodo": periodo,
+        "incluir_futuras": bool(cenario.get("incluir_futuras", False)),
+    }
+
+def montar_cenarios(args, indice: uf.IndiceFiltros) -> list:
+    """Cenários do arquivo JSON ou dos argumentos; --por-veiculo/--por-motorista abrem um por grupo."""
+    if args.cenarios:
+        with open(args.cenarios, encoding="utf-8") as f:
+            return json.load(f)
+
+    base = {
+        "nome": args.mes or "geral",
+        "veiculos": args.veiculo,
+        "motoristas": args.motorista,
+        "mes": args.mes,
+        "inicio": args.inicio,
+        "fim": args.fim,
+        "incluir_futuras": args.incluir_futuras,
+    }
+    cenarios = [base]
+    if args.por_veiculo:
+        cenarios += [dict(base, nome=f"{base['nome']}_{v}", veiculos=[v]) for v in indice.veiculos]
+    if args.por_motorista:
+        cenarios += [dict(base, nome=f"{base['nome']}_{m}", motoristas=[m]) for m in indice.motoristas]
+    return cenarios
+
+# ============================
+# 2. Relatório de um recorte
+# ============================
+
+def historico_comissoes(indice: uf.IndiceFiltros, dados: dict, filtros: dict,
+                        agora: pd.Timestamp = None) -> pd.DataFrame:
+    """
+    Viagens de referência da comissão de um recorte (`filtros` de `normalizar_cenario`):
+    as placas do recorte sem o corte de período, que deixaria de fora a janela de
+    JANELA_HISTORICO_DIAS antes de cada viagem, nem o de motorista (o histórico é da placa).
+    """
+    return indice.filtrar(dados, veiculos=filtros["veiculos"], incluir_futuras=filtros["incluir_futuras"],
+                          agora=agora)["viagens"]
+
+def tabela_comissoes(viagens: pd.DataFrame, historico: pd.DataFrame = None) -> pd.DataFrame:
+    """
+    Comissão de todas as viagens do recorte, com identificador, motorista e data de ida.
+    As referências vêm de `historico` (ver `historico_comissoes`; padrão: o próprio recorte),
+    que deve conter as linhas de `viagens`.
+    """
+    historico = viagens if historico is None else historico
+    comissoes = calcular_comissao_lote(historico).loc[viagens.index]
+    comissoes.insert(0, "identificador", viagens["identificador"])
+    comissoes.insert(1, "motorista", viagens["motorista"])
+    comissoes.insert(2, "data_ida", viagens["data_ida"])
+    return comissoes
+
+def gerar_relatorio(filtrados: dict, historico: pd.DataFrame = None) -> tuple:
+    """
+    Tabelas do relatório de um recorte já filtrado (mesmas contas do dashboard) e o
+    dicionário de KPIs escalares (sem `lucro_liquido_mensal_df`); `historico` é o de
+    `tabela_comissoes`.
+    """
+    viagens = filtrados["viagens"]
+    metricas = calculos.MetricasEngine(
+        viagens, filtrados["despesas_viagem"], filtrados["despesas_fixas"]
+    ).calcular()
+    kpis = {k: v for k, v in metricas.items() if not isinstance(v, pd.DataFrame)}
+
+    return {
+        "kpis": pd.DataFrame({"indicador": list(kpis), "valor": list(kpis.values())}),
+        "pl_mensal": calculos.calcular_faturamento_por_mes(
+            viagens, filtrados["despesas_viagem"], filtrados["despesas_fixas"]),
+        "metricas_veiculo": calculos.metricas_por_dimensao(filtrados, "veiculo"),
+        "comissoes": tabela_comissoes(viagens, historico),
+    }, kpis
+
+# ============================
+# 3. Gravação
+# ============================
+
+def _nome_arquivo(nome: str) -> str:
+    """Nome seguro para arquivo/pasta (placas e nomes com espaço viram '_')."""
+    return re.sub(r"[^\w.-]+", "_", str(nome)).strip("_") or "cenario"
+
+def _para_excel(df: pd.DataFrame) -> pd.DataFrame:
+    """Categorias viram texto antes de escrever no Excel."""
+    return df.apply(lambda s: s.astype(object) if isinstance(s.dtype, pd.CategoricalDtype) else s)
+
+def gravar_tabelas(tabelas: dict, destino: str, formatos) -> list:
+    """Grava `tabelas` em `destino` (pasta para csv/parquet, `destino.xlsx` para xlsx)."""
+    arquivos = []
+    for formato in formatos:
+        if formato == "xlsx":
+            caminho = destino + ".xlsx"
+            with pd.ExcelWriter(caminho) as planilha:
+                for nome, df in tabelas.items():
+                    _para_excel(df).to_excel(planilha, sheet_name=nome[:31], index=False)
+            arquivos.append(caminho)
+            continue
+        os.makedirs(destino, exist_ok=True)
+        for nome, df in tabelas.items():
+            caminho = os.path.join(destino, f"{nome}.{formato}")
+            if formato == "csv":
+                df.to_csv(caminho, index=False)
+            else:
+                df.to_parquet(caminho, index=False)
+            arquivos.append(caminho)
+    return arquivos
+
+def gerar_relatorios(cenarios: list, saida: str, formatos, dados: dict = None,
+                     indice: uf.IndiceFiltros = None) -> pd.DataFrame:
+    """
+    Gera os relatórios de todos os `cenarios` com uma única carga de dados e um único
+    índice de filtros; retorna (e grava como `resumo`) os KPIs por cenário.
+    """
+    dados = dados if dados is not None else cgd.carregar_dados_enriquecidos()
+    indice = indice if indice is not None else uf.IndiceFiltros(dados)
+    agora = pd.Timestamp.now()
+    os.makedirs(saida, exist_ok=True)
+
+    resumo = []
+    for cenario in cenarios:
+        nome = cenario.get("nome") or f"cenario_{len(resumo) + 1}"
+        t0 = time.perf_counter()
+        filtros = normalizar_cenario(cenario)
+        filtrados = indice.filtrar(dados, agora=agora, **filtros)
+        tabelas, kpis = gerar_relatorio(filtrados, historico_comissoes(indice, dados, filtros, agora))
+        gravar_tabelas(tabelas, os.path.join(saida, _nome_arquivo(nome)), formatos)
+        resumo.append({"cenario": nome, **kpis})
+        print(f"{nome}: {len(filtrados['viagens'])} viagens ({time.perf_counter() - t0:.2f}s)")
+
+    resumo = pd.DataFrame(resumo)
+    for formato in formatos:
+        if formato == "xlsx":
+            with pd.ExcelWriter(os.path.join(saida, "resumo.xlsx")) as planilha:
+                resumo.to_excel(planilha, sheet_name="resumo", index=False)
+        elif formato == "csv":
+            resumo.to_csv(os.path.join(saida, "resumo.csv"), index=False)
+        else:
+            resumo.to_parquet(os.path.join(saida, "resumo.parquet"), index=False)
+    return resumo
+
+def main():
+    parser = argparse.ArgumentParser(description="Relatórios de fechamento da frota (sem Streamlit).")
+    parser.add_argument("--saida", default="relatorios", help="pasta de saída")
+    parser.add_argument("--formato", nargs="+", choices=FORMATOS, default=["csv"])
+    parser.add_argument("--cenarios", default=None, help="arquivo JSON com a lista de cenários")
+    parser.add_argument("--mes", default=None, help="AAAA-MM (atalho para --inicio/--fim do mês)")
+    parser.add_argument("--inicio", default=None, help="AAAA-MM-DD")
+    parser.add_argument("--fim", default=None, help="AAAA-MM-DD")
+    parser.add_argument("--veiculo", action="append", default=None, help="placa (repetível)")
+    parser.add_argument("--motorista", action="append", default=None, help="motorista (repetível)")
+    parser.add_argument("--incluir-futuras", action="store_true", help="não corta datas após hoje")
+    parser.add_argument("--por-veiculo", action="store_true", help="um relatório extra por placa")
+    parser.add_argument("--por-motorista", action="store_true", help="um relatório extra por motorista")
+    args = parser.parse_args()
+
+    if "xlsx" in args.formato:
+        try:
+            import openpyxl  # noqa: F401
+        except ImportError:
+            parser.error("--formato xlsx requer o pacote openpyxl")
+
+    t0 = time.perf_counter()
+    dados = cgd.carregar_dados_enriquecidos()
+    indice = uf.IndiceFiltros(dados)
+    resumo = gerar_relatorios(montar_cenarios(args, indice), args.saida, args.formato, dados, indice)
+    print(f"{len(resumo)} cenário(s) em {args.saida} ({time.perf_counter() - t0:.2f}s)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+"""
+Simulação de cenários de parâmetros de comissão (variações do `config.DEFAULT_CONFIG`).
+
+1. `grade_cenarios` monta o produto cartesiano das variações sobre o cfg base.
+2. `simular_cenarios` calcula a comissão de todas as viagens em cada cenário, com as
+   mesmas contas de `calcular_comissao_lote`: o histórico de referência só depende de
+   `CHAVES_REFERENCIA` (janela e coluna de receita) e é calculado uma vez por combinação
+   em cada processo; a pontuação vetorizada roda por cenário, em lotes distribuídos
+   num pool de `config.SIMULACAO_PROCESSOS` processos.
+3. Devolve, por cenário, os parâmetros que variam, o total pago e a distribuição por motorista.
+
+Uso:
+    python simulacao_comissao.py --variar PESO_CONSUMO=0.5,0.6,0.7 --variar COMISSAO_MAXIMA=400,500,600
+    python simulacao_comissao.py --grade grade.json --inicio 2025-01-01 --fim 2025-12-31 --saida simulacao
+
+`grade.json` é um objeto {parâmetro: [valores]} (produto cartesiano) ou uma lista de
+objetos com os parâmetros de cada cenário (o que faltar vem do DEFAULT_CONFIG).
+"""
+import argparse
+import itertools
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import config
+import captacao_e_geracao_dados as cgd
+import utils_filtro as uf
+from relatorio import historico_comissoes, normalizar_cenario
+from utils_comissao import CHAVES_REFERENCIA, _pontuar_lote, _referencias_lote
+
+# ============================
+# 1. Cenários
+# ============================
+
+def grade_cenarios(variacoes: dict, base: dict = None) -> list:
+    """Um cfg completo para cada combinação de {parâmetro: [valores]} sobre `base` (padrão: DEFAULT_CONFIG)."""
+    base = dict(config.DEFAULT_CONFIG if base is None else base)
+    nomes = list(variacoes)
+    return [dict(base, **dict(zip(nomes, valores))) for valores in itertools.product(*(variacoes[n] for n in nomes))]
+
+def _valor(texto: str):
+    """Valor de --variar: número (JSON) ou texto, ex.: nome de coluna em COLUNA_RECEITA."""
+    try:
+        return json.loads(texto)
+    except ValueError:
+        return texto.strip()
+
+def _ler_grade(caminho: str) -> list:
+    """Cenários de um arquivo JSON: grade {parâmetro: [valores]} ou lista de variações."""
+    with open(caminho, encoding="utf-8") as f:
+        grade = json.load(f)
+    if isinstance(grade, dict):
+        return grade_cenarios(grade)
+    return [dict(config.DEFAULT_CONFIG, **variacao) for variacao in grade]
+
+# ============================
+# 2. Avaliação (em cada processo)
+# ============================
+
+# estado de cada processo do pool, recebido uma vez em `_iniciar_processo`
+_viagens = None
+_motoristas = None
+_qtd_motoristas = 0
+_no_recorte = None
+_referencias = {}
+
+def _iniciar_processo(viagens: pd.DataFrame, motoristas: np.ndarray, qtd_motoristas: int,
+                      no_recorte: np.ndarray) -> None:
+    global _viagens, _motoristas, _qtd_motoristas, _no_recorte, _referencias
+    _viagens, _motoristas, _qtd_motoristas, _no_recorte = viagens, motoristas, qtd_motoristas, no_recorte
+    _referencias = {}
+
+def _avaliar_lote(lote: list) -> list:
+    """[(posição, cfg)] → [(posição, comissão total, comissão por motorista)] das viagens do recorte."""
+    validos = _motoristas >= 0
+    saida = []
+    for posicao, cfg in lote:
+        chave = tuple(cfg[c] for c in CHAVES_REFERENCIA)
+        if chave not in _referencias:
+            _referencias[chave] = _referencias_lote(_viagens, cfg)
+        comissao = _pontuar_lote(_referencias[chave], cfg)["comissao"]
+        comissao = np.where(np.isnan(comissao), 0.0, comissao)  # soma como no pandas: NaN não conta
+        por_motorista = np.bincount(_motoristas[validos], weights=comissao[validos], minlength=_qtd_motoristas)
+        saida.append((posicao, comissao[_no_recorte].sum(), por_motorista))
+    return saida
+
+def _lotes(cenarios: list, por_tarefa: int) -> list:
+    """Lotes de (posição, cfg) agrupados pela chave de referência, para reaproveitar o histórico."""
+    ordem = sorted(range(len(cenarios)), key=lambda i: tuple(str(cenarios[i][c]) for c in CHAVES_REFERENCIA))
+    lotes, atual, chave_atual = [], [], None
+    for i in ordem:
+        chave = tuple(cenarios[i][c] for c in CHAVES_REFERENCIA)
+        if atual and (len(atual) >= por_tarefa or chave != chave_atual):
+            lotes.append(atual)
+            atual = []
+        atual.append((i, cenarios[i]))
+        chave_atual = chave
+    if atual:
+        lotes.append(atual)
+    return lotes
+
+# ============================
+# 3. Simulação
+# ============================
+
+def simular_cenarios(df_viagens: pd.DataFrame, cenarios: list, processos: int = None,
+                     por_tarefa: int = None, historico: pd.DataFrame = None) -> tuple:
+    """
+    Comissão de todas as viagens de `df_viagens` em cada cfg de `cenarios`, com as
+    referências de `historico` (ver `relatorio.historico_comissoes`; padrão: as próprias
+    viagens, como na calculadora do dashboard), que deve conter as linhas de `df_viagens`.
+
+    Retorna (resumo, por_motorista), ambos com um cenário por linha: `resumo` traz os
+    parâmetros que variam entre os cenários, `total_comissao` e `comissao_media` por viagem;
+    `por_motorista` traz o total pago a cada motorista (colunas).
+    """
+    processos = processos or config.SIMULACAO_PROCESSOS or os.cpu_count() or 1
+    por_tarefa = por_tarefa or config.SIMULACAO_CENARIOS_POR_TAREFA
+
+    historico = df_viagens if historico is None else historico
+    receitas = sorted({cfg["COLUNA_RECEITA"] for cfg in cenarios})
+    colunas = ["veiculo", "data_ida", "data_volta", "media", *receitas]
+    if "dias_viagem" in historico.columns:
+        colunas.append("dias_viagem")
+    viagens = historico[list(dict.fromkeys(colunas))]
+    # viagens do histórico fora do recorte entram só nas referências (código -1, fora das somas)
+    posicoes = historico.index.get_indexer(df_viagens.index)
+    codigos_recorte, motoristas = pd.factorize(df_viagens["motorista"], sort=True)
+    codigos = np.full(len(historico), -1, dtype=codigos_recorte.dtype)
+    codigos[posicoes] = codigos_recorte
+    no_recorte = np.zeros(len(historico), dtype=bool)
+    no_recorte[posicoes] = True
+    estado = (viagens, codigos, len(motoristas), no_recorte)
+
+    lotes = _lotes(cenarios, por_tarefa)
+    if processos == 1 or len(lotes) <= 1:
+        _iniciar_processo(*estado)
+        try:
+            resultados = [r for lote in lotes for r in _avaliar_lote(lote)]
+        finally:
+            _iniciar_processo(None, None, 0, None)
+    else:
+        with ProcessPoolExecutor(max_workers=min(processos, len(lotes)),
+                                 initializer=_iniciar_processo, initargs=estado) as pool:
+            resultados = [r for parcial in pool.map(_avaliar_lote, lotes) for r in parcial]
+    resultados.sort(key=lambda r: r[0])
+
+    variaveis = [k for k in dict.fromkeys(k for cfg in cenarios for k in cfg)
+                 if len({json.dumps(cfg.get(k), sort_keys=True) for cfg in cenarios}) > 1]
+    resumo = pd.DataFrame([{k: cfg.get(k) for k in variaveis} for cfg in cenarios])
+    resumo["total_comissao"] = [total for _, total, _ in resultados]
+    resumo["comissao_media"] = resumo["total_comissao"] / max(len(df_viagens), 1)
+    resumo.index.name = "cenario"
+
+    por_motorista = pd.DataFrame(
+        np.array([dist for _, _, dist in resultados]).reshape(len(resultados), len(motoristas)),
+        columns=pd.Index(motoristas, name="motorista"),
+    )
+    por_motorista.index.name = "cenario"
+    return resumo, por_motorista
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulação de cenários de parâmetros de comissão.")
+    parser.add_argument("--grade", default=None, help="arquivo JSON com a grade ou a lista de cenários")
+    parser.add_argument("--variar", action="append", default=[], metavar="PARAMETRO=V1,V2,...",
+                        help="valores de um parâmetro do DEFAULT_CONFIG (repetível; produto cartesiano)")
+    parser.add_argument("--mes", default=None, help="AAAA-MM (viagens do mês; histórico de referência sem corte de período)")
+    parser.add_argument("--inicio", default=None, help="AAAA-MM-DD")
+    parser.add_argument("--fim", default=None, help="AAAA-MM-DD")
+    parser.add_argument("--veiculo", action="append", default=None, help="placa (repetível)")
+    parser.add_argument("--motorista", action="append", default=None, help="motorista (repetível)")
+    parser.add_argument("--processos", type=int, default=None, help="padrão: config.SIMULACAO_PROCESSOS")
+    parser.add_argument("--saida", default="simulacao", help="pasta de saída (resumo.csv, por_motorista.csv)")
+    args = parser.parse_args()
+
+    variacoes = {}
+    for item in args.variar:
+        nome, _, valores = item.partition("=")
+        if nome not in config.DEFAULT_CONFIG or not valores:
+            parser.error(f"--variar inválido: {item!r} (use PARAMETRO=V1,V2 com um parâmetro do DEFAULT_CONFIG)")
+        variacoes[nome] = [_valor(v) for v in valores.split(",")]
+    if args.grade:
+        cenarios = _ler_grade(args.grade)
+    elif variacoes:
+        cenarios = grade_cenarios(variacoes)
+    else:
+        parser.error("informe --grade ou ao menos um --variar")
+
+    t0 = time.perf_counter()
+    dados = cgd.carregar_dados_enriquecidos()
+    filtros = normalizar_cenario({"veiculos": args.veiculo, "motoristas": args.motorista,
+                                  "mes": args.mes, "inicio": args.inicio, "fim": args.fim,
+                                  "incluir_futuras": True})
+    indice = uf.IndiceFiltros(dados)
+    viagens = indice.filtrar(dados, **filtros)["viagens"]
+    historico = historico_comissoes(indice, dados, filtros)
+
+    resumo, por_motorista = simular_cenarios(viagens, cenarios, args.processos, historico=historico)
+    os.makedirs(args.saida, exist_ok=True)
+    resumo.to_csv(os.path.join(args.saida, "resumo.csv"))
+    por_motorista.to_csv(os.path.join(args.saida, "por_motorista.csv"))
+    print(f"{len(cenarios)} cenário(s) × {len(viagens)} viagens em {args.saida} "
+          f"({time.perf_counter() - t0:.2f}s)")
+
+if __name__ == "__main__":
+    main()
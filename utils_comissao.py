@@ -2,6 +2,7 @@
 Módulo de cálculo de comissão de motoristas baseado em desempenho, receita e ociosidade.
 Interface pública principal: `calcular_comissao` (não deve ser alterada).
 """
+import bisect
 import pandas as pd
 import numpy as np
 from typing import Any, Tuple, Dict
@@ -158,3 +159,189 @@ def calcular_comissao(
         "nota_final": nota_final,
         "comissao": comissao,
     }
+
+
+def _clamp_vetorizado(valores: np.ndarray, minimum: float, maximum: float) -> np.ndarray:
+    """Equivalente vetorizado de `_clamp` (NaN cai no limite inferior, como no `max` do Python)."""
+    return np.where(np.isnan(valores), minimum, np.clip(valores, minimum, maximum))
+
+
+def _mediana_sem_elemento(ordenada: list, excluido: float) -> float:
+    """Mediana de `ordenada` (lista ordenada) desconsiderando uma ocorrência de `excluido` (NaN = nenhuma)."""
+    n = len(ordenada)
+    pos = n
+    if not np.isnan(excluido):
+        pos = bisect.bisect_left(ordenada, excluido)
+        n -= 1
+    if n == 0:
+        return np.nan
+
+    def _k_esimo(k: int) -> float:
+        return ordenada[k] if k < pos else ordenada[k + 1]
+
+    meio = n // 2
+    if n % 2:
+        return _k_esimo(meio)
+    return (_k_esimo(meio - 1) + _k_esimo(meio)) / 2
+
+
+def _ultima_volta_antes(ordenada: list, limite: int, propria: int) -> int:
+    """Maior `data_volta` (ns) em `ordenada` menor que `limite`, desconsiderando `propria` (-1 = nenhuma)."""
+    pos = bisect.bisect_left(ordenada, limite)
+    if pos and ordenada[pos - 1] == propria:
+        pos -= 1
+    return ordenada[pos - 1] if pos else -1
+
+
+# Parâmetros que mudam o histórico de referência; os demais só entram na pontuação
+CHAVES_REFERENCIA = ("JANELA_HISTORICO_DIAS", "COLUNA_RECEITA")
+
+
+def _referencias_lote(
+    df_viagens: pd.DataFrame,
+    cfg: dict = config.DEFAULT_CONFIG,
+) -> Dict[str, np.ndarray]:
+    """
+    Desempenho de cada viagem e referências do seu histórico (média de consumo,
+    mediana de receita diária e dias ociosos); depende só de `CHAVES_REFERENCIA` do `cfg`.
+    """
+    receita_col = cfg["COLUNA_RECEITA"]
+    n = len(df_viagens)
+
+    placas = df_viagens["veiculo"].to_numpy()
+    data_ida = pd.to_datetime(df_viagens["data_ida"]).to_numpy("datetime64[ns]")
+    data_volta = pd.to_datetime(df_viagens["data_volta"]).to_numpy("datetime64[ns]")
+    media = df_viagens["media"].to_numpy(dtype=float)
+    receita = df_viagens[receita_col].to_numpy(dtype=float)
+
+    dias_atual = np.maximum(
+        (data_volta - data_ida).astype("timedelta64[D]").astype(float), 1.0
+    )
+    dias_atual[np.isnat(data_ida) | np.isnat(data_volta)] = np.nan
+    receita_por_dia = receita / dias_atual
+
+    # receita diária vista pelo histórico (respeita `dias_viagem` já existente, como em `_calcular_referencias`)
+    if "dias_viagem" in df_viagens.columns:
+        receita_diaria_hist = receita / df_viagens["dias_viagem"].to_numpy(dtype=float)
+    else:
+        receita_diaria_hist = receita_por_dia
+
+    media_ref = np.full(n, np.nan)
+    receita_ref = np.full(n, np.nan)
+    dias_ociosos = np.zeros(n, dtype=np.int64)
+
+    # viagens sem placa ou sem data_ida nunca entram em histórico algum
+    validas = pd.notna(placas) & ~np.isnat(data_ida)
+    codigos, _ = pd.factorize(placas[validas])
+    posicoes = np.flatnonzero(validas)
+    ida_ns = data_ida.view("int64")
+    volta_ns = data_volta.view("int64")
+    janela_ns = pd.Timedelta(days=cfg["JANELA_HISTORICO_DIAS"]).value
+    dia_ns = pd.Timedelta(days=1).value
+
+    ordem = posicoes[np.lexsort((ida_ns[posicoes], codigos))]
+    limites = np.flatnonzero(np.diff(np.sort(codigos))) + 1
+    for grupo in np.split(ordem, limites):
+        if grupo.size == 0:
+            continue
+        idas = ida_ns[grupo]
+        inicios = np.searchsorted(idas, idas - janela_ns, side="left")
+
+        # média de consumo: somas de sufixo (ignorando NaN) menos a própria viagem
+        medias = media[grupo]
+        nao_nulas = ~np.isnan(medias)
+        soma_sufixo = np.append(np.cumsum(np.where(nao_nulas, medias, 0.0)[::-1])[::-1], 0.0)
+        qtd_sufixo = np.append(np.cumsum(nao_nulas[::-1])[::-1], 0)
+        soma = soma_sufixo[inicios] - np.where(nao_nulas, medias, 0.0)
+        qtd = qtd_sufixo[inicios] - nao_nulas
+        with np.errstate(invalid="ignore", divide="ignore"):
+            media_ref[grupo] = np.where(qtd > 0, soma / np.maximum(qtd, 1), np.nan)
+
+        # mediana de receita/dia e última volta: varredura reversa com listas ordenadas
+        receitas_hist = receita_diaria_hist[grupo]
+        voltas = volta_ns[grupo]
+        voltas_validas = ~np.isnat(data_volta[grupo])
+        receitas_ordenadas: list = []
+        voltas_ordenadas: list = []
+        proximo = grupo.size
+        for i in range(grupo.size - 1, -1, -1):
+            while proximo > inicios[i]:
+                proximo -= 1
+                if not np.isnan(receitas_hist[proximo]):
+                    bisect.insort(receitas_ordenadas, receitas_hist[proximo])
+                if voltas_validas[proximo]:
+                    bisect.insort(voltas_ordenadas, voltas[proximo])
+
+            receita_ref[grupo[i]] = _mediana_sem_elemento(receitas_ordenadas, receitas_hist[i])
+            propria = voltas[i] if voltas_validas[i] else -1
+            ultima = _ultima_volta_antes(voltas_ordenadas, idas[i], propria)
+            if ultima != -1:
+                dias_ociosos[grupo[i]] = (idas[i] - ultima) // dia_ns
+
+    # fallback sem histórico
+    return {
+        "placa": placas,
+        "media_trip": media,
+        "media_ref": np.where(np.isnan(media_ref), media, media_ref),
+        "receita_por_dia": receita_por_dia,
+        "receita_ref": np.where(np.isnan(receita_ref), receita_por_dia, receita_ref),
+        "dias_ociosos": dias_ociosos,
+    }
+
+
+def _pontuar_lote(referencias: Dict[str, np.ndarray], cfg: dict = config.DEFAULT_CONFIG) -> Dict[str, np.ndarray]:
+    """Scores, penalidade, nota e comissão (vetorizados) a partir de `_referencias_lote`."""
+    media, media_ref = referencias["media_trip"], referencias["media_ref"]
+    receita_por_dia, receita_ref = referencias["receita_por_dia"], referencias["receita_ref"]
+    dias_ociosos = referencias["dias_ociosos"]
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        score_consumo = _clamp_vetorizado(
+            (media / media_ref - 1.0) / cfg["INCREMENTO_CONSUMO_MAXIMO"], -1.0, 1.0
+        )
+        score_receita = _clamp_vetorizado(
+            (receita_por_dia / receita_ref - 1.0) / (cfg["INCREMENTO_RECEITA_MAXIMO"] - 1.0), -1.0, 1.0
+        )
+
+    normal = cfg["DIAS_OCIOSIDADE_NORMAL"]
+    span = max(cfg["DIAS_OCIOSIDADE_PLENO"] - normal, 1)
+    penalidade = np.where(
+        dias_ociosos <= normal,
+        0.0,
+        np.clip((dias_ociosos - normal) / span, 0.0, 1.0) * cfg["PENALIDADE_OCIOSIDADE_MAX"],
+    )
+
+    delta = 0.50 * (cfg["PESO_CONSUMO"] * score_consumo + cfg["PESO_RECEITA"] * score_receita)
+    nota_final = np.clip(0.50 + delta, 0.0, 1.0) * (1.0 - penalidade)
+    valor_bruto = np.round(nota_final * cfg["COMISSAO_MAXIMA"], 2)
+    comissao = np.clip(valor_bruto, cfg["COMISSAO_MINIMA"], cfg["COMISSAO_MAXIMA"])
+
+    return {
+        "score_consumo": score_consumo,
+        "score_receita": score_receita,
+        "penalidade_ociosidade": penalidade,
+        "nota_final": nota_final,
+        "comissao": comissao,
+    }
+
+
+def calcular_comissao_lote(
+    df_viagens: pd.DataFrame,
+    cfg: dict = config.DEFAULT_CONFIG,
+) -> pd.DataFrame:
+    """
+    Calcula a comissão de todas as viagens de `df_viagens` de uma vez.
+
+    Reproduz `calcular_comissao(row, df_viagens, cfg)` linha a linha (mesmo histórico:
+    viagens da mesma placa com `data_ida >= data_ida - janela`, exceto a própria), mas
+    ordena cada veículo uma única vez e percorre suas viagens de trás para frente,
+    mantendo receitas diárias e `data_volta` ordenadas para mediana e ociosidade.
+    Retorna DataFrame com o mesmo índice de `df_viagens` e as chaves de `calcular_comissao`
+    como colunas.
+    """
+    referencias = _referencias_lote(df_viagens, cfg)
+    pontuacao = _pontuar_lote(referencias, cfg)
+    colunas = ["placa", "media_trip", "media_ref", "score_consumo", "receita_por_dia", "receita_ref",
+               "score_receita", "dias_ociosos", "penalidade_ociosidade", "nota_final", "comissao"]
+    valores = {**referencias, **pontuacao}
+    return pd.DataFrame({col: valores[col] for col in colunas}, index=df_viagens.index)
@@ -0,0 +1,148 @@
+"""
+Cubo mensal pré-agregado (mês × veículo × motorista × categoria) das tabelas enriquecidas.
+Construído uma vez por versão dos dados; `CuboMensal.recortar` aplica os filtros integrados
+às células (milhares) em vez das linhas (milhões).
+
+As células mantêm os nomes das colunas das tabelas de origem: datas no fim do mês, colunas
+numéricas somadas e `qtd` com o número de linhas. Assim as contas que só somam por mês,
+veículo, motorista ou categoria (`calculos.calcular_pl_mensal`, `cgd.processar_dados_historicos`,
+composições das abas) aceitam as células no lugar do recorte linha a linha.
+"""
+from typing import Dict, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+import calculos_e_formulas as calculos
+
+# Por tabela: data usada pelos filtros, datas levadas ao fim do mês, dimensões e colunas somadas
+_DEFINICAO = {
+    "viagens": {
+        "data_filtro": "data_ida",
+        "datas": ["data_ida"],
+        "chaves": ["veiculo", "motorista"],
+        "somas": ["frete_ida", "frete_volta", "frete_extra", "km_total", "lts_combustivel", "lucro_bruto"],
+    },
+    "despesas_viagem": {
+        # as despesas de viagem seguem a viagem: filtradas pela data de ida (data_viagem)
+        "data_filtro": "data_viagem",
+        "datas": ["data", "data_viagem"],
+        "chaves": ["veiculo", "motorista", "categoria"],
+        "somas": ["valor", "lts_combustivel"],
+    },
+    "despesas_fixas": {
+        "data_filtro": "data",
+        "datas": ["data"],
+        "chaves": ["veiculo", "categoria"],
+        "somas": ["valor"],
+    },
+}
+
+
+def _agregar(df: pd.DataFrame, data_filtro: str, datas: list, chaves: list, somas: list) -> pd.DataFrame:
+    """
+    Células de uma tabela: somas e `qtd` por (meses, chaves), com a menor e a maior
+    `data_filtro` de cada célula (`data_min`/`data_max`) para decidir os recortes.
+    Chaves nulas formam células próprias, como as linhas nulas na tabela. Se `df` já traz
+    `qtd` (linhas pré-agregadas), ela é somada em vez de contar as linhas.
+    """
+    grupos = [calculos._fim_do_mes(df[col]).rename(col) for col in datas] + [df[col] for col in chaves]
+    data = pd.to_datetime(df[data_filtro])
+    return (
+        df[somas].assign(qtd=df["qtd"] if "qtd" in df.columns else 1, data_min=data, data_max=data)
+        .groupby(grupos, observed=True, dropna=False)
+        .agg(**{col: (col, "sum") for col in somas},
+             qtd=("qtd", "sum"), data_min=("data_min", "min"), data_max=("data_max", "max"))
+        .reset_index()
+    )
+
+
+def _agregar_pre_agregado(agregado: pd.DataFrame, viagens: pd.DataFrame, data_filtro: str, **definicao) -> pd.DataFrame:
+    """
+    Células de `despesas_viagem` a partir do pré-agregado da leitura em lotes
+    (`cgd.carregar_agregados_despesas_viagem`: viagem × veículo × mês × categoria), sem passar
+    pelas linhas: cada viagem válida dá motorista, placa e data de ida, como em
+    `cgd._enriquecer_despesas_viagem` (despesas de viagens descartadas ficam de fora).
+    """
+    viagem = viagens[["id", "motorista", "veiculo", "data_ida"]].rename(columns={"data_ida": data_filtro})
+    df = (
+        agregado.assign(viagem_id=agregado["viagem_id"].astype(viagem["id"].dtype))
+        .merge(viagem, left_on="viagem_id", right_on="id")
+    )
+    return _agregar(df, data_filtro, **definicao)
+
+
+def _no_periodo(celulas: pd.DataFrame, inicio: Optional[pd.Timestamp], fim: Optional[pd.Timestamp]) -> Optional[np.ndarray]:
+    """
+    Máscara das células inteiramente em [inicio, fim]; None se alguma tem linhas dos dois
+    lados de um limite. Datas nulas nunca entram em um intervalo.
+    """
+    if inicio is None and fim is None:
+        return np.ones(len(celulas), dtype=bool)
+    data_min, data_max = celulas["data_min"], celulas["data_max"]
+    dentro = data_min.notna()
+    fora = data_min.isna()
+    if inicio is not None:
+        dentro &= data_min >= inicio
+        fora |= data_max < inicio
+    if fim is not None:
+        dentro &= data_max <= fim
+        fora |= data_min > fim
+    if not (dentro | fora).all():
+        return None
+    return dentro.to_numpy()
+
+
+class CuboMensal:
+    """
+    Células mensais de `viagens`, `despesas_viagem` e `despesas_fixas` (mesmo formato de dicionário
+    dos dados enriquecidos). As células são compartilhadas entre execuções: não devem ser alteradas.
+    Com `agregado_despesas_viagem` (leitura em lotes), as células de `despesas_viagem` saem dele
+    em vez das linhas.
+    """
+
+    def __init__(self, dados: Dict[str, pd.DataFrame], agregado_despesas_viagem: Optional[pd.DataFrame] = None):
+        self.celulas = {}
+        for tabela, definicao in _DEFINICAO.items():
+            if tabela == "despesas_viagem" and agregado_despesas_viagem is not None:
+                self.celulas[tabela] = _agregar_pre_agregado(agregado_despesas_viagem, dados["viagens"], **definicao)
+            else:
+                self.celulas[tabela] = _agregar(dados[tabela], **definicao)
+
+    def recortar(
+        self,
+        veiculos: Optional[Sequence[str]] = None,
+        motoristas: Optional[Sequence[str]] = None,
+        periodo: Optional[Sequence] = None,
+        incluir_futuras: bool = True,
+        agora: Optional[pd.Timestamp] = None,
+    ) -> Optional[Dict[str, pd.DataFrame]]:
+        """
+        Células do recorte dos filtros integrados (mesmos argumentos e regras de
+        `IndiceFiltros.filtrar`), ou None quando um limite do período (ou o corte de datas
+        futuras) cai no meio de uma célula; nesse caso vale o recorte linha a linha.
+        """
+        inicio = fim = None
+        if periodo is not None and len(periodo) == 2:
+            inicio, fim = (pd.to_datetime(d) for d in periodo)
+        if not incluir_futuras:
+            agora = pd.Timestamp.now() if agora is None else pd.Timestamp(agora)
+            fim = agora if fim is None else min(fim, agora)
+
+        recorte = {}
+        for tabela, celulas in self.celulas.items():
+            mascara = np.ones(len(celulas), dtype=bool)
+            if veiculos:
+                mascara &= celulas["veiculo"].isin(list(veiculos)).to_numpy()
+            if motoristas and "motorista" in celulas.columns:  # despesas fixas não têm motorista
+                mascara &= celulas["motorista"].isin(list(motoristas)).to_numpy()
+            celulas = celulas[mascara]
+            dentro = _no_periodo(celulas, inicio, fim)
+            if dentro is None:
+                return None
+            recorte[tabela] = celulas[dentro]
+        return recorte
+
+    def estatisticas(self) -> Dict[str, int]:
+        """Número de células por tabela."""
+        return {tabela: len(celulas) for tabela, celulas in self.celulas.items()}
@@ -0,0 +1,260 @@
+"""
+Índice pré-calculado para os filtros integrados do dashboard (veículos, motoristas e período).
+Interface pública principal: `IndiceFiltros.filtrar`, mesmo resultado de `dashboard.filtrar_dados_completos`
+resolvido por posições inteiras (custo proporcional ao resultado, não ao tamanho da base).
+"""
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+from typing import Any, Callable, Dict, Hashable, Iterable, Optional, Sequence
+
+# NaT é representado como o menor int64; qualquer limite de data válido fica acima dele
+_NAT_NS = np.iinfo(np.int64).min
+
+
+def _datas_ns(serie: pd.Series) -> np.ndarray:
+    """Converte uma série de datas para int64 (ns), com NaT = menor int64."""
+    return pd.to_datetime(serie).to_numpy("datetime64[ns]").view("int64")
+
+
+def _recortar(df: pd.DataFrame, posicoes: np.ndarray) -> pd.DataFrame:
+    """
+    Subconjunto de `df` nas `posicoes` (ordenadas): a própria tabela se nada foi
+    excluído, uma fatia (view) se as posições forem contíguas, senão `take`.
+    """
+    if len(posicoes) == len(df):
+        return df
+    if len(posicoes) and posicoes[-1] - posicoes[0] + 1 == len(posicoes):
+        return df.iloc[posicoes[0]:posicoes[-1] + 1]
+    return df.take(posicoes)
+
+
+class _GruposPorData:
+    """Posições de uma tabela agrupadas por código (formato CSR) e ordenadas por data dentro do grupo."""
+
+    def __init__(self, codigos: np.ndarray, datas: np.ndarray):
+        codigos = np.asarray(codigos, dtype=np.int64) + 1  # grupo 0 = código nulo (-1)
+        self._ordem = np.lexsort((datas, codigos))
+        self._datas = datas[self._ordem]
+        contagem = np.bincount(codigos, minlength=1)
+        self._offsets = np.concatenate([[0], np.cumsum(contagem)])
+
+    def posicoes(self, grupos: Iterable[int], inicio: Optional[int], fim: Optional[int]) -> np.ndarray:
+        """Posições dos `grupos` com data em [inicio, fim] (None = sem limite)."""
+        grupos = np.asarray(grupos, dtype=np.int64)
+        grupos = grupos[(grupos >= 0) & (grupos < len(self._offsets) - 2)]  # fora disso: grupo vazio
+        comecos = self._offsets[grupos + 1]
+        fins = self._offsets[grupos + 2]
+        if inicio is not None or fim is not None:
+            # busca binária da janela de datas dentro de cada grupo
+            for i, (a, b) in enumerate(zip(comecos, fins)):
+                if inicio is not None:
+                    a += np.searchsorted(self._datas[a:b], inicio, side="left")
+                if fim is not None:
+                    b = a + np.searchsorted(self._datas[a:b], fim, side="right")
+                comecos[i], fins[i] = a, b
+        # concatena as faixas [começo, fim) sem laço em Python
+        tamanhos = fins - comecos
+        saltos = np.repeat(comecos - np.cumsum(tamanhos) + tamanhos, tamanhos)
+        return self._ordem[saltos + np.arange(tamanhos.sum())]
+
+
+class IndiceFiltros:
+    """
+    Índice dos dados enriquecidos (`viagens`, `despesas_viagem`, `despesas_fixas`):
+      • chaves substitutas int32 de veículo (espaço comum a viagens e despesas fixas), motorista e viagem;
+      • posições ordenadas por data, globais e por veículo/motorista;
+      • mapa viagem → linhas de despesa (CSR).
+    Guarda só arrays; as tabelas são passadas em `filtrar` e precisam ser as mesmas da construção.
+    """
+
+    def __init__(self, dados: Dict[str, pd.DataFrame]):
+        viagens = dados["viagens"]
+        despesas_viagem = dados["despesas_viagem"]
+        despesas_fixas = dados["despesas_fixas"]
+        self.tamanhos = (len(viagens), len(despesas_viagem), len(despesas_fixas))
+
+        # opções e limites exibidos na sidebar
+        self.veiculos = pd.Index(
+            pd.concat([viagens["veiculo"], despesas_fixas["veiculo"]]).dropna().unique()
+        )
+        self.motoristas = pd.Index(viagens["motorista"].dropna().unique())
+        self.data_min = min(viagens["data_ida"].min(), despesas_fixas["data"].min())
+        self.data_max = max(viagens["data_volta"].max(), despesas_fixas["data"].max())
+
+        # viagens e despesas fixas por data / veículo / motorista
+        ida = _datas_ns(viagens["data_ida"])
+        data_fixa = _datas_ns(despesas_fixas["data"])
+        self._motorista_viagem = self.motoristas.get_indexer(viagens["motorista"]).astype(np.int32)
+        self._viagens_por_data = _GruposPorData(np.zeros(len(viagens)), ida)
+        self._viagens_por_veiculo = _GruposPorData(self.veiculos.get_indexer(viagens["veiculo"]), ida)
+        self._viagens_por_motorista = _GruposPorData(self._motorista_viagem, ida)
+        self._fixas_por_data = _GruposPorData(np.zeros(len(despesas_fixas)), data_fixa)
+        self._fixas_por_veiculo = _GruposPorData(self.veiculos.get_indexer(despesas_fixas["veiculo"]), data_fixa)
+
+        # viagem → despesas (ids repetidos compartilham o mesmo código): com as categorias
+        # unificadas na carga (domínio "viagem"), os códigos da categórica já são a chave
+        ids_viagem, ids_despesa = viagens["id"], despesas_viagem["viagem_id"]
+        if isinstance(ids_viagem.dtype, pd.CategoricalDtype) and ids_viagem.dtype == ids_despesa.dtype:
+            self._id_viagem = ids_viagem.cat.codes.to_numpy(np.int32)
+            codigos_despesa = ids_despesa.cat.codes.to_numpy(np.int32)
+        else:
+            self._id_viagem, ids = pd.factorize(ids_viagem)
+            self._id_viagem = self._id_viagem.astype(np.int32)
+            codigos_despesa = pd.Index(ids).get_indexer(ids_despesa)
+        self._despesas_por_viagem = _GruposPorData(
+            codigos_despesa, np.zeros(len(despesas_viagem), dtype=np.int64)
+        )
+
+    def compativel(self, dados: Dict[str, pd.DataFrame]) -> bool:
+        """Indica se `dados` tem o mesmo formato das tabelas usadas na construção."""
+        return self.tamanhos == (
+            len(dados["viagens"]), len(dados["despesas_viagem"]), len(dados["despesas_fixas"])
+        )
+
+    def corte_futuro(self, agora: pd.Timestamp) -> tuple:
+        """Quantas viagens e despesas fixas têm data <= `agora`; só muda quando `agora` passa por uma data da base."""
+        agora = pd.Timestamp(agora).value
+        return (
+            int(np.searchsorted(self._viagens_por_data._datas, agora, side="right")),
+            int(np.searchsorted(self._fixas_por_data._datas, agora, side="right")),
+        )
+
+    def assinatura(
+        self,
+        veiculos: Optional[Sequence[str]] = None,
+        motoristas: Optional[Sequence[str]] = None,
+        periodo: Optional[Sequence] = None,
+        incluir_futuras: bool = True,
+        agora: Optional[pd.Timestamp] = None,
+    ) -> tuple:
+        """
+        Chave normalizada de uma seleção de filtros: ordem da seleção não importa,
+        período incompleto = sem período, e o corte de datas futuras entra pelo `corte_futuro`.
+        """
+        if periodo is not None and len(periodo) == 2:
+            periodo = tuple(pd.to_datetime(d).isoformat() for d in periodo)
+        else:
+            periodo = None
+        corte = None if incluir_futuras else self.corte_futuro(pd.Timestamp.now() if agora is None else agora)
+        return (
+            tuple(sorted(set(veiculos or []))),
+            tuple(sorted(set(motoristas or []))),
+            periodo,
+            corte,
+        )
+
+    def despesas_das_viagens(self, posicoes_viagens: np.ndarray) -> np.ndarray:
+        """Posições (ordenadas) das despesas de viagem ligadas às viagens nas posições dadas."""
+        codigos = np.unique(self._id_viagem[posicoes_viagens])
+        return np.sort(self._despesas_por_viagem.posicoes(codigos[codigos >= 0], None, None))
+
+    def despesas_no_recorte(self, despesas_viagem: pd.DataFrame, rotulos_viagens: Iterable[int]) -> np.ndarray:
+        """
+        Posições, dentro do recorte `despesas_viagem` devolvido por `filtrar`, das despesas
+        das viagens com os rótulos dados (rótulo = posição na tabela completa).
+        Custo proporcional ao resultado, sem comparar ids.
+        """
+        globais = self.despesas_das_viagens(np.asarray(rotulos_viagens, dtype=np.int64))
+        rotulos = despesas_viagem.index.to_numpy()
+        if not len(rotulos):
+            return np.empty(0, dtype=np.int64)
+        posicoes = np.searchsorted(rotulos, globais).clip(max=len(rotulos) - 1)
+        return posicoes[rotulos[posicoes] == globais]
+
+    def filtrar(
+        self,
+        dados: Dict[str, pd.DataFrame],
+        veiculos: Optional[Sequence[str]] = None,
+        motoristas: Optional[Sequence[str]] = None,
+        periodo: Optional[Sequence] = None,
+        incluir_futuras: bool = True,
+        agora: Optional[pd.Timestamp] = None,
+    ) -> Dict[str, pd.DataFrame]:
+        """
+        Aplica os filtros integrados e devolve as três tabelas recortadas.
+        `periodo` = (início, fim) inclusivo; `incluir_futuras=False` corta datas após `agora` (padrão: now).
+        As tabelas devolvidas podem ser views/a própria tabela: não devem ser alteradas.
+        """
+        inicio = fim = None
+        if periodo is not None and len(periodo) == 2:
+            inicio, fim = (pd.to_datetime(d).value for d in periodo)
+        if not incluir_futuras:
+            agora = (pd.Timestamp.now() if agora is None else pd.Timestamp(agora)).value
+            fim = agora if fim is None else min(fim, agora)
+        if inicio is None and fim is not None:
+            inicio = _NAT_NS + 1  # datas nulas nunca entram em um intervalo
+
+        cod_veiculos = self.veiculos.get_indexer(pd.Index(veiculos or []))
+        cod_veiculos = np.unique(cod_veiculos[cod_veiculos >= 0]) if veiculos else None
+        cod_motoristas = self.motoristas.get_indexer(pd.Index(motoristas or []))
+        cod_motoristas = np.unique(cod_motoristas[cod_motoristas >= 0]) if motoristas else None
+
+        # 1. Viagens: parte do grupo mais seletivo e confere os demais pelos códigos
+        if cod_veiculos is not None:
+            pos_viagens = self._viagens_por_veiculo.posicoes(cod_veiculos, inicio, fim)
+            if cod_motoristas is not None:
+                pos_viagens = pos_viagens[np.isin(self._motorista_viagem[pos_viagens], cod_motoristas)]
+        elif cod_motoristas is not None:
+            pos_viagens = self._viagens_por_motorista.posicoes(cod_motoristas, inicio, fim)
+        else:
+            pos_viagens = self._viagens_por_data.posicoes([0], inicio, fim)
+        pos_viagens = np.sort(pos_viagens)
+
+        # 2. Despesas fixas (sem motorista)
+        if cod_veiculos is not None:
+            pos_fixas = self._fixas_por_veiculo.posicoes(cod_veiculos, inicio, fim)
+        else:
+            pos_fixas = self._fixas_por_data.posicoes([0], inicio, fim)
+
+        return {
+            "viagens": _recortar(dados["viagens"], pos_viagens),
+            "despesas_viagem": _recortar(dados["despesas_viagem"], self.despesas_das_viagens(pos_viagens)),
+            "despesas_fixas": _recortar(dados["despesas_fixas"], np.sort(pos_fixas)),
+        }
+
+
+class CacheLRU:
+    """
+    Cache LRU limitado de resultados por seleção de filtros. Cada entrada (chave)
+    guarda vários produtos nomeados (dados filtrados, anomalias, métricas...);
+    a entrada menos usada sai inteira quando o limite é ultrapassado.
+    Os valores são compartilhados entre execuções: não devem ser alterados.
+    """
+
+    def __init__(self, max_entradas: int = 16):
+        self.max_entradas = max_entradas
+        self.acertos = 0
+        self.falhas = 0
+        self._entradas: "OrderedDict[Hashable, Dict[str, Any]]" = OrderedDict()
+        self._trava = threading.Lock()
+
+    def obter(self, chave: Hashable, nome: str, calcular: Callable[[], Any]) -> Any:
+        """Devolve o produto `nome` da `chave`, calculando-o (e guardando) só na primeira vez."""
+        with self._trava:
+            entrada = self._entradas.get(chave)
+            if entrada is not None:
+                self._entradas.move_to_end(chave)
+                if nome in entrada:
+                    self.acertos += 1
+                    return entrada[nome]
+            self.falhas += 1
+
+        valor = calcular()
+
+        with self._trava:
+            self._entradas.setdefault(chave, {})[nome] = valor
+            self._entradas.move_to_end(chave)
+            while len(self._entradas) > self.max_entradas:
+                self._entradas.popitem(last=False)
+        return valor
+
+    def limpar(self) -> None:
+        with self._trava:
+            self._entradas.clear()
+
+    def estatisticas(self) -> Dict[str, int]:
+        """Acertos, falhas e entradas atuais do cache."""
+        return {"acertos": self.acertos, "falhas": self.falhas, "entradas": len(self._entradas)}
@@ -0,0 +1,142 @@
+"""
+Instrumentação leve por etapa (tempo e memória) do pipeline do dashboard.
+Ativada por `config.PERFIL_ATIVO` ou pela variável de ambiente `DASHBOARD_PERFIL=1`.
+Cada rerun é uma execução (`iniciar_execucao` … `finalizar_execucao`); as etapas medidas
+dentro dela vão para o painel da sidebar e, ao final, para `config.PERFIL_ARQUIVO_LOG` (JSONL).
+Fora de uma execução (scripts, benchmark), `etapa` e `medir` só chamam o código medido.
+"""
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+import config
+
+try:
+    import psutil  # opcional: RSS do processo em qualquer sistema
+    _PROCESSO = psutil.Process()
+except ImportError:
+    _PROCESSO = None
+
+_local = threading.local()
+_trava_log = threading.Lock()
+
+
+def ativo() -> bool:
+    """Indica se a instrumentação está ligada (config ou variável de ambiente)."""
+    return bool(config.PERFIL_ATIVO) or os.environ.get("DASHBOARD_PERFIL", "") in ("1", "true", "sim")
+
+
+def _memoria_mb() -> Optional[float]:
+    """RSS atual do processo em MB (None se não houver como medir)."""
+    if _PROCESSO is not None:
+        return _PROCESSO.memory_info().rss / 1024 ** 2
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 ** 2
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def iniciar_execucao(rotulo: str = "dashboard") -> None:
+    """Abre a execução da thread atual (um rerun do Streamlit); sem efeito se desativado."""
+    if not ativo():
+        _local.execucao = None
+        return
+    _local.execucao = {
+        "rotulo": rotulo,
+        "momento": datetime.now().isoformat(timespec="seconds"),
+        "inicio": time.perf_counter(),
+        "memoria_inicial_mb": _memoria_mb(),
+        "etapas": [],
+        "nivel": 0,
+    }
+
+
+@contextmanager
+def etapa(nome: str):
+    """Mede tempo (ms) e variação de RSS (MB) do bloco; etapas aninhadas guardam o nível."""
+    execucao = getattr(_local, "execucao", None)
+    if execucao is None:
+        yield
+        return
+    registro = {"etapa": nome, "nivel": execucao["nivel"]}
+    execucao["etapas"].append(registro)  # na ordem de início (pais antes dos filhos)
+    execucao["nivel"] += 1
+    memoria = _memoria_mb()
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        registro["inicio_ms"] = round((inicio - execucao["inicio"]) * 1000, 2)
+        registro["duracao_ms"] = round((time.perf_counter() - inicio) * 1000, 2)
+        fim = _memoria_mb()
+        registro["memoria_mb"] = round(fim - memoria, 2) if fim is not None and memoria is not None else None
+        execucao["nivel"] -= 1
+
+
+def medir(nome: Optional[str] = None) -> Callable:
+    """Decorador: mede cada chamada da função como a etapa `nome` (padrão: nome da função)."""
+    def decorar(funcao: Callable) -> Callable:
+        rotulo = nome or funcao.__name__
+
+        @functools.wraps(funcao)
+        def envoltorio(*args, **kwargs):
+            with etapa(rotulo):
+                return funcao(*args, **kwargs)
+        return envoltorio
+    return decorar
+
+
+def finalizar_execucao() -> Optional[Dict[str, Any]]:
+    """Fecha a execução da thread, grava uma linha no log JSONL e a devolve (None se inativa)."""
+    execucao = getattr(_local, "execucao", None)
+    _local.execucao = None
+    if execucao is None:
+        return None
+    memoria = _memoria_mb()
+    registro = {
+        "rotulo": execucao["rotulo"],
+        "momento": execucao["momento"],
+        "total_ms": round((time.perf_counter() - execucao["inicio"]) * 1000, 2),
+        "memoria_mb": round(memoria, 1) if memoria is not None else None,
+        "etapas": execucao["etapas"],
+    }
+    gravar_log(registro)
+    return registro
+
+
+def gravar_log(registro: Dict[str, Any], caminho: Optional[str] = None) -> None:
+    """Acrescenta `registro` como uma linha JSON ao log (falhas de escrita são ignoradas)."""
+    caminho = caminho or config.PERFIL_ARQUIVO_LOG
+    try:
+        pasta = os.path.dirname(caminho)
+        if pasta:
+            os.makedirs(pasta, exist_ok=True)
+        with _trava_log, open(caminho, "a", encoding="utf-8") as f:
+            f.write(json.dumps(registro, ensure_ascii=False, default=str) + "\n")
+    except (OSError, TypeError, ValueError):
+        pass
+
+
+def ler_log(caminho: Optional[str] = None, ultimas: int = 50) -> List[Dict[str, Any]]:
+    """Últimas `ultimas` execuções gravadas no log JSONL (linhas truncadas são ignoradas)."""
+    caminho = caminho or config.PERFIL_ARQUIVO_LOG
+    try:
+        with open(caminho, encoding="utf-8") as f:
+            linhas = f.readlines()[-ultimas:]
+    except OSError:
+        return []
+    execucoes = []
+    for linha in linhas:
+        if not linha.strip():
+            continue
+        try:
+            execucoes.append(json.loads(linha))
+        except json.JSONDecodeError:
+            continue  # append concorrente ou gravação interrompida no meio da linha
+    return execucoes
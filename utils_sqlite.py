@@ -0,0 +1,354 @@
+"""
+Armazenamento opcional em SQLite (`config.BACKEND_DADOS = "sqlite"`).
+
+As cinco tabelas brutas vão para um banco local (`config.SQLITE_ARQUIVO`) com índices
+em viagem_id, veiculo_id, data e data_ida; visões SQL reproduzem `cgd.enriquecer_dados`.
+`IndiceSQLite` tem a interface de `utils_filtro.IndiceFiltros` usada pelo dashboard
+(opções da sidebar, `assinatura`, `filtrar`, `despesas_no_recorte`), mas resolve os
+filtros em SQL e devolve só o recorte; `metricas_gerais` e `pl_mensal` calculam as
+somas dos KPIs no banco e só os agregados voltam para o Python.
+
+Os gráficos e tabelas das abas ainda recebem o recorte linha a linha (`filtrar`): só
+as linhas da seleção saem do banco, mas não apenas agregados.
+"""
+import os
+import sqlite3
+import threading
+from contextlib import closing
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+import config
+import captacao_e_geracao_dados as cgd
+import calculos_e_formulas as calculos
+
+# Incrementar sempre que tabelas, visões ou índices mudarem (força recarga completa)
+_VERSAO_BANCO = 1
+_FORMATO_DATA = "%Y-%m-%d %H:%M:%S"
+
+_INDICES = {
+    "viagem": [("id",), ("data_ida",), ("veiculo_id", "data_ida"), ("motorista_id", "data_ida")],
+    "despesas_viagem": [("viagem_id",), ("veiculo_id",), ("data",)],
+    "despesas_fixas": [("veiculo_id", "data"), ("data",)],
+    "motorista": [("id",), ("nome",)],
+    "veiculo": [("id",), ("placa",)],
+}
+
+# Visões (v_<nome>) equivalentes às tabelas de `cgd.enriquecer_dados` (mesma ordem de linhas e colunas);
+# {status_excluidos} vem de `config.STATUS_EXCLUIDOS` (ver `_visoes`)
+_VISOES = {
+    "viagens": """
+        SELECT v.*, m.nome AS motorista, ve.placa AS veiculo
+        FROM viagem v
+        LEFT JOIN motorista m ON m.id = v.motorista_id
+        LEFT JOIN veiculo ve ON ve.id = v.veiculo_id
+        WHERE v.status IS NULL OR v.status NOT IN ({status_excluidos})
+    """,
+    "despesas_viagem": """
+        SELECT d.*, v.motorista AS motorista, v.veiculo AS veiculo, v.data_ida AS data_viagem
+        FROM despesas_viagem d
+        JOIN v_viagens v ON v.id = d.viagem_id
+    """,
+    "despesas_fixas": """
+        SELECT f.*, ve.placa AS veiculo
+        FROM despesas_fixas f
+        LEFT JOIN veiculo ve ON ve.id = f.veiculo_id
+    """,
+}
+# tabela bruta cujo esquema tipa cada visão ao voltar para o pandas
+_ESQUEMA_VISOES = {"viagens": "viagem", "despesas_viagem": "despesas_viagem", "despesas_fixas": "despesas_fixas"}
+
+# tipos declarados pelo `to_sql` que o pandas não recupera sozinho (colunas vazias ou só nulos)
+_TIPOS_SQL = {"REAL": "float64", "INTEGER": "int64"}
+
+_FIM_DO_MES = "date({col}, 'start of month', '+1 month', '-1 day')"
+_RECEITA = "COALESCE(frete_ida, 0) + COALESCE(frete_volta, 0) + COALESCE(frete_extra, 0)"
+
+
+def _literal(texto: str) -> str:
+    """Texto como literal SQL (aspas simples duplicadas); visões não aceitam parâmetros."""
+    return "'" + str(texto).replace("'", "''") + "'"
+
+
+def _visoes() -> Dict[str, str]:
+    """SQL das visões com os status excluídos do `config` (os mesmos de `cgd._enriquecer_viagens`)."""
+    status = ", ".join(_literal(s) for s in config.STATUS_EXCLUIDOS)  # lista vazia: NOT IN () é sempre verdadeiro
+    return {nome: sql.replace("{status_excluidos}", status) for nome, sql in _VISOES.items()}
+
+
+def _texto_data(valor) -> Optional[str]:
+    return None if valor is None else pd.Timestamp(valor).strftime(_FORMATO_DATA)
+
+
+def _para_sql(df: pd.DataFrame, tabela: str) -> pd.DataFrame:
+    """Categorias viram texto e datas viram 'AAAA-MM-DD HH:MM:SS' (ordenável como texto)."""
+    df = df.reset_index(drop=True)
+    for col in df.columns:
+        if isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype(object)
+        if col in (cgd._colunas_data(tabela) or []):
+            df[col] = pd.to_datetime(df[col]).dt.strftime(_FORMATO_DATA)
+    return df
+
+
+class IndiceSQLite:
+    """
+    Banco SQLite das tabelas da frota com a interface de filtros de `IndiceFiltros`.
+    Cada thread usa sua própria conexão; `sincronizar` recarrega só as tabelas cujos
+    CSVs mudaram (mtime, tamanho), como os caches de `cgd.ler_tabela`.
+    Os recortes têm como rótulo a posição da linha na tabela bruta (coluna `_ordem`).
+    """
+
+    def __init__(self, caminho: Optional[str] = None):
+        self.caminho = caminho or config.SQLITE_ARQUIVO
+        self._local = threading.local()
+        self._trava = threading.Lock()
+        self.sincronizar()
+        self._carregar_tipos()
+        self._carregar_opcoes()
+
+    # ----------------------------
+    # Banco
+    # ----------------------------
+    def _conexao(self):
+        con = getattr(self._local, "conexao", None)
+        if con is None:
+            pasta = os.path.dirname(self.caminho)
+            if pasta:
+                os.makedirs(pasta, exist_ok=True)
+            con = self._local.conexao = sqlite3.connect(self.caminho)
+        return con
+
+    def _consultar(self, sql: str, params: Sequence = ()) -> List[tuple]:
+        with closing(self._conexao().cursor()) as cur:
+            return cur.execute(sql, list(params)).fetchall()
+
+    def _ler(self, visao: str, sql: str, params: Sequence = ()) -> pd.DataFrame:
+        """Linhas de uma visão tipadas como a tabela enriquecida correspondente."""
+        df = pd.read_sql_query(sql, self._conexao(), params=list(params), index_col="_ordem")
+        df.index.name = None
+        for col, tipo in self._tipos[visao].items():
+            if tipo == "float64" or not df[col].isna().any():
+                df[col] = df[col].astype(tipo)
+        cgd._tipar_colunas(df, _ESQUEMA_VISOES[visao])
+        for col, categorias in self._categorias[visao].items():
+            df[col] = df[col].astype(pd.CategoricalDtype(categorias))
+        if "data_viagem" in df.columns:
+            df["data_viagem"] = pd.to_datetime(df["data_viagem"])
+        return df
+
+    def sincronizar(self) -> Tuple[str, ...]:
+        """Carrega no banco as tabelas brutas novas ou alteradas; devolve os nomes recarregados."""
+        with self._trava:
+            con = self._conexao()
+            con.execute("CREATE TABLE IF NOT EXISTS _fontes (tabela TEXT PRIMARY KEY, assinatura TEXT)")
+            gravadas = dict(con.execute("SELECT tabela, assinatura FROM _fontes").fetchall())
+            recarregadas = []
+            for tabela, caminho in cgd._fontes_brutas().items():
+                assinatura = repr((_VERSAO_BANCO, cgd._assinatura_arquivo(caminho, tabela)))
+                if gravadas.get(tabela) == assinatura:
+                    continue
+                df = _para_sql(cgd.ler_tabela(caminho, tabela), tabela)
+                df.to_sql(tabela, con, if_exists="replace", index=True, index_label="_ordem")
+                for colunas in _INDICES[tabela]:
+                    con.execute(
+                        f"CREATE INDEX IF NOT EXISTS ix_{tabela}_{'_'.join(colunas)} ON {tabela} ({', '.join(colunas)})")
+                con.execute("INSERT OR REPLACE INTO _fontes VALUES (?, ?)", (tabela, assinatura))
+                recarregadas.append(tabela)
+            assinatura_visoes = repr((_VERSAO_BANCO, list(config.STATUS_EXCLUIDOS)))
+            if recarregadas or gravadas.get("_visoes") != assinatura_visoes:
+                for nome, sql in _visoes().items():  # na ordem: despesas_viagem depende de viagens
+                    con.execute(f"DROP VIEW IF EXISTS v_{nome}")
+                    con.execute(f"CREATE VIEW v_{nome} AS {sql}")
+                con.execute("INSERT OR REPLACE INTO _fontes VALUES ('_visoes', ?)", (assinatura_visoes,))
+            con.commit()
+            return tuple(recarregadas)
+
+    def _carregar_tipos(self) -> None:
+        """
+        Tipos numéricos declarados de cada visão e categorias completas das colunas
+        categóricas (valores da tabela bruta, unidos por domínio como em
+        `cgd._unificar_dominios`), para que um recorte tenha os dtypes da tabela inteira.
+        """
+        dominios = {}
+        for tabela in cgd._fontes_brutas():
+            for col, tipo in cgd._esquema(tabela).items():
+                if tipo.startswith("category:"):
+                    dominios.setdefault(tipo, []).append(f"SELECT {col} AS valor FROM {tabela}")
+
+        def categorias(tabela, col):
+            tipo = cgd._esquema(tabela)[col]
+            fontes = dominios.get(tipo, [f"SELECT {col} AS valor FROM {tabela}"])
+            return [v for (v,) in self._consultar(
+                f"SELECT DISTINCT valor FROM ({' UNION ALL '.join(fontes)}) WHERE valor IS NOT NULL ORDER BY valor")]
+
+        placas = categorias("veiculo", "placa")
+        self._tipos, self._categorias = {}, {}
+        for visao, tabela in _ESQUEMA_VISOES.items():
+            colunas = self._consultar(f"PRAGMA table_info(v_{visao})")
+            self._tipos[visao] = {c[1]: _TIPOS_SQL[c[2]] for c in colunas if c[2] in _TIPOS_SQL and c[1] != "_ordem"}
+            self._categorias[visao] = {
+                col: categorias(tabela, col)
+                for col, tipo in cgd._esquema(tabela).items() if tipo.startswith("category")
+            }
+            self._categorias[visao]["veiculo"] = placas
+
+    def _carregar_opcoes(self) -> None:
+        """Opções e limites da sidebar, na mesma ordem de `IndiceFiltros` (primeira aparição)."""
+        self.veiculos = pd.Index([p for (p,) in self._consultar("""
+            SELECT veiculo FROM (
+                SELECT veiculo, 0 AS tabela, _ordem FROM v_viagens
+                UNION ALL SELECT veiculo, 1, _ordem FROM v_despesas_fixas
+            ) WHERE veiculo IS NOT NULL GROUP BY veiculo ORDER BY MIN(tabela * 1000000000000 + _ordem)
+        """)])
+        self.motoristas = pd.Index([m for (m,) in self._consultar("""
+            SELECT motorista FROM v_viagens WHERE motorista IS NOT NULL
+            GROUP BY motorista ORDER BY MIN(_ordem)
+        """)])
+        (ida_min, volta_max), = self._consultar("SELECT MIN(data_ida), MAX(data_volta) FROM v_viagens")
+        (fixa_min, fixa_max), = self._consultar("SELECT MIN(data), MAX(data) FROM v_despesas_fixas")
+        datas = lambda *v: [pd.Timestamp(x) for x in v if x is not None]
+        self.data_min = min(datas(ida_min, fixa_min), default=pd.NaT)
+        self.data_max = max(datas(volta_max, fixa_max), default=pd.NaT)
+
+    # ----------------------------
+    # Filtros
+    # ----------------------------
+    def compativel(self, dados: Any) -> bool:
+        return True  # os recortes vêm do próprio banco
+
+    def corte_futuro(self, agora: pd.Timestamp) -> tuple:
+        """Quantas viagens e despesas fixas têm data <= `agora` (mesma chave de `IndiceFiltros`)."""
+        agora = _texto_data(agora)
+        (viagens,), = self._consultar("SELECT COUNT(*) FROM v_viagens WHERE data_ida <= ?", [agora])
+        (fixas,), = self._consultar("SELECT COUNT(*) FROM v_despesas_fixas WHERE data <= ?", [agora])
+        return viagens, fixas
+
+    def assinatura(self, veiculos=None, motoristas=None, periodo=None, incluir_futuras=True, agora=None) -> tuple:
+        """Chave normalizada da seleção, no formato de `IndiceFiltros.assinatura`."""
+        if periodo is not None and len(periodo) == 2:
+            periodo = tuple(pd.to_datetime(d).isoformat() for d in periodo)
+        else:
+            periodo = None
+        corte = None if incluir_futuras else self.corte_futuro(pd.Timestamp.now() if agora is None else agora)
+        return tuple(sorted(set(veiculos or []))), tuple(sorted(set(motoristas or []))), periodo, corte
+
+    @staticmethod
+    def _condicoes(veiculos, motoristas, periodo, incluir_futuras, agora, col_data, com_motorista=True):
+        """WHERE (e parâmetros) de viagens (`data_ida`) ou despesas fixas (`data`)."""
+        condicoes, params = [], []
+        if veiculos:
+            condicoes.append(f"veiculo_id IN (SELECT id FROM veiculo WHERE placa IN ({', '.join('?' * len(veiculos))}))")
+            params += list(veiculos)
+        if motoristas and com_motorista:
+            condicoes.append(f"motorista_id IN (SELECT id FROM motorista WHERE nome IN ({', '.join('?' * len(motoristas))}))")
+            params += list(motoristas)
+        inicio = fim = None
+        if periodo is not None and len(periodo) == 2:
+            inicio, fim = (pd.to_datetime(d) for d in periodo)
+        if not incluir_futuras:
+            agora = pd.Timestamp.now() if agora is None else pd.Timestamp(agora)
+            fim = agora if fim is None else min(fim, agora)
+        if inicio is not None:
+            condicoes.append(f"{col_data} >= ?")
+            params.append(_texto_data(inicio))
+        if fim is not None:
+            condicoes.append(f"{col_data} <= ?")  # datas nulas nunca entram em um intervalo
+            params.append(_texto_data(fim))
+        return " AND ".join(condicoes) or "1", params
+
+    def _recorte_sql(self, veiculos=None, motoristas=None, periodo=None, incluir_futuras=True, agora=None):
+        """CTEs `sel_viagens`, `sel_despesas_viagem` e `sel_despesas_fixas` do recorte, com parâmetros."""
+        filtros = (veiculos, motoristas, periodo, incluir_futuras, agora)
+        w_viagens, p_viagens = self._condicoes(*filtros, "data_ida")
+        w_fixas, p_fixas = self._condicoes(*filtros, "data", com_motorista=False)
+        cte = f"""
+            WITH sel_viagens AS (SELECT * FROM v_viagens WHERE {w_viagens}),
+                 sel_despesas_viagem AS (
+                     SELECT * FROM v_despesas_viagem WHERE viagem_id IN (SELECT id FROM sel_viagens)),
+                 sel_despesas_fixas AS (SELECT * FROM v_despesas_fixas WHERE {w_fixas})
+        """
+        return cte, p_viagens + p_fixas
+
+    def filtrar(self, dados: Any = None, **filtros) -> Dict[str, pd.DataFrame]:
+        """Mesmo resultado de `IndiceFiltros.filtrar`, lendo do banco só as linhas do recorte."""
+        cte, params = self._recorte_sql(**filtros)
+        return {
+            visao: self._ler(visao, f"{cte} SELECT * FROM sel_{visao} ORDER BY _ordem", params)
+            for visao in ("viagens", "despesas_viagem", "despesas_fixas")
+        }
+
+    def despesas_no_recorte(self, despesas_viagem: pd.DataFrame, rotulos_viagens: Iterable[int]) -> np.ndarray:
+        """Posições (em `despesas_viagem`) das despesas ligadas às viagens de rótulos dados."""
+        rotulos = [int(r) for r in rotulos_viagens]
+        if not rotulos:
+            return np.empty(0, dtype=np.int64)
+        ids = [i for (i,) in self._consultar(
+            f"SELECT id FROM viagem WHERE _ordem IN ({', '.join('?' * len(rotulos))})", rotulos)]
+        return np.flatnonzero(despesas_viagem["viagem_id"].astype(object).isin(ids).to_numpy())
+
+    # ----------------------------
+    # KPIs em SQL
+    # ----------------------------
+    def pl_mensal(self, **filtros) -> pd.DataFrame:
+        """`calcular_faturamento_por_mes` do recorte, somado por mês no banco."""
+        cte, params = self._recorte_sql(**filtros)
+        somas = []
+        for visao, col, valor in (("viagens", "data_ida", _RECEITA),
+                                  ("despesas_viagem", "data", "valor"),
+                                  ("despesas_fixas", "data", "valor")):
+            linhas = self._consultar(f"""{cte}
+                SELECT {_FIM_DO_MES.format(col=col)} AS mes, COALESCE(SUM({valor}), 0)
+                FROM sel_{visao} WHERE {col} IS NOT NULL GROUP BY mes ORDER BY mes""", params)
+            somas.append(pd.Series([v for _, v in linhas], index=pd.DatetimeIndex([m for m, _ in linhas], name="data"),
+                                   dtype=float))
+        return calculos.pl_mensal_de_somas(*somas)
+
+    def metricas_gerais(self, **filtros) -> Dict[str, Any]:
+        """Dicionário de `calcular_metricas_gerais` com as somas, médias e contagens feitas em SQL."""
+        cte, params = self._recorte_sql(**filtros)
+        (km, n_viagens, qtd_linhas, receita, despesas_registradas, litros, consumo,
+         gasto_empresa, gasto_motorista, troco), = self._consultar(f"""{cte}
+            SELECT COALESCE(SUM(km_total), 0), COUNT(DISTINCT id), COUNT(*), COALESCE(SUM({_RECEITA}), 0),
+                   COALESCE(SUM(total_despesas_viagem), 0), COALESCE(SUM(lts_combustivel), 0),
+                   AVG(CASE WHEN km_total > 0 AND lts_combustivel > 0 THEN km_total * 1.0 / lts_combustivel END),
+                   COALESCE(SUM(gasto_empresa), 0), COALESCE(SUM(gasto_motorista), 0),
+                   COALESCE(SUM(troco_da_viagem), 0)
+            FROM sel_viagens""", params)
+        # dias ociosos: ida da viagem - volta da anterior do mesmo veículo (calcular_idle_medio)
+        (idle,), = self._consultar(f"""{cte}
+            SELECT AVG(MAX(CAST(julianday(data_ida) - julianday(volta_anterior) AS INTEGER), 0)) FROM (
+                SELECT data_ida, LAG(data_volta) OVER (
+                    PARTITION BY veiculo ORDER BY data_ida IS NULL, data_ida, _ordem) AS volta_anterior
+                FROM sel_viagens WHERE veiculo IS NOT NULL)""", params)
+        (custo_variavel, preco_medio), = self._consultar(f"""{cte}
+            SELECT COALESCE(SUM(valor), 0), AVG(preco_combustivel) FROM sel_despesas_viagem""", params)
+        (custo_fixo,), = self._consultar(f"{cte} SELECT COALESCE(SUM(valor), 0) FROM sel_despesas_fixas", params)
+
+        categorias = {}
+        for visao, tipo in (("despesas_viagem", "viagem"), ("despesas_fixas", "fixa")):
+            linhas = self._consultar(f"""{cte}
+                SELECT categoria, COALESCE(SUM(valor), 0), COUNT(*) FROM sel_{visao} GROUP BY categoria""", params)
+            categorias[tipo] = calculos.somas_por_categoria(
+                [c for c, _, _ in linhas], [s for _, s, _ in linhas], [q for _, _, q in linhas], tipo)
+
+        agregados = {
+            "km_total":                 np.int64(km),
+            "total_viagens":            n_viagens,
+            "receita_bruta":            np.float64(receita),
+            "custo_variavel":           np.float64(custo_variavel),
+            "custo_fixo":               np.float64(custo_fixo),
+            "total_despesas_viagem":    np.float64(despesas_registradas),
+            "litros_combustivel":       np.float64(litros),
+            "consumo_medio_km_l":       np.float64(np.nan if consumo is None else consumo),
+            "receita_media_por_viagem": receita / n_viagens if n_viagens else 0,
+            "preco_medio_combustivel":  np.float64(np.nan if preco_medio is None else preco_medio),
+            "idle_medio":               0.0 if not qtd_linhas else round(np.nan if idle is None else idle, 1),
+            "gasto_empresa":            np.float64(gasto_empresa),
+            "gasto_motorista":          np.float64(gasto_motorista),
+            "troco":                    np.float64(troco),
+        }
+        return calculos.metricas_de_agregados(
+            agregados, categorias["viagem"], categorias["fixa"], self.pl_mensal(**filtros))
@@ -1,189 +1,138 @@
+import json
+import os
+import threading
+import numpy as np
 import pandas as pd
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional
 import config
+import utils_perfil as perfil
 
-def gerar_preview_linhas(df: pd.DataFrame, colunas: List[str], max_linhas: int) -> List[str]:
+# Incrementar sempre que algum predicado mudar (invalida o estado incremental gravado)
+_VERSAO_REGRAS = 1
+
+def gerar_preview_linhas(
+    df: pd.DataFrame,
+    colunas: List[str],
+    max_linhas: int,
+    posicoes: Optional[np.ndarray] = None,
+) -> List[str]:
     """
-    Gera até `max_linhas` de visualização de `df`, formatando apenas as colunas indicadas.
+    Gera até `max_linhas` de visualização de `df` (ou só das linhas nas `posicoes`),
+    formatando apenas as colunas indicadas. Lê coluna a coluna, sem montar uma Series por linha.
     Útil para incluir detalhes nos relatórios de anomalias.
     """
-    if df.empty:
+    posicoes = np.arange(len(df)) if posicoes is None else np.asarray(posicoes)
+    posicoes = posicoes[:max_linhas]
+    if len(posicoes) == 0:
         return []
-    previews: List[str] = []
-    for idx in range(min(len(df), max_linhas)):
-        linha = df.iloc[idx]
-        previews.append(" | ".join(str(linha[col]) for col in colunas))
-    return previews
+    valores = [df[col].iloc[posicoes].tolist() for col in colunas]
+    return [" | ".join(str(v) for v in linha) for linha in zip(*valores)]
 
 
-def validar_km_zero(viagens: pd.DataFrame, max_linhas: int) -> List[Dict[str, Any]]:
-    """
-    Identifica viagens com `km_total` menor ou igual a zero.
-    Retorna erro se existir registro inválido.
-    """
-    mask = viagens["km_total"] <= 0
-    if not mask.any():
-        return []
-    return [{
-        "msg": "Viagens com km_total ≤ 0",
-        "qtd": int(mask.sum()),
-        "nivel": "error",
-        "detalhes": gerar_preview_linhas(
-            viagens.loc[mask, ["identificador", "km_inicial", "km_final", "km_total"]],
-            ["identificador", "km_inicial", "km_final", "km_total"],
-            max_linhas
-        ),
-        "sugestao": "Verificar hodômetro ou digitação de km_total."
-    }]
-
-
-def validar_data_retorno_antes_partida(viagens: pd.DataFrame, max_linhas: int) -> List[Dict[str, Any]]:
-    """
-    Detecta registros onde `data_volta` é anterior a `data_ida`.
-    Indica provável inversão de dia/mês ou erro de lançamento.
-    """
-    mask = viagens["data_volta"] < viagens["data_ida"]
-    if not mask.any():
-        return []
-    return [{
-        "msg": "data_volta anterior a data_ida",
-        "qtd": int(mask.sum()),
-        "nivel": "error",
-        "detalhes": gerar_preview_linhas(
-            viagens.loc[mask, ["identificador", "data_ida", "data_volta"]],
-            ["identificador", "data_ida", "data_volta"],
-            max_linhas
-        ),
-        "sugestao": "Corrigir data de partida/retorno."
-    }]
-
-
-def validar_consumo_fora_limites(viagens: pd.DataFrame, max_linhas: int) -> List[Dict[str, Any]]:
-    """
-    Verifica se média km/L está fora dos limites realistas.
-    Emite warning para consumo muito baixo ou muito alto.
-    """
-    avisos: List[Dict[str, Any]] = []
-    excesso = viagens["media"] > config.CONSUMO_MAXIMO_KM_L
-    defasagem = viagens["media"] < config.CONSUMO_MINIMO_KM_L
-
-    if excesso.any():
-        avisos.append({
-            "msg": f"Média > {config.CONSUMO_MAXIMO_KM_L} km/L",
-            "qtd": int(excesso.sum()),
-            "nivel": "warning",
-            "detalhes": gerar_preview_linhas(
-                viagens.loc[excesso, ["identificador", "media"]],
-                ["identificador", "media"],
-                max_linhas
-            ),
-            "sugestao": "Revisar litros abastecidos ou km_total."
-        })
-    if defasagem.any():
-        avisos.append({
-            "msg": f"Média < {config.CONSUMO_MINIMO_KM_L} km/L",
-            "qtd": int(defasagem.sum()),
-            "nivel": "warning",
-            "detalhes": gerar_preview_linhas(
-                viagens.loc[defasagem, ["identificador", "media"]],
-                ["identificador", "media"],
-                max_linhas
-            ),
-            "sugestao": "Verificar possível erro de abastecimento ou leitura."
-        })
-    return avisos
+def _datas_invalidas(df: pd.DataFrame) -> pd.Series:
+    return pd.to_datetime(df["data"], errors="coerce").isna()
 
 
-def validar_km_sem_combustivel(viagens: pd.DataFrame, max_linhas: int) -> List[Dict[str, Any]]:
-    """
-    Detecta viagens com km_total positivo mas sem litros de combustível registrados.
+def regras_anomalias() -> List[Dict[str, Any]]:
     """
-    mask = (viagens["km_total"] > 0) & (viagens["lts_combustivel"].fillna(0) == 0)
-    if not mask.any():
-        return []
-    return [{
-        "msg": "Km rodado sem litros registrados",
-        "qtd": int(mask.sum()),
-        "nivel": "warning",
-        "detalhes": gerar_preview_linhas(
-            viagens.loc[mask, ["identificador", "km_total", "lts_combustivel"]],
-            ["identificador", "km_total", "lts_combustivel"],
-            max_linhas
-        ),
-        "sugestao": "Registrar abastecimentos correspondentes."
-    }]
-
-
-def validar_preco_diesel_fora_limites(despesas_viagem: pd.DataFrame, max_linhas: int) -> List[Dict[str, Any]]:
+    Regras de validação declaradas como dados, na ordem do relatório. Cada regra tem:
+      tabela    – chave em `data` ("viagens", "despesas_viagem", "despesas_fixas")
+      coluna    – coluna principal avaliada
+      predicado – função df → máscara booleana (True = linha com anomalia)
+      preview   – colunas exibidas nos exemplos (as ausentes na tabela são ignoradas)
+      msg, nivel, sugestao – campos do aviso
+    Montadas a cada chamada para refletir os limites atuais do `config`.
     """
-    Avalia se `preco_combustivel` está abaixo ou acima dos limites aceitáveis.
-    Gera alertas de info para possíveis valores incorretos.
-    """
-    avisos: List[Dict[str, Any]] = []
-    baixo = despesas_viagem["preco_combustivel"] < config.PRECO_DIESEL_MINIMO_R_L
-    alto = despesas_viagem["preco_combustivel"] > config.PRECO_DIESEL_MAXIMO_R_L
-
-    if baixo.any():
-        avisos.append({
-            "msg": f"Diesel < R${config.PRECO_DIESEL_MINIMO_R_L:.2f}",
-            "qtd": int(baixo.sum()),
-            "nivel": "info",
-            "detalhes": gerar_preview_linhas(
-                despesas_viagem.loc[baixo, ["descricao", "data", "preco_combustivel", "id"]],
-                ["descricao", "data", "preco_combustivel", "id"],
-                max_linhas
-            ),
-            "sugestao": "Confirmar se é ARLA ou outro produto."
+    regras: List[Dict[str, Any]] = [
+        {
+            "tabela": "viagens", "coluna": "km_total",
+            "predicado": lambda df: df["km_total"] <= 0,
+            "preview": ["identificador", "km_inicial", "km_final", "km_total"],
+            "msg": "Viagens com km_total ≤ 0", "nivel": "error",
+            "sugestao": "Verificar hodômetro ou digitação de km_total.",
+        },
+        {
+            "tabela": "viagens", "coluna": "data_volta",
+            "predicado": lambda df: df["data_volta"] < df["data_ida"],
+            "preview": ["identificador", "data_ida", "data_volta"],
+            "msg": "data_volta anterior a data_ida", "nivel": "error",
+            "sugestao": "Corrigir data de partida/retorno.",
+        },
+        {
+            "tabela": "viagens", "coluna": "media",
+            "predicado": lambda df: df["media"] > config.CONSUMO_MAXIMO_KM_L,
+            "preview": ["identificador", "media"],
+            "msg": f"Média > {config.CONSUMO_MAXIMO_KM_L} km/L", "nivel": "warning",
+            "sugestao": "Revisar litros abastecidos ou km_total.",
+        },
+        {
+            "tabela": "viagens", "coluna": "media",
+            "predicado": lambda df: df["media"] < config.CONSUMO_MINIMO_KM_L,
+            "preview": ["identificador", "media"],
+            "msg": f"Média < {config.CONSUMO_MINIMO_KM_L} km/L", "nivel": "warning",
+            "sugestao": "Verificar possível erro de abastecimento ou leitura.",
+        },
+        {
+            "tabela": "viagens", "coluna": "lts_combustivel",
+            "predicado": lambda df: (df["km_total"] > 0) & (df["lts_combustivel"].fillna(0) == 0),
+            "preview": ["identificador", "km_total", "lts_combustivel"],
+            "msg": "Km rodado sem litros registrados", "nivel": "warning",
+            "sugestao": "Registrar abastecimentos correspondentes.",
+        },
+        {
+            "tabela": "despesas_viagem", "coluna": "preco_combustivel",
+            "predicado": lambda df: df["preco_combustivel"] < config.PRECO_DIESEL_MINIMO_R_L,
+            "preview": ["descricao", "data", "preco_combustivel", "id"],
+            "msg": f"Diesel < R${config.PRECO_DIESEL_MINIMO_R_L:.2f}", "nivel": "info",
+            "sugestao": "Confirmar se é ARLA ou outro produto.",
+        },
+        {
+            "tabela": "despesas_viagem", "coluna": "preco_combustivel",
+            "predicado": lambda df: df["preco_combustivel"] > config.PRECO_DIESEL_MAXIMO_R_L,
+            "preview": ["descricao", "data", "preco_combustivel", "id"],
+            "msg": f"Diesel > R${config.PRECO_DIESEL_MAXIMO_R_L:.2f}", "nivel": "info",
+            "sugestao": "Verificar lançamento incorreto.",
+        },
+    ]
+    for nome in ["despesas_viagem", "despesas_fixas"]:
+        regras.append({
+            "tabela": nome, "coluna": "valor",
+            "predicado": lambda df: df["valor"] <= 0,
+            "preview": ["descricao", "data", "valor", "id"],
+            "msg": f"Valores ≤ 0 em {nome}", "nivel": "warning",
+            "sugestao": "Corrigir sinal ou remover duplicatas.",
         })
-    if alto.any():
-        avisos.append({
-            "msg": f"Diesel > R${config.PRECO_DIESEL_MAXIMO_R_L:.2f}",
-            "qtd": int(alto.sum()),
-            "nivel": "info",
-            "detalhes": gerar_preview_linhas(
-                despesas_viagem.loc[alto, ["descricao", "data", "preco_combustivel", "id"]],
-                ["descricao", "data", "preco_combustivel", "id"],
-                max_linhas
-            ),
-            "sugestao": "Verificar lançamento incorreto."
+    for nome in ["despesas_viagem", "despesas_fixas"]:
+        regras.append({
+            "tabela": nome, "coluna": "data",
+            "predicado": _datas_invalidas,
+            "preview": ["descricao", "categoria", "valor", "id"],
+            "msg": f"Registros sem data em {nome}", "nivel": "warning",
+            "sugestao": "Informar data válida para inclusão em gráficos.",
         })
-    return avisos
+    return regras
 
 
-def validar_valores_nao_positivos(df: pd.DataFrame, nome: str, max_linhas: int) -> List[Dict[str, Any]]:
-    """
-    Verifica registros em que o campo `valor` é menor ou igual a zero.
-    """
-    mask = df["valor"] <= 0
-    if not mask.any():
-        return []
-    cols = [c for c in ["descricao", "data", "valor", "id"] if c in df.columns]
-    return [{
-        "msg": f"Valores ≤ 0 em {nome}",
-        "qtd": int(mask.sum()),
-        "nivel": "warning",
-        "detalhes": gerar_preview_linhas(df.loc[mask, cols], cols, max_linhas),
-        "sugestao": "Corrigir sinal ou remover duplicatas."
-    }]
+def avaliar_regras(df: pd.DataFrame, regras: List[Dict[str, Any]]) -> List[np.ndarray]:
+    """Máscaras (arrays booleanos) de todas as `regras` de uma tabela, numa passada sobre o mesmo DataFrame."""
+    return [np.asarray(regra["predicado"](df), dtype=bool) for regra in regras]
 
 
-def validar_datas_faltantes(df: pd.DataFrame, nome: str, max_linhas: int) -> List[Dict[str, Any]]:
-    """
-    Detecta registros sem data válida (`NaN`) e que serão ignorados na análise histórica.
-    """
-    mask = pd.to_datetime(df["data"], errors="coerce").isna()
-    if not mask.any():
-        return []
-    cols = [c for c in ["descricao", "categoria", "valor", "id"] if c in df.columns]
-    return [{
-        "msg": f"Registros sem data em {nome}",
-        "qtd": int(mask.sum()),
-        "nivel": "warning",
-        "detalhes": gerar_preview_linhas(df.loc[mask, cols], cols, max_linhas),
-        "sugestao": "Informar data válida para inclusão em gráficos."
-    }]
+def montar_aviso(
+    regra: Dict[str, Any], df: pd.DataFrame, posicoes: np.ndarray, max_linhas: int
+) -> Dict[str, Any]:
+    """Aviso no formato de `checar_anomalias` a partir das posições (em `df`) que violam a regra."""
+    colunas = [c for c in regra["preview"] if c in df.columns]
+    return {
+        "msg": regra["msg"],
+        "qtd": int(len(posicoes)),
+        "nivel": regra["nivel"],
+        "detalhes": gerar_preview_linhas(df, colunas, max_linhas, posicoes),
+        "sugestao": regra["sugestao"],
+    }
 
 
+@perfil.medir()
 def checar_anomalias(data: Dict[str, pd.DataFrame], max_linhas: int = 5) -> List[Dict[str, Any]]:
     """
     Interface pública – NÃO MODIFICAR.
@@ -195,19 +144,136 @@ def checar_anomalias(data: Dict[str, pd.DataFrame], max_linhas: int = 5) -> List
       }
     Retorna lista de dicionários com mensagens, nível e sugestões.
     """
-    viagens_df = data["viagens"].copy()
-    despesas_viagem_df = data["despesas_viagem"].copy()
-    despesas_fixas_df = data["despesas_fixas"].copy()
-
-    avisos: List[Dict[str, Any]] = []
-    avisos.extend(validar_km_zero(viagens_df, max_linhas))
-    avisos.extend(validar_data_retorno_antes_partida(viagens_df, max_linhas))
-    avisos.extend(validar_consumo_fora_limites(viagens_df, max_linhas))
-    avisos.extend(validar_km_sem_combustivel(viagens_df, max_linhas))
-    avisos.extend(validar_preco_diesel_fora_limites(despesas_viagem_df, max_linhas))
-    avisos.extend(validar_valores_nao_positivos(despesas_viagem_df, "despesas_viagem", max_linhas))
-    avisos.extend(validar_valores_nao_positivos(despesas_fixas_df, "despesas_fixas", max_linhas))
-    avisos.extend(validar_datas_faltantes(despesas_viagem_df, "despesas_viagem", max_linhas))
-    avisos.extend(validar_datas_faltantes(despesas_fixas_df, "despesas_fixas", max_linhas))
-
-    return avisos
+    regras = regras_anomalias()
+
+    # 1. Uma passada por tabela: todas as máscaras das regras daquela tabela
+    posicoes: Dict[int, np.ndarray] = {}
+    for tabela in dict.fromkeys(r["tabela"] for r in regras):
+        indices = [i for i, r in enumerate(regras) if r["tabela"] == tabela]
+        mascaras = avaliar_regras(data[tabela], [regras[i] for i in indices])
+        for i, mascara in zip(indices, mascaras):
+            posicoes[i] = np.flatnonzero(mascara)
+
+    # 2. Avisos na ordem declarada, só para regras violadas
+    return [
+        montar_aviso(regra, data[regra["tabela"]], posicoes[i], max_linhas)
+        for i, regra in enumerate(regras)
+        if len(posicoes[i])
+    ]
+
+
+# chaves obrigatórias do estado gravado; faltando alguma, a validação é refeita
+_CHAVES_ESTADO = {"linhagem", "regras", "linhas", "posicoes"}
+
+
+class EstadoAnomalias:
+    """
+    Estado persistido da validação para dados que só crescem por append.
+    Guarda, por regra, as linhas (posição na tabela completa = rótulo do índice)
+    que a violam e quantas linhas de cada tabela já foram validadas; `atualizar`
+    avalia só as linhas novas e `relatorio` responde a um recorte filtrado
+    cruzando essas linhas com o índice do recorte, sem reavaliar predicados.
+
+    O estado vale para uma `linhagem` (ver captacao_e_geracao_dados.linhagem_dados):
+    linhagem, regras ou tabelas encolhidas diferentes → validação completa.
+    `atualizar` monta um estado novo e publica regras e estado juntos, sob a trava
+    também usada por `relatorio`: um leitor nunca vê regras novas com contadores antigos.
+    """
+
+    def __init__(self, caminho: Optional[str] = None):
+        self.caminho = caminho or os.path.join(config.CACHE_COLUNAR_DIR, "anomalias.json")
+        self._trava = threading.Lock()
+        self._regras = regras_anomalias()
+        self._estado = self._ler()
+
+    @staticmethod
+    def _assinatura(regras: List[Dict[str, Any]]) -> List[Any]:
+        return [_VERSAO_REGRAS] + [[r["tabela"], r["msg"]] for r in regras]
+
+    def _ler(self) -> Optional[Dict[str, Any]]:
+        """Estado gravado, ou None (reconstruído) se o arquivo faltar ou não tiver o formato esperado."""
+        try:
+            with open(self.caminho, encoding="utf-8") as f:
+                estado = json.load(f)
+            if not isinstance(estado, dict) or not _CHAVES_ESTADO <= estado.keys() or not isinstance(estado["linhas"], dict):
+                return None
+            estado["posicoes"] = [np.asarray(p, dtype=np.int64) for p in estado["posicoes"]]
+        except (OSError, ValueError, TypeError):
+            return None
+        return estado
+
+    def _gravar(self) -> None:
+        estado = dict(self._estado, posicoes=[p.tolist() for p in self._estado["posicoes"]])
+        try:
+            os.makedirs(os.path.dirname(self.caminho) or ".", exist_ok=True)
+            with open(f"{self.caminho}.tmp", "w", encoding="utf-8") as f:
+                json.dump(estado, f)
+            os.replace(f"{self.caminho}.tmp", self.caminho)
+        except OSError:
+            pass  # sem persistência o estado continua válido em memória
+
+    def atualizar(self, data: Dict[str, pd.DataFrame], linhagem: Any) -> "EstadoAnomalias":
+        """Valida as linhas ainda não vistas de `data` (tabelas completas, não filtradas)."""
+        with self._trava:
+            regras = regras_anomalias()
+            tabelas = list(dict.fromkeys(r["tabela"] for r in regras))
+            anterior = self._estado
+            continua = (
+                linhagem is not None
+                and anterior is not None
+                and anterior["linhagem"] == linhagem
+                and anterior["regras"] == self._assinatura(regras)
+                and len(anterior["posicoes"]) == len(regras)
+                and all(t in anterior["linhas"] and len(data[t]) >= anterior["linhas"][t] for t in tabelas)
+            )
+            if continua:
+                # cópia: o estado publicado não é alterado enquanto é lido
+                estado = dict(anterior, linhas=dict(anterior["linhas"]), posicoes=list(anterior["posicoes"]))
+            else:
+                estado = {
+                    "linhagem": linhagem,
+                    "regras": self._assinatura(regras),
+                    "linhas": {t: 0 for t in tabelas},
+                    "posicoes": [np.empty(0, dtype=np.int64) for _ in regras],
+                }
+            # rótulos do índice precisam ser as posições para o cruzamento com os recortes
+            estado["indexado"] = all(
+                data[t].index.equals(pd.RangeIndex(len(data[t]))) for t in tabelas
+            )
+
+            mudou = not continua
+            for tabela in tabelas:
+                inicio = estado["linhas"][tabela]
+                if inicio == len(data[tabela]):
+                    continue
+                indices = [i for i, r in enumerate(regras) if r["tabela"] == tabela]
+                mascaras = avaliar_regras(data[tabela].iloc[inicio:], [regras[i] for i in indices])
+                for i, mascara in zip(indices, mascaras):
+                    estado["posicoes"][i] = np.concatenate([estado["posicoes"][i], np.flatnonzero(mascara) + inicio])
+                estado["linhas"][tabela] = len(data[tabela])
+                mudou = True
+
+            self._regras, self._estado = regras, estado
+            if mudou and linhagem is not None:
+                self._gravar()
+        return self
+
+    def relatorio(self, data: Dict[str, pd.DataFrame], max_linhas: int = 5) -> List[Dict[str, Any]]:
+        """
+        Mesmo resultado de `checar_anomalias(data)` para um recorte (`data`) das
+        tabelas passadas em `atualizar`, cruzando o índice do recorte com as linhas guardadas.
+        """
+        with self._trava:
+            regras, estado = self._regras, self._estado
+        if estado is None or not estado.get("indexado"):
+            return checar_anomalias(data, max_linhas)
+
+        avisos: List[Dict[str, Any]] = []
+        for regra, violadas in zip(regras, estado["posicoes"]):
+            if len(violadas) == 0:
+                continue
+            df = data[regra["tabela"]]
+            posicoes = np.flatnonzero(np.isin(df.index.to_numpy(), violadas))
+            if len(posicoes):
+                avisos.append(montar_aviso(regra, df, posicoes, max_linhas))
+        return avisos